@@ -1,6 +1,7 @@
 # backend/app.py — TruthLens AI v4.6.4 Resilient Vision + STERN Prompt (Full Code)
 import asyncio
 import logging
+import math
 import os
 import json
 import io
@@ -9,27 +10,45 @@ import httpx
 import feedparser
 import requests
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import List, Literal, Optional, Union
 from enum import Enum
-from pydantic import BaseModel, Field, EmailStr, ValidationError, HttpUrl
+from pydantic import BaseModel, Field, EmailStr, ValidationError, HttpUrl, TypeAdapter
 import google.generativeai as genai
 from dotenv import load_dotenv
 from fastapi import (
-    Depends, FastAPI, HTTPException, Request, status,
-    File, UploadFile, Form
+    Depends, FastAPI, HTTPException, Request, Response, status,
+    File, UploadFile, Form, Query
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-import redis
 from PIL import Image
 from bs4 import BeautifulSoup
 
 # === Локальные модули ===
 from database import Database   
+from async_database import AsyncDB, create_async_database
+from write_behind import WriteBehindBuffer
+from partitions import PARTITION_MAINTENANCE_HOURS
+from passwords import LoginThrottle, PasswordHasher, PasswordPoolBusy
+from rate_limit import DAY_SECONDS, GUEST_PREFILTER_BURST, GUEST_PREFILTER_RATE, RateLimiter
+from redis_manager import RedisManager
 from search_api import WebSearcher
-from utils import detect_language, preprocess_text
+from utils import (
+    decode_history_cursor, detect_language, encode_history_cursor, preprocess_text, normalize_url,
+    trusted_client_ip
+)
+from caching import UserCache, VerdictCache, claim_fingerprint
+from singleflight import SingleFlight
+from search_cache import SearchCache
+from gemini_client import GeminiExecutor, GeminiError, GeminiResponseError
+from jobs import JOB_WORKERS, JobRunner, MemoryJobStore, RedisJobStore, public_view
+from tasks import analyze_task, analyze_url_task
+from prompts import PromptRegistry
+from batching import (
+    BATCH_MAX_ITEMS, BATCH_SEARCH_CONCURRENCY, dedupe, gather_bounded, pack_claims
+)
 from datetime import datetime
 
 # Токен 30 минутқа жарамды болады
@@ -47,7 +66,12 @@ ALGORITHM = "HS256"
 USER_DAILY_REQUEST_LIMIT = 30
 GUEST_REQUEST_LIMIT = 2
 GUEST_WINDOW_SECONDS = 60 * 60 * 24
-MAX_RETRIES_GEMINI = 3
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+# Клиент IP: X-Forwarded-For-тің соңғы N жазбасын сенімді прокси қосады.
+# Әдепкі 1 — Procfile бойынша Heroku роутерінің артында (nginx/Render де 1);
+# 0 — проксисіз: тақырыпқа сенбейміз, тек TCP байланысының мекенжайы (request.client.host)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 1))
 URL_DOWNLOAD_TIMEOUT = 10 # 10 секунд
 
 origins = [
@@ -71,10 +95,11 @@ app.add_middleware(
     allow_credentials=True,     # <--- Бұл True болса, allow_origins-те "*" болмауы керек
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # /history беттері
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-redis_pool: Optional[redis.ConnectionPool] = None
+# bcrypt event loop-тан тыс, шектеулі пулда (passwords.py)
+password_hasher = PasswordHasher()
 
 # === 3. Pydantic схемы ===
 class AnalysisRequest(BaseModel):
@@ -108,11 +133,48 @@ class GeminiFullAnalysisResponse(DetailedAnalysisResponse):
     verdict: Verdict
     confidence: float
 
+class CacheInfo(BaseModel):
+    hit: bool
+    tier: Optional[str] = None  # 'memory' | 'redis' | None (промах)
+    fingerprint: str
+
 class FullAnalysisResponse(DetailedAnalysisResponse):
     verdict: Verdict
     confidence: float
     original_statement: str
     analysis_id: Optional[int] = None
+    cache: Optional[CacheInfo] = None
+
+class GeminiBatchItem(GeminiFullAnalysisResponse):
+    id: int
+
+class BatchItemResult(BaseModel):
+    index: int
+    ok: bool
+    result: Optional[FullAnalysisResponse] = None
+    error: Optional[str] = None
+    status_code: int = 200
+
+class JobRequest(BaseModel):
+    kind: Literal["analyze", "analyze_url"]
+    text: str
+    url: Optional[HttpUrl] = None  # kind="analyze_url" үшін міндетті
+    callback_url: Optional[HttpUrl] = None  # нәтиже осы адреске POST-пен жіберіледі
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued | running | succeeded | failed
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[dict] = None
 
 class ImageAnalysisResponse(BaseModel):
     verdict: str
@@ -150,14 +212,25 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 # ОСЫ КОДТЫ backend/app.py ІШІНЕ ҚОСЫҢЫЗ
 # ==========================================
 
+async def check_login_throttle(request: Request) -> None:
+    """Бір IP-ден минутына LOGIN_ATTEMPTS_PER_MINUTE-тен артық кіру/тіркелу әрекеті болмауы керек."""
+    throttle: Optional[LoginThrottle] = getattr(request.app.state, 'login_throttle', None)
+    if throttle is None:
+        return
+    if not await throttle.allow(client_ip(request)):
+        raise HTTPException(status_code=429, detail="Слишком много попыток входа. Повторите через минуту.",
+                            headers={"Retry-After": str(throttle.window)})
+
+
 @app.post("/register", status_code=status.HTTP_201_CREATED, tags=["Authentication"])
 async def register_user(user: UserCreate, request: Request):
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
     if not db:
         raise HTTPException(status_code=503, detail="База данных недоступна")
+    await check_login_throttle(request)
 
-    # 1. Мұндай email бар-жоғын тексереміз ('await' ЖОҚ)
-    if db.get_user_by_email(user.email):
+    # 1. Мұндай email бар-жоғын тексереміз (async db, event loop бөгелмейді)
+    if await db.get_user_by_email(user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # 2. Пароль ұзындығын тексереміз
@@ -165,12 +238,16 @@ async def register_user(user: UserCreate, request: Request):
         raise HTTPException(status_code=400, detail="Пароль слишком длинный (макс. 72 байта).")
 
     # 3. Парольді хэштейміз (72 символға дейін қысқартып)
-    hashed_password = pwd_context.hash(user.password[:72])
+    try:
+        hashed_password = await password_hasher.hash(user.password[:72])
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервис авторизации перегружен, повторите позже.",
+                            headers={"Retry-After": "1"})
 
-    # 4. Пайдаланушыны жасаймыз ('await' ЖОҚ)
-    # create_user функциясы database.py ішінде болуы керек
+    # 4. Пайдаланушыны жасаймыз
+    # create_user функциясы async_database.py ішінде
     try:
-        db.create_user(user.email, hashed_password)
+        await db.create_user(user.email, hashed_password)
     except Exception as e:
         logger.error(f"Error creating user: {e}")
         raise HTTPException(status_code=500, detail="Error creating user")
@@ -185,16 +262,23 @@ async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
     # 1. Базаны аламыз
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
     if not db:
         raise HTTPException(status_code=503, detail="База данных недоступна")
+    await check_login_throttle(request)
 
     # 2. Қолданушыны email арқылы табамыз
     # (Бұрынғы db.authenticate_user орнына осыны қолданамыз)
-    user = db.get_user_by_email(form_data.username)
+    user = await db.get_user_by_email(form_data.username)
     
     # 3. Егер қолданушы табылмаса НЕМЕСЕ пароль қате болса -> Қате береміз
-    if not user or not pwd_context.verify(form_data.password, user["hashed_password"]):
+    # (bcrypt тексеруі пулда, event loop бос қалады)
+    try:
+        password_ok = bool(user) and await password_hasher.verify(form_data.password, user["hashed_password"])
+    except PasswordPoolBusy:
+        raise HTTPException(status_code=503, detail="Сервис авторизации перегружен, повторите позже.",
+                            headers={"Retry-After": "1"})
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -213,7 +297,6 @@ async def login_for_access_token(
 # === 4. Startup ===
 @app.on_event("startup")
 async def startup_event():
-    global redis_pool
     logger.info("🚀 1. БАСТАЛДЫ: Запуск приложения...")
     
     try:
@@ -221,6 +304,8 @@ async def startup_event():
         logger.info("⏳ 2. Database қосылуда...")
         app.state.db = Database()
         app.state.db.initialize()
+        # Эндпоинттер үшін асинхронды нұсқа (asyncpg пулы, болмаса thread pool)
+        app.state.adb = await create_async_database(app.state.db)
         logger.info("✅ 3. Database қосылды!")
 
         # 2. Searcher
@@ -247,6 +332,13 @@ async def startup_event():
         FALLBACK_MODEL = "gemini-pro-latest"
         fallback_conf = {"temperature": 0.45, "response_mime_type": "application/json"}
         app.state.gemini_fallback_model = genai.GenerativeModel(FALLBACK_MODEL, generation_config=fallback_conf)
+
+        # Барлық эндпоинттер Gemini-ге осы арқылы жүгінеді (семафор, retry, breaker, дедлайн)
+        app.state.gemini = GeminiExecutor(models={
+            "text": app.state.gemini_model,
+            "vision": app.state.gemini_vision_model,
+            "fallback": app.state.gemini_fallback_model,
+        })
         logger.info("✅ 7. Gemini дайын!")
 
         # 4. Secret Key
@@ -255,33 +347,62 @@ async def startup_event():
             raise ValueError("❌ SECRET_KEY не найден!")
         app.state.secret_key = SECRET_KEY
 
-        # 5. Redis
+        # 5. Redis: бір async клиент, денсаулығы фонда тексеріледі (сұрау сайын PING жоқ)
         logger.info("⏳ 8. Redis қосылуда...")
-        redis_url = os.getenv("REDIS_URL")
-        
-        if redis_url:
-            # Тырнақшаларды алып тастау үшін тазалау
-            redis_url = redis_url.replace('"', '').strip()
-            
-            # Timeout қосамыз (Егер 5 секунд жауап бермесе, күтпейміз)
-            redis_pool = redis.ConnectionPool.from_url(
-                redis_url, 
-                decode_responses=True,
-                socket_timeout=5.0,  # <--- МАҢЫЗДЫ: 5 секундтан артық күтпеу
-                socket_connect_timeout=5.0
-            )
-            
-            try:
-                # Тексеру (Ping)
-                r = redis.Redis(connection_pool=redis_pool)
-                r.ping()
-                logger.info("✅ 9. Redis сәтті қосылды!")
-            except Exception as re:
-                logger.error(f"⚠️ Redis қатесі (бірақ сервер қосыла береді): {re}")
-                redis_pool = None
+        redis_url = (os.getenv("REDIS_URL") or "").replace('"', '').strip() or None
+        app.state.redis = RedisManager(redis_url)
+        if await app.state.redis.start():
+            logger.info("✅ 9. Redis сәтті қосылды!")
+        elif app.state.redis.configured:
+            logger.error("⚠️ Redis қолжетімсіз (сервер қосыла береді, қайта қосылу фонда)")
+
+        # Клиент Redis өшірулі болса да беріледі (пул Redis қайта іске қосылғанда өзі қосылады),
+        # бірақ компоненттер оны тек redis_up() кезінде қолданады: әйтпесе әр сұрау таймаут күтеді
+        app.state.redis_async = app.state.redis.client
+        redis_up = app.state.redis.is_available
+
+        # 6. Verdict cache (LRU + Redis)
+        app.state.verdict_cache = VerdictCache(redis_client=app.state.redis_async, is_available=redis_up)
+        logger.info("✅ 10. Verdict cache дайын!")
+
+        # 6a. Пайдаланушы кэші (JWT сұраулары БД-сыз). Пайдаланушыны өзгертетін эндпоинт жоқ,
+        # сондықтан pub/sub тыңдаушы іске қосылмайды: ескіру USER_CACHE_TTL-мен шектеледі
+        app.state.user_cache = UserCache(redis_client=app.state.redis_async, is_available=redis_up)
+
+        # 6b. Кіру әрекеттерінің IP бойынша шектеуі
+        app.state.login_throttle = LoginThrottle(redis_client=app.state.redis_async, is_available=redis_up)
+
+        # 6c. Сұраулар лимиті: Redis-тегі Lua скрипті (PostgreSQL-ге жазбаймыз).
+        # Redis жоқ кезде — процесс ішіндегі token bucket; қонақтар IP бойынша алдын ала сүзіледі
+        app.state.rate_limiter = RateLimiter(app.state.redis_async, {
+            "user": (USER_DAILY_REQUEST_LIMIT, DAY_SECONDS),
+            "guest": (GUEST_REQUEST_LIMIT, GUEST_WINDOW_SECONDS),
+        }, is_available=redis_up,
+            prefilter={"guest": (GUEST_PREFILTER_RATE, GUEST_PREFILTER_BURST)})
+
+        # 7. Single-flight (Redis бар болса — worker-лер арасында да)
+        app.state.singleflight = SingleFlight(redis_client=app.state.redis_async, is_available=redis_up)
+
+        # 8. Промпт шаблондары (әр тіл үшін бір рет компиляцияланады)
+        get_prompt_registry()
+
+        # 9. Іздеу кэші (stale-while-revalidate)
+        app.state.searcher.cache = SearchCache(redis_client=app.state.redis_async, is_available=redis_up)
+
+        # 10. Фондық тапсырмалар (job API): Redis кезегі, болмаса — процесс ішінде
+        if app.state.redis.available:
+            job_store, job_workers = RedisJobStore(app.state.redis_async, is_available=redis_up), JOB_WORKERS
         else:
-            logger.warning("⚠️ REDIS_URL жоқ, Redis қосылмайды.")
-            redis_pool = None
+            job_store, job_workers = MemoryJobStore(), max(1, JOB_WORKERS)
+        app.state.jobs = JobRunner(job_store, build_job_handlers(app.state), workers=job_workers)
+        app.state.jobs.start()
+
+        # 11. Write-behind: анализдер, дауыстар пачкамен жазылады (Redis журналы арқылы)
+        app.state.writer = WriteBehindBuffer(app.state.adb, redis_client=app.state.redis_async, is_available=redis_up)
+        await app.state.writer.start()
+
+        # 12. Айлық секциялар: алдағы айлар құрылады, ескілері архивке (partitions.py)
+        app.state.partition_task = asyncio.ensure_future(run_partition_maintenance(app.state.db))
 
     except Exception as e:
         logger.error(f"❌ Startup ішінде КРИТИКАЛЫҚ ҚАТЕ: {e}", exc_info=True)
@@ -291,24 +412,54 @@ async def startup_event():
         raise e
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    partition_task: Optional[asyncio.Task] = getattr(app.state, "partition_task", None)
+    if partition_task is not None:
+        partition_task.cancel()
+    jobs: Optional[JobRunner] = getattr(app.state, "jobs", None)
+    if jobs is not None:
+        await jobs.stop()
+    # Тапсырмалардан кейін: олардың жазбалары да буферден өтуі керек
+    writer: Optional[WriteBehindBuffer] = getattr(app.state, "writer", None)
+    if writer is not None:
+        await writer.stop()
+    password_hasher.shutdown()
+    searcher: Optional[WebSearcher] = getattr(app.state, "searcher", None)
+    if searcher is not None:
+        await searcher.aclose()
+    redis_manager: Optional[RedisManager] = getattr(app.state, "redis", None)
+    if redis_manager is not None:
+        await redis_manager.close()
+    adb: Optional[AsyncDB] = getattr(app.state, "adb", None)
+    if adb is not None:
+        await adb.close()
+    db: Optional[Database] = getattr(app.state, "db", None)
+    if db is not None:
+        db.pool.close()
+
+
 # === 5. Helpers ===
-def get_redis() -> Optional[redis.Redis]:
-    if redis_pool:
+async def run_partition_maintenance(db: Database) -> None:
+    """Бірден, кейін әр PARTITION_MAINTENANCE_HOURS сағат сайын (бір уақытта бір процесс қана)."""
+    while True:
         try:
-            r = redis.Redis(connection_pool=redis_pool)
-            r.ping()
-            return r
-        except redis.exceptions.ConnectionError as e:
-            logger.error(f"Redis connection error: {e}")
-            return None
-    return None
+            await asyncio.to_thread(db.maintain_partitions)
+        except Exception as e:
+            logger.error(f"❌ Секцияларды күту қатесі: {e}", exc_info=True)
+        await asyncio.sleep(PARTITION_MAINTENANCE_HOURS * 3600)
+
+
+def get_db_writer(state) -> Union[AsyncDB, WriteBehindBuffer]:
+    """save_analysis/save_vote үшін: write-behind буфері, болмаса тікелей async db."""
+    return getattr(state, "writer", None) or state.adb
 
 
 async def get_optional_current_user(request: Request, token: Optional[str] = Depends(oauth2_scheme)) -> Optional[dict]:
     if token is None:
         return None
     secret = getattr(request.app.state, 'secret_key', None)
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
     if not secret or not db:
         raise HTTPException(status_code=503, detail="Auth сервис недоступен")
     try:
@@ -318,35 +469,51 @@ async def get_optional_current_user(request: Request, token: Optional[str] = Dep
             raise HTTPException(status_code=401, detail="Недопустимый токен")
     except JWTError:
         raise HTTPException(status_code=401, detail="Недопустимый токен")
-    user = db.get_user_by_email(email=email)
+
+    # Токенде id бар: кэште болса, БД-ға бармаймыз
+    user_cache: Optional[UserCache] = getattr(request.app.state, 'user_cache', None)
+    token_user_id = payload.get("id")
+    if user_cache and token_user_id is not None:
+        cached_user = user_cache.get(token_user_id, email)
+        if cached_user:
+            return cached_user
+
+    user = await db.get_user_by_email(email=email)
     if not user:
         raise HTTPException(status_code=401, detail="Пользователь не найден")
+    if user_cache:
+        return user_cache.set(user)
     return user
 
 
+def client_ip(request: Request) -> str:
+    # Клиент жіберген X-Forwarded-For/X-Real-IP-ге сенбейміз: лимиттерді айналып өтуге болады
+    peer = request.client.host if request.client else None
+    return trusted_client_ip(request.headers.get("X-Forwarded-For"), peer, TRUSTED_PROXY_HOPS)
+
+
+async def enforce_limit(request: Request, policy: str, identity, detail: str, cost: int = 1) -> None:
+    """Лимитті бір Redis шақыруымен тексеріп, шегереді; асып кетсе — 429 + Retry-After."""
+    limiter: Optional[RateLimiter] = getattr(request.app.state, 'rate_limiter', None)
+    if limiter is None:
+        return
+    allowed, _, retry_after = await limiter.hit(policy, identity, cost=cost)
+    if not allowed:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+async def enforce_user_limit(request: Request, user_id: int, cost: int = 1) -> None:
+    await enforce_limit(request, "user", user_id, "Дневной лимит запросов исчерпан.", cost=cost)
+
+
 async def rate_limit_guest(
     request: Request,
-    redis_client: Optional[redis.Redis] = Depends(get_redis),
     current_user: Optional[dict] = Depends(get_optional_current_user)
 ):
     if current_user is not None:
         return
-    if not redis_client:
-        return
-    
-    # ✅ (v4.6.2) Правильное получение IP
-    ip = request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP") or request.client.host
-    
-    key = f"rate_limit_guest:{ip}"
-    try:
-        pipe = redis_client.pipeline()
-        pipe.incr(key)
-        pipe.expire(key, GUEST_WINDOW_SECONDS, nx=True)
-        count, _ = pipe.execute()
-        if count > GUEST_REQUEST_LIMIT:
-            raise HTTPException(status_code=429, detail="Лимит гостей исчерпан")
-    except Exception as e:
-        logger.error(f"Ошибка Redis rate limit: {e}")
+    await enforce_limit(request, "guest", client_ip(request), "Лимит гостей исчерпан")
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -363,56 +530,14 @@ async def get_current_user(current_user: Optional[dict] = Depends(get_optional_c
     if current_user is None:
         raise HTTPException(status_code=401, detail="Требуется вход")
     return current_user
-# === ИСПРАВЛЕННАЯ ВЕРСИЯ ПРОМПТА ===
-def get_vision_analysis_prompt(language_code: str, text_prompt: str) -> str:
-    """Генерирует УСИЛЕННЫЙ промпт v4.6.5 для анализа изображений."""
-    lang_map = {"kk": "Kazakh", "ru": "Russian", "en": "English"}
-    output_language_name = lang_map.get(language_code, "Russian")
-    schema_json = json.dumps(GeminiVisionAnalysisInternal.model_json_schema(), indent=2, ensure_ascii=False)
-
-    prompt = f"""
-Ты — **очень** строгий криминалист по цифровым изображениям. Твоя главная задача — найти **любые** признаки подделки. Не доверяй изображению по умолчанию.
-
-УТВЕРЖДЕНИЕ: "{text_prompt}"
-ИЗОБРАЖЕНИЕ: [прикреплено]
-ЯЗЫК ОТВЕТА: {output_language_name}
-
-ИНСТРУКЦИИ (Следуй **строго** по шагам):
-Ты ДОЛЖЕН заполнить ВСЕ поля JSON-схемы. НЕ выноси вердикт, пока не заполнишь 'ai_artifact_check' и 'context_check'.
-
-1.  **ai_artifact_check (КРИТИЧЕСКИЙ ШАГ - Ищи подделку!)**:
-    * **Ищи ИИ-артефакты:** 6 пальцев, странные тени, нечитаемые надписи, асимметрия, нелогичные объекты, повторяющиеся узоры, "пластиковые" лица/кожа. **Любое** подозрение — фиксируй.
-    * **Ищи МАНИПУЛЯЦИИ (Photoshop/Вставка):**
-        * **Освещение:** Совпадает ли свет на *всех* объектах и фоне?
-        * **Разрешение/Шум/Фокус:** Все ли части изображения одинаково четкие/размытые/шумные? Нет ли резких перепадов?
-        * **Края объектов:** Есть ли неестественно резкие, "вырезанные" или наоборот, "грязные", размытые края? Особенно вокруг людей, предметов.
-        * **Перспектива/Масштаб:** Соответствуют ли размеры и углы объектов друг другу и фону?
-        * **Отражения/Тени:** Правильно ли расположены тени и отражения? Соответствуют ли они источникам света?
-        * **Нелогичность:** Есть ли что-то странное в самой сцене? (Например, Байтерек за окном автобуса).
-    * **ЗАПИШИ СЮДА свой подробный вывод** (на {output_language_name}). Если нашел **хотя бы один** подозрительный признак, опиши его четко. Если *абсолютно* ничего нет, напиши "Признаков ИИ-генерации или манипуляций не обнаружено." **Будь скептиком!**
-
-2.  **context_check (Второстепенный шаг)**:
-    * **Только после** Шага 1, если изображение кажется подлинным, выполни "обратный поиск по картинке" в своих знаниях.
-    * Где и когда это фото появлялось *впервые*? Соответствует ли контекст утверждению? Это старое фото, выдаваемое за новое?
-    * **ЗАПИШИ СЮДА свой вывод** (на {output_language_name}). Если ничего нет, напиши "Контекст изображения не найден."
-
-3.  **verdict (ВЕРДИКТ - Артефакты важнее контекста!)**:
-    * **ПРАВИЛО 1 (ВАЖНЕЙШЕЕ):** Если в 'ai_artifact_check' найден **хотя бы один** признак ИИ или манипуляции, вердикт **ОБЯЗАТЕЛЬНО** должен быть "Фейк (ИИ-генерация)" или "Фейк (Манипуляция)", **даже если контекст кажется правильным**.
-    * **ПРАВИЛО 2:** НЕ ПЫТАЙСЯ оправдать ИИ-фейк или манипуляцию, придумывая им реальный контекст. Артефакты главнее.
-    * **ПРАВИЛО 3:** Вердикт "Подлинное" ставь **только** если 'ai_artifact_check' **абсолютно чист** И 'context_check' подтверждает контекст утверждения.
-    * Во всех остальных сомнительных случаях (например, артефактов нет, но контекст не найден или противоречив) — ставь "Спорное".
-    * Вынеси вердикт (на {output_language_name}).
-
-4.  **explanation (Объяснение)**:
-    * Кратко (2-3 предложения на {output_language_name}) объясни свой вердикт, **обязательно ссылаясь** на конкретные находки из 'ai_artifact_check' и 'context_check'. Объясни, **почему** ты считаешь это фейком/подлинным/спорным.
-
-5.  **confidence (Уверенность)**:
-    * Оцени свою **общую уверенность** в вердикте от 0.0 до 1.0. Будь честен: если есть сомнения, уверенность не должна быть 1.0.
-
-Твой ответ ДОЛЖЕН быть в строгом JSON-формате ({schema_json}) на {output_language_name} языке. Не добавляй никакого текста до или после JSON.
-Do NOT return the JSON schema or 'properties' key. Return ONLY the raw JSON data matching the structure.
-"""
-    return prompt
+# === Промпттар: шаблондар стартта бір рет компиляцияланады (prompts.py) ===
+prompt_registry: Optional[PromptRegistry] = None
+
+def get_prompt_registry() -> PromptRegistry:
+    global prompt_registry
+    if prompt_registry is None:
+        prompt_registry = PromptRegistry(schemas={"vision": GeminiVisionAnalysisInternal})
+    return prompt_registry
 
 
 # === 7. /analyze_image (v4.6 с fallback, confidence и retry) ===
@@ -425,16 +550,11 @@ async def analyze_image(
     current_user: Optional[dict] = Depends(get_optional_current_user),
     _guest_limit_check: None = Depends(rate_limit_guest)
 ):
-    # 1. Модельдерді алу (Егер vision_model бөлек жоқ болса, негізгі gemini_model-ді аламыз)
-    primary_vision_model = getattr(request.app.state, "gemini_vision_model", None)
-    if not primary_vision_model:
-        primary_vision_model = getattr(request.app.state, "gemini_model", None) # Fallback to main model
-
-    fallback_vision_model = getattr(request.app.state, "gemini_fallback_model", None)
-    db: Optional[Database] = getattr(request.app.state, "db", None)
+    # 1. Gemini executor (vision -> fallback модельдері ішінде)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, "gemini", None)
+    db: Optional[AsyncDB] = getattr(request.app.state, "adb", None)
     
-    # Тек primary (негізгі) модель болса да жетеді
-    if not db or not primary_vision_model:
+    if not db or not gemini or not gemini.has("vision"):
         raise HTTPException(503, "Vision сервис недоступен")
 
     user_id_for_db = None
@@ -444,7 +564,7 @@ async def analyze_image(
         user_id_for_db = user_id
         logger.info(f"Анализ (Image Upload) для: {current_user.get('email')}")
     else:
-        ip_guest = request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP") or request.client.host
+        ip_guest = client_ip(request)
         logger.info(f"Анализ (Image Upload) для гостя: {ip_guest or 'unknown'}")
 
     try:
@@ -460,73 +580,22 @@ async def analyze_image(
         
     language_code = detect_language(text)
     
-    # ✅ ТҮЗЕТУ: Уақыт контекстін қосамыз (2026 жыл)
-    current_date_str = datetime.now().strftime("%Y-%m-%d (%A)")
-    base_prompt = get_vision_analysis_prompt(language_code, text)
-    
-    # Промптты күшейтеміз:
-    prompt = f"""
-    [SYSTEM NOTE: IMPORTANT CONTEXT]
-    Today's Date: {current_date_str}. 
-    Current Year: 2026.
-    Treat "2026" as the current year for any visual analysis (calendars, dates on screens, etc.).
-    --------------------------------------------------
-    {base_prompt}
-    """
-        
-    analysis_data: Optional[GeminiVisionAnalysisInternal] = None
-    last_exception: Optional[Exception] = None
-    model_used_name = primary_vision_model.model_name if hasattr(primary_vision_model, 'model_name') else 'Gemini'
-
-    try: # Блок Primary -> Fallback
-        logger.info(f"Попытка 1 (Image Upload): Вызов {model_used_name}...");
-        for attempt in range(MAX_RETRIES_GEMINI): # Цикл перезапроса
-            try: 
-                logger.info(f"...попытка {attempt + 1}"); 
-                response = await primary_vision_model.generate_content_async([prompt, image_part], generation_config={"response_mime_type": "application/json"})
-                
-                try:
-                    analysis_data = GeminiVisionAnalysisInternal.model_validate_json(response.text)
-                    logger.info(f"...Успех парсинга JSON. V: {analysis_data.verdict}, C: {analysis_data.confidence:.2f}"); 
-                    break 
-                except (ValidationError, json.JSONDecodeError) as p_err:
-                    last_exception = p_err
-                    logger.error(f"...НЕ УДАЛОСЬ (Парсинг JSON): {p_err}\nRaw response: {response.text}", exc_info=False)
-                    if attempt == MAX_RETRIES_GEMINI - 1: raise p_err
-                    await asyncio.sleep(1)
-                    continue
-
-            except Exception as api_err: 
-                last_exception = api_err
-                logger.error(f"...НЕ УДАЛОСЬ (API): {api_err}", exc_info=(attempt == MAX_RETRIES_GEMINI-1))
-                if attempt == MAX_RETRIES_GEMINI - 1: raise api_err
-                await asyncio.sleep(1)
-        
-        if analysis_data is None: raise last_exception if last_exception else RuntimeError(f"Primary model {model_used_name} failed after {MAX_RETRIES_GEMINI} attempts")
-    
-    except Exception as primary_error: # Если Primary модель совсем провалилась
-        logger.error(f"Основная модель (Image Upload) {model_used_name} ПРОВАЛИЛАСЬ: {primary_error}. Эскалация!");
-        
-        # Егер Fallback модель жоқ болса, қате береміз
-        if not fallback_vision_model: 
-            # Fallback жоқ болса да, Primary қатесін клиентке түсінікті етіп береміз
-            raise HTTPException(500, "Ошибка обработки изображения AI.")
+    # Vision промпты (2026 жыл контекстімен)
+    prompt = get_prompt_registry().render("vision_analysis", language_code, text=text)
         
-        model_used_name = fallback_vision_model.model_name
-        try: 
-            logger.info(f"Попытка 2 (Image Upload): Вызов Fallback {model_used_name}..."); 
-            response = await fallback_vision_model.generate_content_async([prompt, image_part], generation_config={"response_mime_type": "application/json"})
-            
-            try:
-                analysis_data = GeminiVisionAnalysisInternal.model_validate_json(response.text)
-                logger.info(f"...Fallback Успех парсинга JSON. V: {analysis_data.verdict}, C: {analysis_data.confidence:.2f}"); 
-            except (ValidationError, json.JSONDecodeError) as p_err_fb:
-                 logger.critical(f"Fallback (Image Upload) НЕ СМОГ распарсить JSON! Err: {p_err_fb}\nRaw response: {response.text}", exc_info=True)
-                 raise HTTPException(500, "Ошибка AI (Fallback JSON)")
-
-        except Exception as fallback_error: 
-            logger.critical(f"Обе модели (Image Upload) провалились! Err1: {primary_error}, Err2: {fallback_error}", exc_info=True); 
-            raise HTTPException(500, "Ошибка AI (Обе модели)")
+    try:
+        analysis_data, model_used_name = await gemini.generate(
+            "vision", [prompt, image_part],
+            response_model=GeminiVisionAnalysisInternal,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        logger.info(f"...Успех парсинга JSON. V: {analysis_data.verdict}, C: {analysis_data.confidence:.2f}")
+    except GeminiResponseError as p_err:
+        logger.critical(f"Gemini (Image Upload) НЕ СМОГ вернуть валидный JSON! Err: {p_err}")
+        raise HTTPException(500, "Ошибка AI (JSON)")
+    except GeminiError as g_err:
+        logger.critical(f"Обе модели (Image Upload) провалились! Err: {g_err}")
+        raise HTTPException(503, "Ошибка AI (Обе модели)")
 
     if analysis_data:
         logger.info(f"Финальный ответ (Image Upload) через: {model_used_name}")
@@ -538,7 +607,7 @@ async def analyze_image(
             "analysis_type": "image_upload"
         }
         if user_id_for_db:
-             db.save_analysis(
+             await get_db_writer(request.app.state).save_analysis(
                 user_id=user_id_for_db, text=f"Image Upload | Claim: {text}", 
                 verdict=analysis_data.verdict, confidence=analysis_data.confidence, 
                 full_response=response_to_save
@@ -565,17 +634,11 @@ async def analyze_url(
     - Если URL ведет на HTML -> извлекает текст и использует Text модель.
     """
     # 1. Тек қажетті компоненттерді аламыз (Detector керек емес)
-    primary_vision_model = getattr(request.app.state, "gemini_vision_model", None)
-    # Егер бөлек vision моделі жоқ болса, негізгісін қолданамыз
-    if not primary_vision_model:
-        primary_vision_model = getattr(request.app.state, "gemini_model", None)
-
-    fallback_vision_model = getattr(request.app.state, "gemini_fallback_model", None)
-    text_model = getattr(request.app.state, "gemini_model", None)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, "gemini", None)
     searcher = getattr(request.app.state, "searcher", None)      
-    db: Optional[Database] = getattr(request.app.state, "db", None)
+    db: Optional[AsyncDB] = getattr(request.app.state, "adb", None)
 
-    if not db or not text_model:
+    if not db or not gemini or not gemini.has("text"):
         raise HTTPException(503, "Сервис анализа временно недоступен")
 
     user_id_for_db = None
@@ -583,33 +646,62 @@ async def analyze_url(
         user_id = current_user.get('id')
         if not user_id: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Ошибка ID пользователя.")
         # Лимитті тексеру
-        try:
-             if not db.check_and_update_rate_limit(user_id=user_id, limit=USER_DAILY_REQUEST_LIMIT):
-                  raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Дневной лимит запросов исчерпан.")
-        except:
-             pass 
+        await enforce_user_limit(request, user_id)
         user_id_for_db = user_id
         logger.info(f"Анализ (URL) для: {current_user.get('email')}")
     else:
-        ip_guest = request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP") or request.client.host
+        ip_guest = client_ip(request)
         logger.info(f"Анализ (URL) для гостя: {ip_guest or 'unknown'}")
 
+    # 2. Талдау (бірдей URL + утверждение үшін бір ғана шақыру)
+    response_data = await analyze_url_coalesced(request.app.state, str(body.url), body.text)
+
+    # 4. Базаға сақтау (Ортақ логика)
+    if user_id_for_db:
+        try:
+            await get_db_writer(request.app.state).save_analysis(
+                user_id=user_id_for_db, 
+                text=f"URL: {body.url} | {body.text}", 
+                verdict=response_data['verdict'], # Enum value емес, string болуы мүмкін, тексеру керек
+                confidence=response_data['confidence'], 
+                full_response=response_data
+            )
+        except Exception as db_e:
+            logger.error(f"DB Save Error: {db_e}")
+            # База қатесі анализді тоқтатпауы керек
+
+    return FullAnalysisResponse(**response_data)
+
+
+async def analyze_url_coalesced(state, url_str: str, text: str) -> dict:
+    """run_url_analysis, бірдей URL + утверждение үшін single-flight арқылы."""
+    flight_key = f"analyze_url:{normalize_url(url_str)}:{claim_fingerprint(preprocess_text(text), 'url')}"
+    singleflight: Optional[SingleFlight] = getattr(state, "singleflight", None)
+    if not singleflight:
+        return await run_url_analysis(state.gemini, url_str, text)
+    response_data, shared = await singleflight.do(flight_key, lambda: run_url_analysis(state.gemini, url_str, text))
+    if shared:
+        logger.info(f"🔗 /analyze_url нәтижесі ортақ шақырудан алынды: {url_str}")
+    return response_data
+
+
+async def run_url_analysis(gemini: GeminiExecutor, url: str, text: str) -> dict:
+    """
+    URL контентін жүктеп, Vision немесе Text моделімен талдайды.
+    Пайдаланушыға тәуелсіз нәтижені JSON-сериализацияланатын dict түрінде қайтарады.
+    """
     # 2. Контентті жүктеу
     try:
         async with httpx.AsyncClient(follow_redirects=True, timeout=URL_DOWNLOAD_TIMEOUT) as client:
-            logger.info(f"Скачивание контента с URL: {body.url}")
-            url_str = str(body.url)
-            response = await client.get(url_str)
+            logger.info(f"Скачивание контента с URL: {url}")
+            response = await client.get(url)
             response.raise_for_status()
             content_type = response.headers.get("content-type", "").lower()
             content = await response.aread()
     except Exception as e:
-        logger.error(f"Ошибка скачивания URL: {body.url} - {e}")
+        logger.error(f"Ошибка скачивания URL: {url} - {e}")
         raise HTTPException(400, f"Не удалось скачать контент: {str(e)}")
 
-    # 3. Уақыт контексті (2026 жыл)
-    current_date_str = datetime.now().strftime("%Y-%m-%d (%A)")
-
     # === СЛУЧАЙ 1: ЭТО ИЗОБРАЖЕНИЕ ===
     if content_type.startswith("image/"):
         logger.info(f"Обнаружено ИЗОБРАЖЕНИЕ (Type: {content_type}). Запуск Vision анализа...")
@@ -622,41 +714,30 @@ async def analyze_url(
         except Exception as e: 
             raise HTTPException(500, f"Ошибка обработки файла с URL: {e}")
 
-        language_code = detect_language(body.text)
+        language_code = detect_language(text)
         
         # Промпт (Vision + 2026)
-        base_prompt = get_vision_analysis_prompt(language_code, body.text)
-        prompt = f"""
-        [SYSTEM NOTE]
-        Today's Date: {current_date_str}. Current Year: 2026.
-        Treat "2026" as the current year.
-        -------------------
-        {base_prompt}
-        """
-
-        # Gemini шақыру
-        try:
-            # Негізгі модель
-            vision_resp = await primary_vision_model.generate_content_async([prompt, image_part], generation_config={"response_mime_type": "application/json"})
-        except Exception:
-            # Fallback модель (егер бар болса)
-            if fallback_vision_model:
-                 vision_resp = await fallback_vision_model.generate_content_async([prompt, image_part], generation_config={"response_mime_type": "application/json"})
-            else:
-                 raise HTTPException(503, "AI Vision сервис недоступен.")
+        prompt = get_prompt_registry().render("url_vision_analysis", language_code, text=text)
 
-        # JSON Parse
+        # Gemini шақыру (негізгі модель -> fallback, JSON Parse ішінде)
         try:
-            analysis_data = GeminiVisionAnalysisInternal.model_validate_json(vision_resp.text)
-        except Exception as e:
+            analysis_data, _ = await gemini.generate(
+                "vision", [prompt, image_part],
+                response_model=GeminiVisionAnalysisInternal,
+                generation_config={"response_mime_type": "application/json"}
+            )
+        except GeminiResponseError as e:
             logger.error(f"JSON Vision Error: {e}")
             raise HTTPException(500, "Ошибка AI при анализе изображения.")
+        except GeminiError as e:
+            logger.error(f"Vision Error: {e}")
+            raise HTTPException(503, "AI Vision сервис недоступен.")
 
         # Нәтиже жинау
         response_data = {
             "verdict": analysis_data.verdict,
             "confidence": analysis_data.confidence,
-            "original_statement": f"Image URL: {body.url}",
+            "original_statement": f"Image URL: {url}",
             "local_label": None,
             "detailed_explanation": analysis_data.explanation,
             "bias_identification": "Visual Analysis",
@@ -680,30 +761,20 @@ async def analyze_url(
         if len(article_text) < 50:
              article_text = "Content extraction failed. Analyze based on URL only."
 
-        text_to_analyze = f"Claim: {body.text}\n\nURL Content: {article_text}"
-        language = detect_language(body.text) # Сұрақтың тілі маңыздырақ
+        text_to_analyze = f"Claim: {text}\n\nURL Content: {article_text}"
+        language = detect_language(text) # Сұрақтың тілі маңыздырақ
 
         # Промпт (Text + 2026)
-        base_prompt = get_gemini_full_analysis_prompt(
-            language=language,
-            text=body.text, # User claim
+        final_prompt = get_prompt_registry().render(
+            "url_full_analysis", language,
+            text=text, # User claim
             sources_text=f"Source URL Content:\n{article_text[:2000]}...", # Контентті дереккөз ретінде береміз
-            local_model_recommendation=None
         )
 
-        final_prompt = f"""
-        [SYSTEM NOTE]
-        Today's Date: {current_date_str}. Current Year: 2026.
-        Treat "2026" as the current year.
-        -------------------
-        {base_prompt}
-        """
-
         # Gemini шақыру
         try:
-            response_gemini = await text_model.generate_content_async(final_prompt)
-            gemini_full = GeminiFullAnalysisResponse.model_validate_json(response_gemini.text)
-            analysis_dict = gemini_full.model_dump()
+            gemini_full, _ = await gemini.generate("text", final_prompt, response_model=GeminiFullAnalysisResponse)
+            analysis_dict = gemini_full.model_dump(mode="json")
             
             verdict = analysis_dict.pop("verdict")
             confidence = analysis_dict.pop("confidence")
@@ -711,67 +782,19 @@ async def analyze_url(
             response_data = {
                 "verdict": verdict,
                 "confidence": confidence,
-                "original_statement": body.text,
+                "original_statement": text,
                 "local_label": None,
                 **analysis_dict
             }
-        except Exception as e:
+        except GeminiResponseError as e:
             logger.error(f"Text Analysis Error: {e}")
             raise HTTPException(500, "Ошибка AI при анализе текста.")
+        except GeminiError as e:
+            logger.error(f"Text Analysis Error: {e}")
+            raise HTTPException(503, "AI сервис временно недоступен.")
 
-    # 4. Базаға сақтау (Ортақ логика)
-    if user_id_for_db:
-        try:
-            db.save_analysis(
-                user_id=user_id_for_db, 
-                text=f"URL: {body.url} | {body.text}", 
-                verdict=response_data['verdict'], # Enum value емес, string болуы мүмкін, тексеру керек
-                confidence=response_data['confidence'], 
-                full_response=response_data
-            )
-        except Exception as db_e:
-            logger.error(f"DB Save Error: {db_e}")
-            # База қатесі анализді тоқтатпауы керек
-
-    return FullAnalysisResponse(**response_data)
-
-
-# ✅ 2. Prompt функциясы бөлек тұруы керек (Indentation дұрыс болуы шарт)
-def get_gemini_full_analysis_prompt(language, text, sources_text, local_model_recommendation=None):
-    # Карта тілдері
-    lang_map = {"kk": "Kazakh", "ru": "Russian", "en": "English"}
-    output_lang = lang_map.get(language, "Russian")
-
-    rec_line = ""
-    if local_model_recommendation:
-        rec_line = f"\n(Предварительный AI-анализ: {local_model_recommendation})"
-
-    # ✅ 3. Тырнақшалар (f""") міндетті түрде болуы керек
-    prompt = f"""
-Ты — главный фактчекер (Chief Fact-Checker). 
-Твоя задача — определить достоверность утверждения на {output_lang} языке.
-
-Утверждение: "{text}"{rec_line}
-
-Источники:
-{sources_text}
-
-Проанализируй:
-1. Соответствие утверждения источникам.
-2. Предвзятость или манипулятивные формулировки.
-3. Вероятность того, что утверждение является ложным.
+    return response_data
 
-Ответ дай строго в формате JSON:
-{{
-  "verdict": "real | fake | controversial",
-  "confidence": 0.0-1.0,
-  "bias_identification": "Текстовое описание предвзятости",
-  "detailed_explanation": "Развернутое объяснение вывода",
-  "sources": [{{ "title": "...", "url": "...", "description": "..." }}],
-  "search_suggestions": ["ключевое слово 1", "ключевое слово 2"]
-}}
-"""
-    return prompt.strip()
 
 @app.post(
     "/analyze",
@@ -791,11 +814,11 @@ async def analyze_text(
 ):
     # 1. Тек жеңіл компоненттерді аламыз
     searcher = getattr(request.app.state, 'searcher', None)
-    gemini_model = getattr(request.app.state, 'gemini_model', None)
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, 'gemini', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
 
     # Detector керек емес!
-    if not all([searcher, gemini_model, db]):
+    if not all([searcher, gemini, db]):
         raise HTTPException(status_code=503, detail="Сервис временно недоступен.")
     
     user_id_for_db = None
@@ -805,95 +828,26 @@ async def analyze_text(
         if not user_id:
             raise HTTPException(status_code=401, detail="Ошибка аутентификации пользователя.")
 
-        # Redis өшірулі болса, лимит тексеру қате беруі мүмкін.
-        # Егер Redis жоқ болса, бұл блокты try-except-ке алыңыз:
-        try:
-            is_limit_ok = db.check_and_update_rate_limit(user_id=user_id, limit=USER_DAILY_REQUEST_LIMIT)
-            if not is_limit_ok:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Дневной лимит запросов исчерпан."
-                )
-        except Exception:
-            pass # Redis жоқ болса, лимитті елемейміз
-        
+        # Лимит Redis-те (Lua скрипті, бір round trip); Redis жоқ болса, өткіземіз
+        await enforce_user_limit(request, user_id)
+
         user_id_for_db = user_id
     else:
-        ip_guest = request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP") or request.client.host
+        ip_guest = client_ip(request)
         logger.info(f"Анализ (Текст) для гостя с IP: {ip_guest or 'unknown'}")
         
     try:
-        language = detect_language(req_body.text)
-        clean_text = preprocess_text(req_body.text)
-
-        # 2. Іздеу (SerpAPI)
-        logger.info(f"Searching: '{clean_text[:50]}...' (lang: {language})")
-        search_results = searcher.search(req_body.text, language, max_results=3) # 3 нәтиже жетеді
-        
-        sources_for_prompt = "\n".join([
-            f"- Title: {s.get('title', 'N/A')}\n  URL: {s.get('url', 'N/A')}\n  Description: {s.get('description', 'N/A')}"
-            for s in search_results
-        ]) if search_results else "No relevant sources found."
-
-        # 3. Жергілікті модельді (local_recommendation) ТОЛЫҚ ӨШІРДІК
-        # Оның орнына Gemini-ге "None" жібереміз.
-
-        logger.info("Вызов Gemini (Chief Fact-Checker)...")
-
-        # 1. Қазіргі уақытты анықтаймыз (2026 жыл проблемасын шешу үшін)
-        current_date_str = datetime.now().strftime("%Y-%m-%d (%A)")
-
-        # 2. Негізгі промптты аламыз
-        base_prompt = get_gemini_full_analysis_prompt(
-            language=language,
-            text=req_body.text,
-            sources_text=sources_for_prompt,
-            local_model_recommendation=None # Жергілікті модельді өшірдік
-        )
-
-        # 3. Промптқа "Бүгін 2026 жыл" деп жалғаймыз
-        final_prompt = f"""
-        [SYSTEM NOTE: IMPORTANT CONTEXT]
-        Today's Date: {current_date_str}. 
-        Current Year: 2026.
-        Any news or events dated {current_date_str} or earlier are PAST or PRESENT facts, not future predictions.
-        Treat "2026" as the current year.
-        --------------------------------------------------
-        {base_prompt}
-        """
-        
-        # 4. Gemini-ді шақырамыз
-        response_gemini = await gemini_model.generate_content_async(final_prompt)
-        
-        try:
-            # 5. Жауапты өңдеу (Parsing)
-            gemini_full_response = GeminiFullAnalysisResponse.model_validate_json(response_gemini.text)
-            analysis_data_dict = gemini_full_response.model_dump()
-            final_verdict = analysis_data_dict.pop("verdict")
-            final_confidence = analysis_data_dict.pop("confidence")
-        except Exception as json_e:
-            logger.error(f"❌ JSON Error: {json_e}")
-            raise HTTPException(status_code=500, detail="Ошибка AI (JSON Parse).")
-
-        # 6. Нәтижені жинақтау
-        response_data = {
-            "verdict": final_verdict, 
-            "confidence": final_confidence,
-            "original_statement": req_body.text, 
-            "local_label": None, 
-            **analysis_data_dict
-        }
+        response_data, cache_info = await analyze_claim(request.app.state, req_body.text)
 
         # Базаға сақтау
-        analysis_id = None
         if user_id_for_db: 
-            analysis_id = db.save_analysis(
-                user_id=user_id_for_db, text=req_body.text, verdict=final_verdict.value,
-                confidence=final_confidence, full_response=response_data
+            analysis_id = await get_db_writer(request.app.state).save_analysis(
+                user_id=user_id_for_db, text=req_body.text, verdict=response_data["verdict"],
+                confidence=response_data["confidence"], full_response=response_data
             )
-            response_data["analysis_id"] = analysis_id
-            
-        return FullAnalysisResponse(**response_data)
+            response_data = {**response_data, "analysis_id": analysis_id}
+
+        return FullAnalysisResponse(**response_data, cache=cache_info)
 
     except HTTPException as http_exc:
         raise http_exc
@@ -902,25 +856,460 @@ async def analyze_text(
         raise HTTPException(status_code=500, detail="Внутренняя ошибка.")
 
 
+async def analyze_claim(state, text: str):
+    """
+    Verdict cache -> single-flight -> run_text_analysis.
+    (нәтиже dict, CacheInfo) қайтарады; пайдаланушыға байланысты ештеңе сақтамайды.
+    """
+    language = detect_language(text)
+    clean_text = preprocess_text(text)
+
+    # Verdict cache: бірдей утверждение қайта талданбайды
+    fingerprint = claim_fingerprint(clean_text, language)
+    verdict_cache: Optional[VerdictCache] = getattr(state, 'verdict_cache', None)
+    cache_tier = None
+    cached = None
+    if verdict_cache:
+        cached, cache_tier = await verdict_cache.get(fingerprint)
+
+    if cached is not None:
+        logger.info(f"⚡ Verdict cache HIT ({cache_tier}): {fingerprint[:12]}")
+        response_data = {**cached, "original_statement": text}
+    else:
+        async def analyze_and_cache() -> dict:
+            result = await run_text_analysis(state.searcher, state.gemini, text, clean_text, language)
+            if verdict_cache:
+                await verdict_cache.set(fingerprint, result)
+            return result
+
+        # Single-flight: бірдей утверждениелер бір ғана іздеу + Gemini шақыруын күтеді
+        singleflight: Optional[SingleFlight] = getattr(state, 'singleflight', None)
+        if singleflight:
+            response_data, shared = await singleflight.do(f"analyze:{fingerprint}", analyze_and_cache)
+            if shared:
+                logger.info(f"🔗 Ортақ шақырудың нәтижесі қолданылды: {fingerprint[:12]}")
+                response_data = {**response_data, "original_statement": text}
+        else:
+            response_data = await analyze_and_cache()
+
+    return response_data, CacheInfo(hit=cached is not None, tier=cache_tier, fingerprint=fingerprint)
+
+
+async def run_text_analysis(searcher: WebSearcher, gemini: GeminiExecutor, text: str, clean_text: str, language: str) -> dict:
+    """
+    Толық пайплайн: іздеу + Gemini (Chief Fact-Checker).
+    Пайдаланушыға тәуелсіз нәтижені JSON-сериализацияланатын dict түрінде қайтарады.
+    """
+    # Іздеу (SerpAPI)
+    logger.info(f"Searching: '{clean_text[:50]}...' (lang: {language})")
+    search_results = await searcher.asearch(text, language, max_results=3) # 3 нәтиже жетеді (event loop бұғатталмайды)
+
+    logger.info("Вызов Gemini (Chief Fact-Checker)...")
+    final_prompt = build_text_analysis_prompt(text, language, search_results)
+
+    # Gemini-ді шақырамыз (retry, breaker, fallback және парсинг executor ішінде)
+    try:
+        gemini_full_response, model_used = await gemini.generate("text", final_prompt, response_model=GeminiFullAnalysisResponse)
+        logger.info(f"Gemini жауабы: {model_used}")
+    except GeminiResponseError as json_e:
+        logger.error(f"❌ JSON Error: {json_e}")
+        raise HTTPException(status_code=500, detail="Ошибка AI (JSON Parse).")
+    except GeminiError as g_err:
+        logger.error(f"❌ Gemini недоступен: {g_err}")
+        raise HTTPException(status_code=503, detail="AI сервис временно недоступен.")
+
+    # Нәтижені жинақтау (кэшке сақталатын формат)
+    return {
+        **gemini_full_response.model_dump(mode="json"),
+        "original_statement": text,
+    }
+
+
+def format_sources_for_prompt(search_results: List[dict]) -> str:
+    return "\n".join([
+        f"- Title: {s.get('title', 'N/A')}\n  URL: {s.get('url', 'N/A')}\n  Description: {s.get('description', 'N/A')}"
+        for s in search_results
+    ]) if search_results else "No relevant sources found."
+
+
+def build_text_analysis_prompt(text: str, language: str, search_results: List[dict]) -> str:
+    """Chief Fact-Checker промпты: табылған дереккөздер + 2026 жыл контексті."""
+    # Жергілікті модельді (local_recommendation) ТОЛЫҚ ӨШІРДІК — rec_line бос қалады
+    return get_prompt_registry().render(
+        "full_analysis", language, text=text, sources_text=format_sources_for_prompt(search_results)
+    )
+
+
+def build_batch_analysis_prompt(language: str, claims) -> str:
+    """claims: [(id, утверждение, источники)] — несколько коротких утверждений в одном запросе."""
+    registry = get_prompt_registry()
+    claims_text = "\n\n".join(
+        registry.render("batch_claim", language, claim_id=claim_id, text=text, sources_text=sources_text)
+        for claim_id, text, sources_text in claims
+    )
+    return registry.render("batch_analysis", language, claims_text=claims_text)
+
+
+# === /analyze/stream (SSE): кезеңдер дайын болған сайын оқиға жібереміз ===
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post(
+    "/analyze/stream",
+    tags=["Analysis"],
+    responses={
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Лимит запросов исчерпан."},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Сервис недоступен."},
+    }
+)
+async def analyze_text_stream(
+    req_body: AnalysisRequest,
+    request: Request,
+    current_user: Optional[dict] = Depends(get_optional_current_user),
+):
+    """
+    /analyze-тің ағындық нұсқасы (text/event-stream). Оқиғалар:
+    language -> sources -> token (Gemini фрагменттері) -> result (FullAnalysisResponse)
+    немесе error ({"status", "detail"}).
+    """
+    searcher = getattr(request.app.state, 'searcher', None)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, 'gemini', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
+
+    if not all([searcher, gemini, db]):
+        raise HTTPException(status_code=503, detail="Сервис временно недоступен.")
+
+    user_id_for_db = None
+    if current_user:
+        user_id = current_user.get('id')
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Ошибка аутентификации пользователя.")
+        await enforce_user_limit(request, user_id)
+        user_id_for_db = user_id
+        logger.info(f"Анализ (Stream) для пользователя: {current_user.get('email')}")
+
+    verdict_cache: Optional[VerdictCache] = getattr(request.app.state, 'verdict_cache', None)
+    return StreamingResponse(
+        stream_text_analysis(searcher, gemini, get_db_writer(request.app.state), verdict_cache, req_body.text, user_id_for_db),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_text_analysis(searcher: WebSearcher, gemini: GeminiExecutor, db: Union[AsyncDB, WriteBehindBuffer],
+                               verdict_cache: Optional[VerdictCache], text: str, user_id: Optional[int]):
+    """
+    run_text_analysis-тің ағындық нұсқасы. Gemini жауабы тек бір рет жиналады
+    (көлемі GEMINI_STREAM_MAX_CHARS-пен шектелген), соңында валидация және сақтау.
+    """
+    try:
+        language = detect_language(text)
+        clean_text = preprocess_text(text)
+        yield sse_event("language", {"language": language})
+
+        fingerprint = claim_fingerprint(clean_text, language)
+        cached, cache_tier = (await verdict_cache.get(fingerprint)) if verdict_cache else (None, None)
+
+        if cached is not None:
+            logger.info(f"⚡ Verdict cache HIT ({cache_tier}, stream): {fingerprint[:12]}")
+            response_data = {**cached, "original_statement": text}
+        else:
+            search_results = await searcher.asearch(text, language, max_results=3)
+            yield sse_event("sources", {"sources": [
+                {"title": s.get("title", ""), "url": s.get("url", ""), "description": s.get("snippet") or s.get("description", "")}
+                for s in search_results
+            ]})
+
+            parts: List[str] = []
+            try:
+                async for chunk, _ in gemini.stream("text", build_text_analysis_prompt(text, language, search_results)):
+                    parts.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            except GeminiResponseError as e:
+                logger.error(f"❌ Stream Error: {e}")
+                yield sse_event("error", {"status": 500, "detail": "Ошибка AI (JSON Parse)."})
+                return
+            except GeminiError as e:
+                logger.error(f"❌ Gemini недоступен (stream): {e}")
+                yield sse_event("error", {"status": 503, "detail": "AI сервис временно недоступен."})
+                return
+
+            try:
+                gemini_full_response = GeminiFullAnalysisResponse.model_validate_json("".join(parts))
+            except (ValidationError, ValueError) as json_e:
+                logger.error(f"❌ JSON Error (stream): {json_e}")
+                yield sse_event("error", {"status": 500, "detail": "Ошибка AI (JSON Parse)."})
+                return
+            del parts
+
+            response_data = {**gemini_full_response.model_dump(mode="json"), "original_statement": text}
+            if verdict_cache:
+                await verdict_cache.set(fingerprint, response_data)
+
+        if user_id:
+            analysis_id = await db.save_analysis(
+                user_id=user_id, text=text, verdict=response_data["verdict"],
+                confidence=response_data["confidence"], full_response=response_data
+            )
+            response_data = {**response_data, "analysis_id": analysis_id}
+
+        # response_data-ны өзгертпейміз: қонақ үшін бұл verdict cache-тегі объектінің өзі
+        cache_info = CacheInfo(hit=cached is not None, tier=cache_tier, fingerprint=fingerprint)
+        yield sse_event("result", FullAnalysisResponse(**response_data, cache=cache_info).model_dump(mode="json"))
+
+    except Exception as e:
+        logger.error(f"❌ Stream Error: {e}", exc_info=True)
+        yield sse_event("error", {"status": 500, "detail": "Внутренняя ошибка."})
+
+
+# === /analyze_batch: редакциялық құралдар үшін пакеттік талдау ===
+@app.post(
+    "/analyze_batch",
+    response_model=List[BatchItemResult],
+    tags=["Analysis"],
+    responses={
+        413: {"description": "Слишком много элементов в пакете."},
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Лимит запросов исчерпан."},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Сервис недоступен."},
+    }
+)
+async def analyze_batch(
+    items: List[AnalysisRequest],
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Бірнеше утверждениені бір сұраныспен талдайды. Бірдей утверждениелер бір рет
+    талданады, іздеу шектеулі параллельмен жүреді, қысқа утверждениелер бір
+    Gemini промптына жиналады. Нәтижелер сол ретпен, әр элементтің қатесімен қайтады;
+    күндік лимитке сыймаған элементтер status_code=429 алады.
+    """
+    searcher: Optional[WebSearcher] = getattr(request.app.state, 'searcher', None)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, 'gemini', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
+    if not all([searcher, gemini, db]):
+        raise HTTPException(status_code=503, detail="Сервис временно недоступен.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Максимум {BATCH_MAX_ITEMS} элементов в пакете.")
+
+    user_id = current_user.get('id')
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Ошибка аутентификации пользователя.")
+
+    results: List[Optional[BatchItemResult]] = [None] * len(items)
+
+    # 1. Дедупликация (отпечаток утверждения)
+    prepared = {}
+    keys = []
+    for index, item in enumerate(items):
+        clean_text = preprocess_text(item.text)
+        if not clean_text:
+            results[index] = BatchItemResult(index=index, ok=False, error="Пустое утверждение.", status_code=400)
+            keys.append(None)
+            continue
+        language = detect_language(item.text)
+        fingerprint = claim_fingerprint(clean_text, language)
+        prepared.setdefault(fingerprint, (item.text, clean_text, language))
+        keys.append(fingerprint)
+    groups = {fp: indices for fp, indices in dedupe(keys).items() if fp is not None}
+
+    # 2. Лимит: қалған квотаға сыятын бірегей утверждениелер ғана талданады (ретімен),
+    # қалғандары — элемент бойынша 429. Квота мүлде біткен болса — бүкіл пакетке 429 + Retry-After
+    if groups:
+        cost = len(groups)
+        limiter: Optional[RateLimiter] = getattr(request.app.state, 'rate_limiter', None)
+        if limiter is not None:
+            _, used, _ = await limiter.peek("user", user_id)
+            cost = min(cost, max(1, limiter.limit("user") - used))
+        await enforce_user_limit(request, user_id, cost=cost)
+        for fp in list(groups)[cost:]:
+            for index in groups.pop(fp):
+                results[index] = BatchItemResult(index=index, ok=False, error="Дневной лимит запросов исчерпан.",
+                                                 status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+    logger.info(f"Анализ (Batch) для {current_user.get('email')}: {len(items)} элементов, {len(groups)} уникальных к анализу")
+
+    # 3. Verdict cache
+    outcomes = {}  # fingerprint -> dict нәтиже немесе (status_code, error)
+    cache_tiers = {}
+    verdict_cache: Optional[VerdictCache] = getattr(request.app.state, 'verdict_cache', None)
+    if verdict_cache:
+        lookups = await asyncio.gather(*(verdict_cache.get(fp) for fp in groups), return_exceptions=True)
+        for fp, lookup in zip(groups, lookups):
+            if not isinstance(lookup, BaseException) and lookup[0] is not None:
+                outcomes[fp], cache_tiers[fp] = lookup
+    misses = [fp for fp in groups if fp not in outcomes]
+
+    # 4. Іздеу (шектеулі параллель)
+    searches = await gather_bounded(
+        [lambda fp=fp: searcher.asearch(prepared[fp][0], prepared[fp][2], max_results=3) for fp in misses],
+        BATCH_SEARCH_CONCURRENCY
+    )
+    sources_by_fp = {fp: (found if isinstance(found, list) else []) for fp, found in zip(misses, searches)}
+
+    # 5. Gemini: қысқа утверждениелер пакетпен, ұзындары жеке
+    async def analyze_single(fp: str) -> None:
+        text, _, language = prepared[fp]
+        try:
+            parsed, _ = await gemini.generate(
+                "text", build_text_analysis_prompt(text, language, sources_by_fp[fp]),
+                response_model=GeminiFullAnalysisResponse
+            )
+            outcomes[fp] = {**parsed.model_dump(mode="json"), "original_statement": text}
+        except GeminiResponseError as e:
+            logger.error(f"❌ Batch JSON Error ({fp[:12]}): {e}")
+            outcomes[fp] = (500, "Ошибка AI (JSON Parse).")
+        except GeminiError as e:
+            logger.error(f"❌ Batch Gemini Error ({fp[:12]}): {e}")
+            outcomes[fp] = (503, "AI сервис временно недоступен.")
+
+    async def analyze_pack(pack) -> None:
+        language = pack[0][2]
+        claims = [(i, text, format_sources_for_prompt(sources_by_fp[fp])) for i, (fp, text, _) in enumerate(pack)]
+        try:
+            raw, _ = await gemini.generate("text", build_batch_analysis_prompt(language, claims))
+            parsed = TypeAdapter(List[GeminiBatchItem]).validate_json(raw.text)
+        except (GeminiResponseError, ValidationError, ValueError) as e:
+            logger.warning(f"⚠️ Пакетный ответ ({len(pack)} утв.) не разобран, анализируем по одному: {e}")
+            parsed = []
+        except GeminiError as e:
+            logger.error(f"❌ Batch Gemini Error (пакет из {len(pack)}): {e}")
+            for fp, _, _ in pack:
+                outcomes[fp] = (503, "AI сервис временно недоступен.")
+            return
+        by_id = {item.id: item for item in parsed}
+        retry = []
+        for i, (fp, text, _) in enumerate(pack):
+            item = by_id.get(i)
+            if item is None:
+                retry.append(fp)
+                continue
+            outcomes[fp] = {**item.model_dump(mode="json", exclude={"id"}), "original_statement": text}
+        await asyncio.gather(*(analyze_single(fp) for fp in retry))
+
+    packs, singles = pack_claims([(fp, prepared[fp][0], prepared[fp][2]) for fp in misses])
+    await asyncio.gather(*(analyze_pack(p) for p in packs), *(analyze_single(fp) for fp, _, _ in singles))
+
+    if verdict_cache:
+        fresh = [fp for fp in misses if isinstance(outcomes.get(fp), dict)]
+        await asyncio.gather(*(verdict_cache.set(fp, outcomes[fp]) for fp in fresh), return_exceptions=True)
+
+    # 6. Бір multi-row INSERT-пен сақтау (әр элемент өз жолын алады)
+    to_save = []
+    for fp, indices in groups.items():
+        outcome = outcomes.get(fp)
+        if not isinstance(outcome, dict):
+            continue
+        for index in indices:
+            response_data = {**outcome, "original_statement": items[index].text}
+            to_save.append((index, response_data))
+    analysis_ids = await db.save_analyses_batch([
+        (user_id, response_data["original_statement"], response_data["verdict"], response_data["confidence"], response_data)
+        for _, response_data in to_save
+    ])
+    saved = {index: (response_data, analysis_id) for (index, response_data), analysis_id in zip(to_save, analysis_ids)}
+
+    # 7. Нәтижелер бастапқы ретпен
+    for fp, indices in groups.items():
+        outcome = outcomes.get(fp, (500, "Внутренняя ошибка."))
+        for index in indices:
+            if isinstance(outcome, dict):
+                response_data, analysis_id = saved[index]
+                results[index] = BatchItemResult(index=index, ok=True, result=FullAnalysisResponse(
+                    **response_data, analysis_id=analysis_id,
+                    cache=CacheInfo(hit=fp in cache_tiers, tier=cache_tiers.get(fp), fingerprint=fp)
+                ))
+            else:
+                status_code, error = outcome
+                results[index] = BatchItemResult(index=index, ok=False, error=error, status_code=status_code)
+    return results
+
+
+# === Job API: ұзақ талдау фонда орындалады, HTTP байланысы бірден босайды ===
+def build_job_handlers(state) -> dict:
+    """kind -> async handler(job). API де, celery_worker.py де осыны қолданады."""
+
+    async def analyze(text: str) -> dict:
+        response_data, cache_info = await analyze_claim(state, text)
+        return {**response_data, "cache": cache_info.model_dump()}
+
+    async def analyze_url(url: str, text: str) -> dict:
+        return await analyze_url_coalesced(state, url, text)
+
+    return {
+        "analyze": lambda job: analyze_task(job, get_db_writer(state), analyze),
+        "analyze_url": lambda job: analyze_url_task(job, get_db_writer(state), analyze_url),
+    }
+
+
+@app.post("/jobs", response_model=JobSubmitResponse, status_code=status.HTTP_202_ACCEPTED, tags=["Jobs"])
+async def submit_job(
+    body: JobRequest,
+    request: Request,
+    current_user: Optional[dict] = Depends(get_optional_current_user),
+    _guest_limit_check: None = Depends(rate_limit_guest)
+):
+    """Тапсырманы кезекке қояды және бірден job_id қайтарады."""
+    jobs: Optional[JobRunner] = getattr(request.app.state, "jobs", None)
+    db: Optional[AsyncDB] = getattr(request.app.state, "adb", None)
+    if not jobs or not db:
+        raise HTTPException(status_code=503, detail="Сервис временно недоступен.")
+    if body.kind == "analyze_url" and body.url is None:
+        raise HTTPException(status_code=422, detail="Для kind='analyze_url' нужен url.")
+
+    owner_id = None
+    if current_user:
+        owner_id = current_user.get('id')
+        if not owner_id:
+            raise HTTPException(status_code=401, detail="Ошибка аутентификации пользователя.")
+        await enforce_user_limit(request, owner_id)
+
+    payload = {"text": body.text}
+    if body.url is not None:
+        payload["url"] = str(body.url)
+    try:
+        job = await jobs.submit(
+            body.kind, payload,
+            callback_url=str(body.callback_url) if body.callback_url else None,
+            owner_id=owner_id
+        )
+    except Exception as e:
+        logger.error(f"❌ Тапсырманы кезекке қою мүмкін болмады: {e}")
+        raise HTTPException(status_code=503, detail="Очередь задач недоступна.")
+
+    return JobSubmitResponse(job_id=job["id"], status=job["status"], status_url=f"/jobs/{job['id']}")
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def get_job(job_id: str, request: Request, current_user: Optional[dict] = Depends(get_optional_current_user)):
+    jobs: Optional[JobRunner] = getattr(request.app.state, "jobs", None)
+    if not jobs:
+        raise HTTPException(status_code=503, detail="Сервис временно недоступен.")
+    job = await jobs.store.get(job_id)
+    # Пайдаланушы тапсырмасын тек иесі көре алады
+    if job is None or (job.get("owner_id") and (not current_user or current_user.get('id') != job["owner_id"])):
+        raise HTTPException(status_code=404, detail="Задача не найдена.")
+    return JobStatusResponse(**public_view(job))
+
+
 # ⛔️ (v4.6.2) ДУБЛИКАТ /analyze_image (v4.3) УДАЛЕН ⛔️
 
 
 @app.get("/users/me/status", response_model=UserStatusResponse, tags=["User"])
 async def read_users_me_status(request: Request, current_user: dict = Depends(get_current_user)):
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
-    if not db: raise HTTPException(status_code=503, detail="База данных недоступна")
     user_id = current_user.get('id')
     if not user_id: raise HTTPException(status_code=400, detail="ID пользователя не найден")
-    user_status_data = db.get_user_status(user_id)
-    if not user_status_data:
-        raise HTTPException(status_code=404, detail="Пользователь не найден.")
-    user_status_data['daily_limit'] = USER_DAILY_REQUEST_LIMIT
-    return UserStatusResponse(**user_status_data)
+    requests_today = 0
+    limiter: Optional[RateLimiter] = getattr(request.app.state, 'rate_limiter', None)
+    if limiter is not None:
+        _, requests_today, _ = await limiter.peek("user", user_id)
+    return UserStatusResponse(email=current_user["email"], requests_today=requests_today,
+                              daily_limit=USER_DAILY_REQUEST_LIMIT)
 
 
 @app.post("/vote", status_code=status.HTTP_200_OK, tags=["User"])
 async def submit_vote(vote_req: VoteRequest, request: Request, current_user: dict = Depends(get_current_user)):
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
     if not db:
         raise HTTPException(status_code=503, detail="База данных недоступна")
     user_id = current_user.get('id')
@@ -928,7 +1317,10 @@ async def submit_vote(vote_req: VoteRequest, request: Request, current_user: dic
         raise HTTPException(status_code=4400, detail="ID пользователя не найден")
     if vote_req.vote not in [1, -1]:
         raise HTTPException(status_code=422, detail="Неверное значение для голоса. Допустимо 1 или -1.")
-    success = db.save_vote(user_id=user_id, analysis_id=vote_req.analysis_id, vote=vote_req.vote)
+    # Write-behind дауысты кейін жазады, сондықтан белгісіз анализге дауыс осы жерде қабылданбайды
+    if await db.analysis_id_issued(vote_req.analysis_id) is False:
+        raise HTTPException(status_code=404, detail="Анализ не найден.")
+    success = await get_db_writer(request.app.state).save_vote(user_id=user_id, analysis_id=vote_req.analysis_id, vote=vote_req.vote)
     if not success:
         raise HTTPException(status_code=500, detail="Не удалось сохранить голос.")
     return {"message": "Спасибо за ваш отзыв!"}
@@ -985,36 +1377,52 @@ async def get_news_feed():
 @app.get("/users/guest/status", response_model=GuestStatusResponse, tags=["User"])
 async def read_guest_status(request: Request):
     # 1. Қонақтың IP адресін анықтаймыз
-    ip = request.headers.get("X-Forwarded-For") or request.headers.get("X-Real-IP") or request.client.host
-    
-    # 2. Redis-тен осы IP бүгін қанша рет тексергенін қараймыз
+    ip = client_ip(request)
+
+    # 2. Redis-тен осы IP соңғы тәулікте қанша рет тексергенін қараймыз (лимитті шегермей)
     requests_count = 0
-    if redis_pool:
-        try:
-            r = redis.Redis(connection_pool=redis_pool)
-            val = r.get(f"rate_limit_guest:{ip}")
-            if val:
-                requests_count = int(val)
-        except Exception:
-            pass # Егер Redis істемесе, 0 деп көрсете береміз
-            
+    limiter: Optional[RateLimiter] = getattr(request.app.state, 'rate_limiter', None)
+    if limiter is not None:
+        _, requests_count, _ = await limiter.peek("guest", ip)
+
     return {
         "requests_today": requests_count,
         "daily_limit": GUEST_REQUEST_LIMIT
     }
 
 @app.get("/history", response_model=List[dict], tags=["User"])
-async def get_history(request: Request, current_user: dict = Depends(get_current_user)):
-    db: Optional[Database] = getattr(request.app.state, 'db', None)
+async def get_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Тарих беттермен: жаңалары жоғарыда. Келесі беттің курсоры X-Next-Cursor
+    тақырыбында (жауап денесі бұрынғыдай тізім). full_response — /history/{id}.
+    """
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
     if not db: 
         raise HTTPException(status_code=503, detail="БД недоступна")
         
     user_id = current_user.get('id')
     if not user_id: 
         raise HTTPException(status_code=400, detail="ID пользователя не найден")
-        
-    # 'await' жоқ, себебі db синхронды
-    history_items = db.get_user_history(user_id=user_id, limit=20) 
+
+    before = None
+    if cursor:
+        try:
+            before = decode_history_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный курсор.")
+
+    # Бір артық жолмен келесі бет бар-жоғын білеміз (keyset, OFFSET жоқ)
+    history_items = await db.get_user_history(user_id=user_id, limit=limit + 1, before=before)
+    if len(history_items) > limit:
+        history_items = history_items[:limit]
+        last = history_items[-1]
+        response.headers["X-Next-Cursor"] = encode_history_cursor(last["created_at"], last["id"])
     
     formatted_history = []
     
@@ -1029,4 +1437,49 @@ async def get_history(request: Request, current_user: dict = Depends(get_current
         })
     
     # Егер дерек жоқ болса, бос массив қайтарамыз (FrontEnd Skeleton-нан шығу үшін)
-    return formatted_history
\ No newline at end of file
+    return formatted_history
+
+
+@app.get("/history/{analysis_id}", response_model=dict, tags=["User"])
+async def get_history_item(analysis_id: int, request: Request, current_user: dict = Depends(get_current_user)):
+    """Бір анализдің толық нәтижесі (full_response-пен), тек өз анализі."""
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
+    if not db:
+        raise HTTPException(status_code=503, detail="БД недоступна")
+    item = await db.get_analysis(user_id=current_user.get('id'), analysis_id=analysis_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Анализ не найден.")
+    if item.get("created_at"):
+        item["created_at"] = item["created_at"].isoformat()
+    return item
+
+
+@app.get("/metrics", tags=["Monitoring"])
+async def get_metrics(request: Request):
+    """Ішкі есептегіштер (кэш hit-ratio және т.б.)."""
+    verdict_cache: Optional[VerdictCache] = getattr(request.app.state, 'verdict_cache', None)
+    singleflight: Optional[SingleFlight] = getattr(request.app.state, 'singleflight', None)
+    searcher: Optional[WebSearcher] = getattr(request.app.state, 'searcher', None)
+    gemini: Optional[GeminiExecutor] = getattr(request.app.state, 'gemini', None)
+    jobs: Optional[JobRunner] = getattr(request.app.state, 'jobs', None)
+    db: Optional[AsyncDB] = getattr(request.app.state, 'adb', None)
+    writer: Optional[WriteBehindBuffer] = getattr(request.app.state, 'writer', None)
+    user_cache: Optional[UserCache] = getattr(request.app.state, 'user_cache', None)
+    login_throttle: Optional[LoginThrottle] = getattr(request.app.state, 'login_throttle', None)
+    rate_limiter: Optional[RateLimiter] = getattr(request.app.state, 'rate_limiter', None)
+    redis_manager: Optional[RedisManager] = getattr(request.app.state, 'redis', None)
+    return {
+        "passwords": password_hasher.stats(),
+        "login_throttle": login_throttle.stats() if login_throttle else None,
+        "rate_limit": rate_limiter.stats() if rate_limiter else None,
+        "redis": redis_manager.stats() if redis_manager else None,
+        "user_cache": user_cache.stats() if user_cache else None,
+        "db_pool": db.pool_stats() if db else None,
+        "write_behind": writer.stats() if writer else None,
+        "prompts": prompt_registry.stats() if prompt_registry else None,
+        "jobs": await jobs.stats() if jobs else None,
+        "verdict_cache": verdict_cache.stats() if verdict_cache else None,
+        "singleflight": singleflight.stats() if singleflight else None,
+        "search": searcher.stats() if searcher else None,
+        "gemini": gemini.stats() if gemini else None,
+    }
@@ -0,0 +1,426 @@
+# backend/async_database.py
+"""
+Асинхронный доступ к PostgreSQL для FastAPI-обработчиков.
+
+AsyncDatabase повторяет методы Database, но как корутины на asyncpg со своим
+пулом соединений: запрос к БД не блокирует event loop, и один worker держит
+сотни запросов одновременно.
+
+Пул asyncpg сам закрывает только простаивающие соединения, поэтому
+DB_POOL_MAX_LIFETIME (как в db_pool.py) соблюдается здесь: соединение старше
+него закрывается при возврате в пул, и пул открывает новое.
+
+Если asyncpg не установлен или не смог подключиться, используется
+ThreadedAsyncDatabase — те же корутины поверх синхронного Database
+(psycopg2-пул из db_pool.py) в потоках.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import bcrypt
+
+try:
+    import asyncpg
+except ImportError:  # asyncpg — опциональная зависимость
+    asyncpg = None
+
+try:
+    from .db_pool import DB_CONNECT_TIMEOUT, DB_POOL_MAX_LIFETIME, DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE, DB_POOL_TIMEOUT
+except ImportError:
+    from db_pool import DB_CONNECT_TIMEOUT, DB_POOL_MAX_LIFETIME, DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE, DB_POOL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Корутины Database на пуле asyncpg."""
+
+    def __init__(self, db_url: str, min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT, max_lifetime: float = DB_POOL_MAX_LIFETIME):
+        if asyncpg is None:
+            raise RuntimeError("asyncpg не установлен.")
+        self.db_url = db_url
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pool = None
+        self._created_at: Dict[int, float] = {}  # PID серверного процесса -> время открытия соединения
+        self.counters = {"acquires": 0, "wait_time_total": 0.0, "wait_time_max": 0.0, "timeouts": 0,
+                         "closed_lifetime": 0}
+
+    async def _init_connection(self, conn) -> None:
+        # JSONB <-> dict, как RealDictCursor/json.dumps в синхронной версии
+        await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+        self._created_at[conn.get_server_pid()] = time.monotonic()
+
+    async def connect(self) -> None:
+        self.pool = await asyncpg.create_pool(
+            self.db_url,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            timeout=DB_CONNECT_TIMEOUT,
+            init=self._init_connection,
+        )
+        logger.info(f"✅ asyncpg пул создан (min={self.min_size}, max={self.max_size}).")
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _acquire(self):
+        started = time.monotonic()
+        try:
+            conn = await self.pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError as e:
+            self.counters["timeouts"] += 1
+            raise RuntimeError("Соединение с базой данных недоступно (пул исчерпан).") from e
+        elapsed = time.monotonic() - started
+        self.counters["acquires"] += 1
+        self.counters["wait_time_total"] += elapsed
+        self.counters["wait_time_max"] = max(self.counters["wait_time_max"], elapsed)
+        return conn
+
+    async def _release(self, conn) -> None:
+        """Возвращает соединение в пул; соединение старше max_lifetime сначала закрывается."""
+        pid = conn.get_server_pid()
+        created_at = self._created_at.get(pid)
+        if self.max_lifetime > 0 and created_at is not None and time.monotonic() - created_at > self.max_lifetime:
+            self._created_at.pop(pid, None)
+            self.counters["closed_lifetime"] += 1
+            try:
+                await conn.close(timeout=DB_CONNECT_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось закрыть устаревшее соединение: {e}")
+                conn.terminate()
+        await self.pool.release(conn)
+
+    async def _fetchrow(self, sql: str, *args) -> Optional[Any]:
+        conn = await self._acquire()
+        try:
+            return await conn.fetchrow(sql, *args)
+        finally:
+            await self._release(conn)
+
+    async def _fetch(self, sql: str, *args) -> List[Any]:
+        conn = await self._acquire()
+        try:
+            return await conn.fetch(sql, *args)
+        finally:
+            await self._release(conn)
+
+    async def _execute(self, sql: str, *args) -> str:
+        conn = await self._acquire()
+        try:
+            return await conn.execute(sql, *args)
+        finally:
+            await self._release(conn)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        acquires = self.counters["acquires"]
+        stats = {
+            "driver": "asyncpg",
+            **{k: (round(v, 4) if isinstance(v, float) else v) for k, v in self.counters.items()},
+            "wait_time_avg": round(self.counters["wait_time_total"] / acquires, 4) if acquires else 0.0,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+        if self.pool is not None:
+            stats["size"] = self.pool.get_size()
+            stats["idle"] = self.pool.get_idle_size()
+        return stats
+
+    # -----------------------------------------------------------------------
+    # ПОЛЬЗОВАТЕЛИ
+    # -----------------------------------------------------------------------
+    async def create_user(self, email: str, password_hash: str) -> Optional[int]:
+        """Создает нового пользователя. Принимает УЖЕ хэшированный пароль."""
+        try:
+            row = await self._fetchrow(
+                "INSERT INTO users (email, password_hash) VALUES ($1, $2) RETURNING id;", email, password_hash)
+            logger.info(f"✅ Пользователь {email} создан с ID {row['id']}.")
+            return row["id"]
+        except asyncpg.UniqueViolationError:
+            logger.info(f"⚠️ Пользователь с email {email} уже существует.")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Ошибка при создании пользователя {email}: {e}", exc_info=True)
+            return None
+
+    async def verify_user(self, email: str, password: str) -> Optional[Dict]:
+        """Проверяет логин/пароль."""
+        try:
+            row = await self._fetchrow("SELECT id, email, password_hash FROM users WHERE email = $1;", email)
+            if not row:
+                logger.warning(f"⚠️ Попытка входа для несуществующего email: {email}.")
+                return None
+            # bcrypt — CPU на 100+ мс, не в event loop
+            if await asyncio.to_thread(bcrypt.checkpw, password.encode('utf-8'), row["password_hash"].encode('utf-8')):
+                return {"id": row["id"], "email": row["email"]}
+            logger.warning(f"⚠️ Неверный пароль для пользователя {email}.")
+            return None
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки пользователя {email}: {e}", exc_info=True)
+            return None
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict]:
+        """Возвращает пользователя по email."""
+        try:
+            row = await self._fetchrow(
+                "SELECT id, email, password_hash AS hashed_password FROM users WHERE email = $1;", email)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_user_by_email для {email}: {e}", exc_info=True)
+            return None
+
+    # -----------------------------------------------------------------------
+    # АНАЛИЗЫ
+    # -----------------------------------------------------------------------
+    async def save_analysis(self, user_id: int, text: str, verdict: str, confidence: float,
+                            full_response: dict) -> Optional[int]:
+        """Сохраняет результат анализа и возвращает его ID."""
+        sql = ("INSERT INTO analyses (user_id, text, verdict, confidence, full_response) "
+               "VALUES ($1, $2, $3, $4, $5) RETURNING id;")
+        try:
+            row = await self._fetchrow(sql, user_id, text, verdict, confidence, full_response)
+            logger.info(f"✅ Анализ {row['id']} для пользователя {user_id} сохранен.")
+            return row["id"]
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения анализа для user_id {user_id}: {e}", exc_info=True)
+            return None
+
+    async def save_analyses_batch(self, rows: List[Tuple[int, str, str, float, dict]]) -> List[Optional[int]]:
+        """Несколько анализов одним INSERT ... SELECT FROM unnest(...). ID в том же порядке."""
+        if not rows:
+            return []
+        sql = """
+            INSERT INTO analyses (user_id, text, verdict, confidence, full_response)
+            SELECT * FROM unnest($1::int[], $2::text[], $3::text[], $4::real[], $5::jsonb[])
+            RETURNING id;
+        """
+        try:
+            columns = list(zip(*rows))
+            result = await self._fetch(sql, *columns)
+            logger.info(f"✅ Сохранено {len(result)} анализов одним запросом.")
+            return [row["id"] for row in result]
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного сохранения {len(rows)} анализов: {e}", exc_info=True)
+            return [None] * len(rows)
+
+    # --- Пакетная запись для write-behind (write_behind.py): ошибки пробрасываются ---
+    async def reserve_analysis_ids(self, count: int) -> List[int]:
+        """Резервирует count ID из sequence таблицы analyses."""
+        rows = await self._fetch(
+            "SELECT nextval(pg_get_serial_sequence('analyses', 'id')) AS id FROM generate_series(1, $1);", count)
+        return [row["id"] for row in rows]
+
+    async def save_analyses_with_ids(self, rows: List[Tuple[int, int, str, str, float, dict]]) -> None:
+        """
+        rows: (id, user_id, text, verdict, confidence, full_response). Повтор безопасен:
+        PK секционированной таблицы — (id, created_at), поэтому уже записанный id проверяется явно.
+        """
+        sql = """
+            INSERT INTO analyses (id, user_id, text, verdict, confidence, full_response)
+            SELECT * FROM unnest($1::int[], $2::int[], $3::text[], $4::text[], $5::real[], $6::jsonb[])
+                AS v (id, user_id, text, verdict, confidence, full_response)
+            WHERE NOT EXISTS (SELECT 1 FROM analyses a WHERE a.id = v.id)
+            ON CONFLICT DO NOTHING;
+        """
+        await self._execute(sql, *zip(*rows))
+
+    async def save_votes_batch(self, rows: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+        """
+        rows: (user_id, analysis_id, vote), без повторов пары (user_id, analysis_id).
+        Возвращает пары (user_id, analysis_id), не записанные из-за отсутствия анализа.
+        """
+        # FK на analyses нет: голос за еще не записанный анализ не вставляется
+        sql = """
+            INSERT INTO user_votes (user_id, analysis_id, vote)
+            SELECT v.user_id, v.analysis_id, v.vote
+            FROM unnest($1::int[], $2::int[], $3::int[]) AS v (user_id, analysis_id, vote)
+            WHERE EXISTS (SELECT 1 FROM analyses a WHERE a.id = v.analysis_id)
+            ON CONFLICT (user_id, analysis_id) DO UPDATE SET vote = EXCLUDED.vote
+            RETURNING user_id, analysis_id;
+        """
+        written = {(row["user_id"], row["analysis_id"]) for row in await self._fetch(sql, *zip(*rows))}
+        return [(user_id, analysis_id) for user_id, analysis_id, _ in rows if (user_id, analysis_id) not in written]
+
+    async def update_telegram_statuses_batch(self, rows: List[Tuple[int, str, Optional[int]]]) -> None:
+        """rows: (message_db_id, status, analysis_id), один UPDATE ... FROM unnest(...)."""
+        sql = """
+            UPDATE telegram_monitored_messages AS m
+            SET status = v.status, analysis_id = v.analysis_id, processed_at = CURRENT_TIMESTAMP
+            FROM unnest($1::int[], $2::text[], $3::int[]) AS v (id, status, analysis_id)
+            WHERE m.id = v.id;
+        """
+        await self._execute(sql, *zip(*rows))
+
+    async def get_user_history(self, user_id: int, limit: int = 20,
+                               before: Optional[Tuple[datetime, int]] = None) -> List[Dict]:
+        """Страница истории анализов без full_response (см. Database.get_user_history)."""
+        try:
+            if before is None:
+                rows = await self._fetch(
+                    "SELECT id, text, verdict, confidence, created_at FROM analyses WHERE user_id = $1 "
+                    "ORDER BY created_at DESC, id DESC LIMIT $2;", user_id, limit)
+            else:
+                rows = await self._fetch(
+                    "SELECT id, text, verdict, confidence, created_at FROM analyses WHERE user_id = $1 "
+                    "AND (created_at, id) < ($2, $3) ORDER BY created_at DESC, id DESC LIMIT $4;",
+                    user_id, before[0], before[1], limit)
+            return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения истории для user_id {user_id}: {e}", exc_info=True)
+            return []
+
+    async def get_analysis(self, user_id: int, analysis_id: int) -> Optional[Dict]:
+        """Полный анализ (с full_response), только если он принадлежит user_id."""
+        try:
+            row = await self._fetchrow(
+                "SELECT id, text, verdict, confidence, created_at, full_response FROM analyses "
+                "WHERE id = $1 AND user_id = $2;", analysis_id, user_id)
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения анализа {analysis_id} для user_id {user_id}: {e}", exc_info=True)
+            return None
+
+    async def analysis_id_issued(self, analysis_id: int) -> Optional[bool]:
+        """
+        Анализ записан или его ID уже выдан sequence (write-behind пишет строку позже).
+        None — проверить не удалось.
+        """
+        sql = ("SELECT EXISTS (SELECT 1 FROM analyses WHERE id = $1) OR $1 BETWEEN 1 AND "
+               "COALESCE(pg_sequence_last_value(pg_get_serial_sequence('analyses', 'id')::regclass), 0) AS issued;")
+        try:
+            row = await self._fetchrow(sql, analysis_id)
+            return bool(row["issued"])
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки анализа {analysis_id}: {e}", exc_info=True)
+            return None
+
+    # -----------------------------------------------------------------------
+    # ГОЛОСОВАНИЯ
+    # -----------------------------------------------------------------------
+    async def save_vote(self, user_id: int, analysis_id: int, vote: int) -> bool:
+        """Сохраняет или обновляет голос пользователя за анализ."""
+        sql = ("INSERT INTO user_votes (user_id, analysis_id, vote) SELECT $1, $2, $3 "
+               "WHERE EXISTS (SELECT 1 FROM analyses WHERE id = $2) "
+               "ON CONFLICT (user_id, analysis_id) DO UPDATE SET vote = EXCLUDED.vote;")
+        try:
+            status = await self._execute(sql, user_id, analysis_id, vote)
+            if status.endswith(" 0"):  # "INSERT 0 0" — анализа нет
+                logger.warning(f"⚠️ Голос от пользователя {user_id} за несуществующий анализ {analysis_id} отклонён.")
+                return False
+            logger.info(f"✅ Голос ({vote}) от пользователя {user_id} за анализ {analysis_id} сохранён.")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения голоса ({user_id}/{analysis_id}/{vote}): {e}", exc_info=True)
+            return False
+
+    # -----------------------------------------------------------------------
+    # TELEGRAM МОНИТОРИНГ
+    # -----------------------------------------------------------------------
+    async def save_telegram_message(
+        self, chat_id: int, message_id: int, user_id: Optional[int],
+        message_text: Optional[str], media_type: str, url_found: Optional[str],
+        caption: Optional[str], message_timestamp: datetime
+    ) -> Optional[int]:
+        """Сохраняет информацию об исходном сообщении Telegram."""
+        sql = """
+            INSERT INTO telegram_monitored_messages
+            (chat_id, message_id, user_id, message_text, media_type, url_found, caption, message_timestamp, status)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 'pending')
+            ON CONFLICT DO NOTHING
+            RETURNING id;
+        """
+        try:
+            row = await self._fetchrow(sql, chat_id, message_id, user_id, message_text, media_type,
+                                       url_found, caption, message_timestamp)
+            return row["id"] if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения сообщения Telegram ({chat_id}/{message_id}): {e}", exc_info=True)
+            return None
+
+    async def update_telegram_message_status(self, message_db_id: int, status: str, analysis_id: Optional[int] = None):
+        """Обновляет статус обработанного сообщения и ID анализа."""
+        sql = """
+            UPDATE telegram_monitored_messages
+            SET status = $1, analysis_id = $2, processed_at = CURRENT_TIMESTAMP
+            WHERE id = $3;
+        """
+        try:
+            await self._execute(sql, status, analysis_id, message_db_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обновления статуса сообщения {message_db_id} на '{status}': {e}", exc_info=True)
+
+    async def check_if_url_analyzed(self, url: str) -> bool:
+        """Проверяет, был ли этот URL уже успешно проанализирован."""
+        sql = """
+            SELECT EXISTS (
+                SELECT 1 FROM telegram_monitored_messages
+                WHERE url_found = $1 AND status = 'analyzed'
+            );
+        """
+        try:
+            row = await self._fetchrow(sql, url)
+            return bool(row[0])
+        except Exception as e:
+            logger.error(f"❌ Ошибка при проверке URL {url} в БД: {e}", exc_info=True)
+            return False
+
+
+class ThreadedAsyncDatabase:
+    """
+    Те же корутины поверх синхронного Database: каждый вызов выполняется
+    в потоке (asyncio.to_thread), event loop не блокируется.
+    """
+
+    _METHODS = (
+        "create_user", "verify_user", "get_user_by_email",
+        "save_analysis", "save_analyses_batch", "get_user_history", "get_analysis", "save_vote",
+        "save_telegram_message",
+        "update_telegram_message_status", "check_if_url_analyzed",
+        "reserve_analysis_ids", "save_analyses_with_ids", "save_votes_batch",
+        "update_telegram_statuses_batch",
+    )
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name: str):
+        if name not in self._METHODS:
+            raise AttributeError(name)
+        method = getattr(self.db, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def close(self) -> None:
+        pass  # пул psycopg2 закрывается вместе с Database
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {"driver": "psycopg2 (threads)", **self.db.pool_stats()}
+
+
+AsyncDB = Union[AsyncDatabase, ThreadedAsyncDatabase]
+
+
+async def create_async_database(db) -> AsyncDB:
+    """AsyncDatabase на asyncpg, если он доступен; иначе ThreadedAsyncDatabase(db)."""
+    if asyncpg is not None:
+        adb = AsyncDatabase(db.db_url)
+        try:
+            await adb.connect()
+            return adb
+        except Exception as e:
+            logger.warning(f"⚠️ asyncpg недоступен ({e}), запросы к БД пойдут через пул потоков.")
+    return ThreadedAsyncDatabase(db)
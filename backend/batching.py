@@ -0,0 +1,69 @@
+# backend/batching.py
+"""
+Вспомогательные функции для /analyze_batch.
+
+- дедупликация одинаковых утверждений (по отпечатку claim_fingerprint);
+- ограниченный параллелизм для поиска;
+- упаковка коротких утверждений одного языка в один промпт Gemini.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, Tuple
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 200))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", 8))
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", 5))  # утверждений в одном промпте
+BATCH_PACK_MAX_CHARS = int(os.getenv("BATCH_PACK_MAX_CHARS", 280))  # "короткое" утверждение
+
+
+def dedupe(keys: Sequence[Hashable]) -> Dict[Hashable, List[int]]:
+    """Группирует позиции по ключу, сохраняя порядок первого появления."""
+    groups: Dict[Hashable, List[int]] = {}
+    for index, key in enumerate(keys):
+        groups.setdefault(key, []).append(index)
+    return groups
+
+
+async def gather_bounded(factories: Sequence[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """
+    Выполняет корутины не более чем по `limit` одновременно.
+    Исключения возвращаются на своих позициях (как gather(return_exceptions=True)).
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await factory()
+
+    return await asyncio.gather(*(run(f) for f in factories), return_exceptions=True)
+
+
+def pack_claims(
+    claims: Sequence[Tuple[Hashable, str, str]],
+    pack_size: int = BATCH_PACK_SIZE,
+    max_chars: int = BATCH_PACK_MAX_CHARS,
+) -> Tuple[List[List[Tuple[Hashable, str, str]]], List[Tuple[Hashable, str, str]]]:
+    """
+    claims: (ключ, текст, язык). Короткие утверждения одного языка группируются
+    по pack_size; длинные (и одиночки, которым не нашлось пары) идут отдельно.
+    Возвращает (пакеты, одиночные).
+    """
+    by_language: Dict[str, List[Tuple[Hashable, str, str]]] = {}
+    singles: List[Tuple[Hashable, str, str]] = []
+    for claim in claims:
+        _, text, language = claim
+        if pack_size > 1 and len(text) <= max_chars:
+            by_language.setdefault(language, []).append(claim)
+        else:
+            singles.append(claim)
+
+    packs: List[List[Tuple[Hashable, str, str]]] = []
+    for group in by_language.values():
+        for start in range(0, len(group), pack_size):
+            pack = group[start:start + pack_size]
+            if len(pack) == 1:
+                singles.append(pack[0])
+            else:
+                packs.append(pack)
+    return packs, singles
@@ -0,0 +1,302 @@
+# backend/caching.py
+"""
+Кэширование результатов анализа (verdict cache) и пользователей по JWT (user cache).
+
+Двухуровневый кэш: быстрый in-process LRU (первый уровень) и Redis (второй
+уровень, общий для всех gunicorn worker-ов). Ключ — отпечаток утверждения:
+нормализованный текст (`preprocess_text`) + язык (`detect_language`).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", 60 * 60 * 6))  # 6 часов
+VERDICT_CACHE_LOCAL_TTL = int(os.getenv("VERDICT_CACHE_LOCAL_TTL", 60 * 5))  # 5 минут
+VERDICT_CACHE_MAX_ITEMS = int(os.getenv("VERDICT_CACHE_MAX_ITEMS", 2048))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))  # верхняя граница устаревания, секунды
+USER_CACHE_MAX_ITEMS = int(os.getenv("USER_CACHE_MAX_ITEMS", 10000))
+
+
+def claim_fingerprint(clean_text: str, language: str) -> str:
+    """
+    Возвращает отпечаток утверждения.
+    clean_text — результат preprocess_text(), language — результат detect_language().
+    """
+    normalized = " ".join(clean_text.casefold().split())
+    return hashlib.sha256(f"{language}:{normalized}".encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU-кэш с временем жизни записей и счетчиками попаданий.
+    """
+
+    def __init__(self, max_items: int = 1024, ttl: float = 300.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_entry(self, key: Any) -> Optional[Tuple[Any, float]]:
+        """Возвращает (значение, возраст в секундах) или None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value, now - stored_at
+
+    def get(self, key: Any) -> Optional[Any]:
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (now, expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class VerdictCache(OptionalRedis):
+    """
+    Кэш вердиктов перед пайплайном /analyze.
+    Хранит готовый ответ (без пользовательских полей вроде analysis_id).
+    Redis-клиент (redis.asyncio) необязателен: без него работает только локальный уровень.
+    """
+
+    KEY_PREFIX = "verdict:"
+
+    def __init__(
+        self,
+        redis_client=None,
+        ttl: int = VERDICT_CACHE_TTL,
+        local_ttl: int = VERDICT_CACHE_LOCAL_TTL,
+        max_items: int = VERDICT_CACHE_MAX_ITEMS,
+        is_available: Optional[Callable[[], bool]] = None,
+    ):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.ttl = ttl
+        self.local = TTLCache(max_items=max_items, ttl=min(local_ttl, ttl))
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    async def get(self, fingerprint: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Возвращает (ответ, уровень), где уровень — 'memory', 'redis' или None при промахе."""
+        cached = self.local.get(fingerprint)
+        if cached is not None:
+            return cached, "memory"
+
+        if self.redis is None:
+            return None, None
+        try:
+            raw = await self.redis.get(self.KEY_PREFIX + fingerprint)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"⚠️ Verdict cache: ошибка чтения из Redis: {e}")
+            return None, None
+
+        if raw is None:
+            self.redis_misses += 1
+            return None, None
+        self.redis_hits += 1
+        try:
+            value = json.loads(raw)
+        except (TypeError, ValueError):
+            return None, None
+        self.local.set(fingerprint, value)
+        return value, "redis"
+
+    async def set(self, fingerprint: str, response_data: Dict) -> None:
+        self.local.set(fingerprint, response_data)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(
+                self.KEY_PREFIX + fingerprint,
+                json.dumps(response_data, ensure_ascii=False, default=str),
+                ex=self.ttl,
+            )
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"⚠️ Verdict cache: ошибка записи в Redis: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        redis_total = self.redis_hits + self.redis_misses
+        return {
+            "ttl_seconds": self.ttl,
+            "memory": self.local.stats(),
+            "redis": {
+                "enabled": self.redis is not None,
+                "hits": self.redis_hits,
+                "misses": self.redis_misses,
+                "errors": self.redis_errors,
+                "hit_ratio": round(self.redis_hits / redis_total, 4) if redis_total else 0.0,
+            },
+        }
+
+
+class UserCache(OptionalRedis):
+    """
+    Кэш пользователя для авторизованных запросов: JWT уже содержит sub (email)
+    и id, поэтому при попадании запрос не обращается к БД вообще.
+
+    Локальный TTL LRU по user id; устаревание ограничено USER_CACHE_TTL.
+    Пока ни один эндпоинт не меняет пользователя, app не запускает start():
+    подписка в каждом worker-е только очищала бы кэш при обрывах. Эндпоинт,
+    который изменит email или удалит пользователя, должен вызвать invalidate()
+    (удаляет запись локально и публикует в Redis) и запустить start() при старте,
+    чтобы инвалидации других worker-ов доходили через pub/sub.
+    """
+
+    CHANNEL = "users:invalidate"
+
+    def __init__(self, redis_client=None, ttl: int = USER_CACHE_TTL, max_items: int = USER_CACHE_MAX_ITEMS,
+                 is_available: Optional[Callable[[], bool]] = None):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.local = TTLCache(max_items=max_items, ttl=ttl)
+        self.invalidations = 0
+        self.mismatches = 0  # id из токена есть в кэше, но email другой
+        self.served_age_total = 0.0
+        self.served_age_max = 0.0
+        self._listener = None
+
+    @staticmethod
+    def _identity(user: Dict) -> Dict:
+        # Хэш пароля в кэш не попадает
+        return {"id": user["id"], "email": user["email"]}
+
+    def get(self, user_id: int, email: str) -> Optional[Dict]:
+        entry = self.local.get_entry(user_id)
+        if entry is None:
+            return None
+        user, age = entry
+        if user["email"] != email:
+            self.mismatches += 1
+            self.local.hits -= 1
+            self.local.misses += 1
+            self.local.delete(user_id)
+            return None
+        self.served_age_total += age
+        self.served_age_max = max(self.served_age_max, age)
+        return dict(user)
+
+    def set(self, user: Dict) -> Dict:
+        identity = self._identity(user)
+        self.local.set(identity["id"], identity)
+        return dict(identity)
+
+    async def invalidate(self, user_id: int) -> None:
+        self.local.delete(user_id)
+        self.invalidations += 1
+        if self.redis is None:
+            return
+        try:
+            await self.redis.publish(self.CHANNEL, str(user_id))
+        except Exception as e:
+            logger.warning(f"⚠️ User cache: инвалидация не опубликована: {e}")
+
+    async def listen(self) -> None:
+        """Слушает инвалидации других worker-ов (запускается фоновой задачей)."""
+        while True:
+            client = self.redis
+            if client is None:  # Redis недоступен — ждем, пока фоновая проверка его вернет
+                await asyncio.sleep(1.0)
+                continue
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self.local.delete(int(message["data"]))
+                    except (TypeError, ValueError):
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ User cache: подписка на инвалидации прервана: {e}")
+                # Пока подписки нет, могли пропустить инвалидации
+                self.local.clear()
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def start(self) -> None:
+        if self._redis_client is not None and self._listener is None:
+            self._listener = asyncio.ensure_future(self.listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local.hits
+        return {
+            "ttl_seconds": self.local.ttl,
+            "memory": self.local.stats(),
+            "invalidations": self.invalidations,
+            "mismatches": self.mismatches,
+            "invalidation_channel": self._listener is not None,
+            "served_age_avg": round(self.served_age_total / hits, 3) if hits else 0.0,
+            "served_age_max": round(self.served_age_max, 3),
+        }
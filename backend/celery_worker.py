@@ -1,14 +1,46 @@
 # backend/celery_worker.py
+"""
+Отдельный процесс-worker для job API (заменяет неиспользуемый Celery).
+
+Забирает задачи из общей Redis-очереди (jobs.RedisJobStore) и выполняет их
+теми же обработчиками, что и API: вызывает startup_event из app.py
+(БД, поиск, Gemini, кэши и пул JobRunner), но не обслуживает HTTP.
+
+Запуск (из папки backend/):
+    JOB_WORKERS=8 python celery_worker.py
+API-процессы при этом можно запускать с JOB_WORKERS=0, чтобы они только
+принимали задачи.
+"""
+import asyncio
+import logging
 import os
-from celery import Celery
+import signal
+
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-celery_app = Celery(
-    "tasks",
-    broker=os.getenv("CELERY_BROKER_URL"),
-    backend=os.getenv("CELERY_BROKER_URL"),
-    # Указываем, что наши задачи находятся в модуле backend.tasks
-    include=['backend.tasks']
-)
\ No newline at end of file
+import app as api  # noqa: E402  (после load_dotenv)
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    # startup_event поднимает компоненты и запускает пул (app.state.jobs, JOB_WORKERS штук)
+    await api.startup_event()
+    state = api.app.state
+    if not state.jobs.store.distributed:
+        raise SystemExit("❌ Для отдельного worker-а нужен REDIS_URL (общая очередь задач).")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Остановка worker-а...")
+    await api.shutdown_event()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,14 +2,21 @@
 import os
 import json
 import logging
-from typing import Dict, Optional, List
-from datetime import datetime # ✅ Импортируем datetime для message_timestamp
+from typing import Dict, Optional, List, Tuple
+from datetime import datetime, timezone # ✅ Импортируем datetime для message_timestamp
 from dotenv import load_dotenv
 
 import psycopg2
 import psycopg2.extras
 import bcrypt  # безопасное хеширование
 
+try:
+    from . import partitions
+    from .db_pool import get_pool
+except ImportError:
+    import partitions
+    from db_pool import get_pool
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
@@ -25,24 +32,25 @@ class Database:
         # Fix for SQLAlchemy/psycopg2 which might expect postgresql://
         if self.db_url.startswith("postgres://"):
             self.db_url = self.db_url.replace("postgres://", "postgresql://", 1)
+        # Один пул на DSN в процессе: все экземпляры Database делят соединения
+        self.pool = get_pool(self.db_url)
 
     def _get_connection(self):
-        """Создает и возвращает новое соединение."""
-        try:
-            # Увеличим таймаут на всякий случай
-            return psycopg2.connect(self.db_url, connect_timeout=15)
-        except psycopg2.OperationalError as e:
-            logger.error(f"❌ Ошибка подключения к PostgreSQL: {e}")
-            raise RuntimeError("Соединение с базой данных недоступно.") from e
+        """
+        Соединение из общего пула процесса (см. db_pool.py).
+        При выходе из блока — commit (rollback при исключении) и возврат в пул.
+        """
+        return self.pool.connection()
+
+    def pool_stats(self) -> Dict:
+        return self.pool.stats()
 
     # -----------------------------------------------------------------------
     # ИНИЦИАЛИЗАЦИЯ ТАБЛИЦ
     # -----------------------------------------------------------------------
     def initialize(self):
         """Создает таблицы и индексы, если они не существуют."""
-        commands = (
-            # --- Существующие таблицы ---
-            """
+        users_table = """
             CREATE TABLE IF NOT EXISTS users (
                 id SERIAL PRIMARY KEY,
                 email TEXT NOT NULL UNIQUE,
@@ -51,19 +59,12 @@ class Database:
                 requests_today INTEGER DEFAULT 0,
                 last_request_date DATE DEFAULT CURRENT_DATE
             );
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS analyses (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                text TEXT NOT NULL,
-                verdict TEXT NOT NULL,
-                confidence REAL NOT NULL,
-                full_response JSONB NOT NULL,
-                created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            );
-            """,
+        """
+        # analyses и telegram_monitored_messages — секционированные (partitions.py)
+        commands = (
+            # FK на analyses нет: секционированную таблицу по одному id не сослать,
+            # голоса удаляются вместе с секцией (partitions.retire_partition);
+            # существование анализа проверяет сам INSERT (save_vote, save_votes_batch)
             """
             CREATE TABLE IF NOT EXISTS user_votes (
                 id SERIAL PRIMARY KEY,
@@ -72,50 +73,48 @@ class Database:
                 vote INTEGER NOT NULL, -- 1 = согласен, -1 = не согласен
                 created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
-                FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE CASCADE,
                 UNIQUE (user_id, analysis_id)
             );
             """,
-            # --- Новая таблица для мониторинга ---
-            """
-            CREATE TABLE IF NOT EXISTS telegram_monitored_messages (
-                id SERIAL PRIMARY KEY,
-                chat_id BIGINT NOT NULL,
-                message_id BIGINT NOT NULL,
-                user_id BIGINT, -- Может быть null в каналах
-                message_text TEXT,
-                media_type TEXT, -- 'text', 'photo'
-                url_found TEXT, -- Ссылка, если найдена
-                caption TEXT, -- Подпись к фото
-                message_timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
-                processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-                analysis_id INTEGER, -- Ссылка на результат анализа (если был)
-                status TEXT DEFAULT 'pending', -- 'pending', 'analyzed', 'ignored_no_keyword', 'ignored_no_url', 'ignored_duplicate_url', 'error_api', 'error_worker'
-                FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE SET NULL,
-                UNIQUE (chat_id, message_id) -- Гарантируем уникальность сообщений
-            );
-            """,
-             # --- Индексы ---
+             # --- Индексы (на секционированной таблице создаются во всех секциях) ---
             """
             CREATE INDEX IF NOT EXISTS idx_telegram_chat_message ON telegram_monitored_messages (chat_id, message_id);
             """,
             # ✅✅✅ ДОБАВЛЕН ИНДЕКС ДЛЯ ПРОВЕРКИ URL ✅✅✅
             """
             CREATE INDEX IF NOT EXISTS idx_telegram_url_analyzed ON telegram_monitored_messages (url_found) WHERE status = 'analyzed';
+            """,
+            # История пользователя: keyset по (created_at, id) без сортировки;
+            # verdict/confidence в индексе, text берется из строки (бывает длинным)
+            """
+            CREATE INDEX IF NOT EXISTS idx_analyses_user_created ON analyses (user_id, created_at DESC, id DESC) INCLUDE (verdict, confidence);
             """
-            # ✅✅✅ КОНЕЦ ДОБАВЛЕНИЯ ИНДЕКСА ✅✅✅
         )
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cur:
+                    # Несколько worker-ов стартуют одновременно: миграция схемы — в одном
+                    cur.execute("SELECT pg_advisory_xact_lock(%s);", (partitions.MAINTENANCE_LOCK_ID,))
+                    cur.execute(users_table)
+                    partitioned = partitions.setup(cur, today=datetime.now(timezone.utc).date())
                     for command in commands:
                         cur.execute(command)
                 conn.commit()
-                logger.info("✅ Таблицы и индексы (включая 'idx_telegram_url_analyzed') проверены/созданы.")
+                logger.info(f"✅ Таблицы и индексы проверены/созданы (секционированы: {partitioned}).")
+            self.pool.fill()
         except Exception as e:
             logger.error(f"❌ Ошибка при инициализации БД: {e}", exc_info=True)
             raise
 
+    def maintain_partitions(self) -> Dict:
+        """Секции на месяцы вперед и удаление старых (см. partitions.maintain)."""
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                report = partitions.maintain(cur)
+        if report.get("created") or report.get("retired"):
+            logger.info(f"🗂️ Обслуживание секций: {report}")
+        return report
+
     # -----------------------------------------------------------------------
     # ПОЛЬЗОВАТЕЛИ
     # -----------------------------------------------------------------------
@@ -176,28 +175,6 @@ class Database:
             logger.error(f"❌ Ошибка get_user_by_email для {email}: {e}", exc_info=True)
             return None
 
-    def get_user_status(self, user_id: int) -> Optional[Dict]:
-        """Возвращает email и текущее количество запросов пользователя."""
-        sql = """
-            WITH updated AS (
-                UPDATE users
-                SET requests_today = 0, last_request_date = CURRENT_DATE
-                WHERE id = %s AND last_request_date < CURRENT_DATE
-                RETURNING id
-            )
-            SELECT email, requests_today FROM users WHERE id = %s;
-        """
-        try:
-            with self._get_connection() as conn:
-                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                    cur.execute(sql, (user_id, user_id))
-                    row = cur.fetchone()
-                conn.commit() # Сохраняем сброс счетчика, если он произошел
-                return dict(row) if row else None
-        except Exception as e:
-            logger.error(f"❌ Ошибка get_user_status для user_id {user_id}: {e}", exc_info=True)
-            return None
-
     # -----------------------------------------------------------------------
     # АНАЛИЗЫ
     # -----------------------------------------------------------------------
@@ -217,79 +194,166 @@ class Database:
             logger.error(f"❌ Ошибка сохранения анализа для user_id {user_id}: {e}", exc_info=True)
             return None
 
-    def get_user_history(self, user_id: int, limit: int = 10) -> List[Dict]:
-        """Возвращает историю анализов."""
-        sql = "SELECT id, text, verdict, confidence, created_at, full_response FROM analyses WHERE user_id = %s ORDER BY created_at DESC LIMIT %s;"
+    def save_analyses_batch(self, rows: List[Tuple[int, str, str, float, dict]]) -> List[Optional[int]]:
+        """
+        Сохраняет несколько анализов одним multi-row INSERT.
+        rows: (user_id, text, verdict, confidence, full_response). Возвращает ID в том же порядке.
+        """
+        if not rows:
+            return []
+        sql = "INSERT INTO analyses (user_id, text, verdict, confidence, full_response) VALUES %s RETURNING id;"
+        values = [(user_id, text, verdict, confidence, json.dumps(full_response))
+                  for user_id, text, verdict, confidence, full_response in rows]
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    result = psycopg2.extras.execute_values(cur, sql, values, page_size=len(values), fetch=True)
+                conn.commit()
+            logger.info(f"✅ Сохранено {len(result)} анализов одним запросом.")
+            return [row[0] for row in result]
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного сохранения {len(rows)} анализов: {e}", exc_info=True)
+            return [None] * len(rows)
+
+    # --- Пакетная запись для write-behind (write_behind.py): ошибки пробрасываются ---
+    def reserve_analysis_ids(self, count: int) -> List[int]:
+        """Резервирует count ID из sequence таблицы analyses."""
+        sql = "SELECT nextval(pg_get_serial_sequence('analyses', 'id')) FROM generate_series(1, %s);"
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, (count,))
+                return [row[0] for row in cur.fetchall()]
+
+    def save_analyses_with_ids(self, rows: List[Tuple[int, int, str, str, float, dict]]) -> None:
+        """
+        rows: (id, user_id, text, verdict, confidence, full_response). Повтор безопасен:
+        PK секционированной таблицы — (id, created_at), поэтому уже записанный id проверяется явно.
+        """
+        sql = """
+            INSERT INTO analyses (id, user_id, text, verdict, confidence, full_response)
+            SELECT * FROM (VALUES %s) AS v (id, user_id, text, verdict, confidence, full_response)
+            WHERE NOT EXISTS (SELECT 1 FROM analyses a WHERE a.id = v.id)
+            ON CONFLICT DO NOTHING;
+        """
+        values = [(analysis_id, user_id, text, verdict, confidence, json.dumps(full_response))
+                  for analysis_id, user_id, text, verdict, confidence, full_response in rows]
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur, sql, values, template="(%s::int, %s::int, %s::text, %s::text, %s::real, %s::jsonb)",
+                    page_size=len(values))
+
+    def save_votes_batch(self, rows: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+        """
+        rows: (user_id, analysis_id, vote), без повторов пары (user_id, analysis_id).
+        Возвращает пары (user_id, analysis_id), не записанные из-за отсутствия анализа.
+        """
+        # FK на analyses нет: голос за еще не записанный анализ не вставляется
+        sql = """
+            INSERT INTO user_votes (user_id, analysis_id, vote)
+            SELECT v.user_id, v.analysis_id, v.vote FROM (VALUES %s) AS v (user_id, analysis_id, vote)
+            WHERE EXISTS (SELECT 1 FROM analyses a WHERE a.id = v.analysis_id)
+            ON CONFLICT (user_id, analysis_id) DO UPDATE SET vote = EXCLUDED.vote
+            RETURNING user_id, analysis_id;
+        """
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                written = set(psycopg2.extras.execute_values(
+                    cur, sql, rows, template="(%s::int, %s::int, %s::int)", page_size=len(rows), fetch=True))
+        return [(user_id, analysis_id) for user_id, analysis_id, _ in rows if (user_id, analysis_id) not in written]
+
+    def update_telegram_statuses_batch(self, rows: List[Tuple[int, str, Optional[int]]]) -> None:
+        """rows: (message_db_id, status, analysis_id), один UPDATE ... FROM (VALUES ...)."""
+        sql = """
+            UPDATE telegram_monitored_messages AS m
+            SET status = v.status, analysis_id = v.analysis_id, processed_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v (id, status, analysis_id)
+            WHERE m.id = v.id;
+        """
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, sql, rows, template="(%s::int, %s::text, %s::int)",
+                                               page_size=len(rows))
+
+    def get_user_history(self, user_id: int, limit: int = 20,
+                         before: Optional[Tuple[datetime, int]] = None) -> List[Dict]:
+        """
+        Страница истории анализов (без full_response), новые сверху.
+        before — (created_at, id) последней строки предыдущей страницы.
+        """
+        if before is None:
+            sql = ("SELECT id, text, verdict, confidence, created_at FROM analyses WHERE user_id = %s "
+                   "ORDER BY created_at DESC, id DESC LIMIT %s;")
+            params = (user_id, limit)
+        else:
+            sql = ("SELECT id, text, verdict, confidence, created_at FROM analyses WHERE user_id = %s "
+                   "AND (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC LIMIT %s;")
+            params = (user_id, before[0], before[1], limit)
         try:
             with self._get_connection() as conn:
                 with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                    cur.execute(sql, (user_id, limit))
+                    cur.execute(sql, params)
                     # Преобразуем строки в словари
                     return [dict(row) for row in cur.fetchall()]
         except Exception as e:
             logger.error(f"❌ Ошибка получения истории для user_id {user_id}: {e}", exc_info=True)
             return []
 
+    def get_analysis(self, user_id: int, analysis_id: int) -> Optional[Dict]:
+        """Полный анализ (с full_response), только если он принадлежит user_id."""
+        sql = ("SELECT id, text, verdict, confidence, created_at, full_response FROM analyses "
+               "WHERE id = %s AND user_id = %s;")
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute(sql, (analysis_id, user_id))
+                    row = cur.fetchone()
+                    return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения анализа {analysis_id} для user_id {user_id}: {e}", exc_info=True)
+            return None
+
+    def analysis_id_issued(self, analysis_id: int) -> Optional[bool]:
+        """
+        Анализ записан или его ID уже выдан sequence (write-behind пишет строку позже).
+        None — проверить не удалось.
+        """
+        sql = ("SELECT EXISTS (SELECT 1 FROM analyses WHERE id = %s) OR %s BETWEEN 1 AND "
+               "COALESCE(pg_sequence_last_value(pg_get_serial_sequence('analyses', 'id')::regclass), 0);")
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, (analysis_id, analysis_id))
+                    return bool(cur.fetchone()[0])
+        except Exception as e:
+            logger.error(f"❌ Ошибка проверки анализа {analysis_id}: {e}", exc_info=True)
+            return None
+
     # -----------------------------------------------------------------------
     # ГОЛОСОВАНИЯ
     # -----------------------------------------------------------------------
     def save_vote(self, user_id: int, analysis_id: int, vote: int) -> bool:
         """Сохраняет или обновляет голос пользователя за анализ."""
-        # ON CONFLICT обновляет голос, если пользователь уже голосовал за этот анализ
-        sql = "INSERT INTO user_votes (user_id, analysis_id, vote) VALUES (%s, %s, %s) ON CONFLICT (user_id, analysis_id) DO UPDATE SET vote = EXCLUDED.vote;"
+        # ON CONFLICT обновляет голос, если пользователь уже голосовал за этот анализ;
+        # WHERE EXISTS заменяет FK на секционированную analyses
+        sql = ("INSERT INTO user_votes (user_id, analysis_id, vote) SELECT %s, %s, %s "
+               "WHERE EXISTS (SELECT 1 FROM analyses WHERE id = %s) "
+               "ON CONFLICT (user_id, analysis_id) DO UPDATE SET vote = EXCLUDED.vote;")
         try:
             with self._get_connection() as conn:
                 with conn.cursor() as cur:
-                    cur.execute(sql, (user_id, analysis_id, vote))
+                    cur.execute(sql, (user_id, analysis_id, vote, analysis_id))
+                    inserted = cur.rowcount
                 conn.commit()
+            if not inserted:
+                logger.warning(f"⚠️ Голос от пользователя {user_id} за несуществующий анализ {analysis_id} отклонён.")
+                return False
             logger.info(f"✅ Голос ({vote}) от пользователя {user_id} за анализ {analysis_id} сохранён.")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения голоса ({user_id}/{analysis_id}/{vote}): {e}", exc_info=True)
             return False
 
-    # -----------------------------------------------------------------------
-    # ОГРАНИЧЕНИЕ ЗАПРОСОВ (RATE LIMITING)
-    # -----------------------------------------------------------------------
-    def check_and_update_rate_limit(self, user_id: int, limit: int = 30) -> bool:
-        """
-        Атомарно проверяет и обновляет лимит запросов для пользователя.
-        Возвращает True, если запрос разрешен, иначе False.
-        """
-        sql = """
-            UPDATE users
-            SET
-                requests_today = CASE
-                    WHEN last_request_date < CURRENT_DATE THEN 1
-                    ELSE requests_today + 1
-                END,
-                last_request_date = CURRENT_DATE
-            WHERE id = %s
-            RETURNING requests_today;
-        """
-
-        try:
-            with self._get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(sql, (user_id,))
-                    result = cur.fetchone()
-                    conn.commit() # Сохраняем изменения (счетчик запросов)
-
-                    if not result:
-                        logger.warning(f"Попытка проверить лимит для несуществующего user_id: {user_id}")
-                        return False
-
-                    new_requests_count = result[0]
-
-                    if new_requests_count > limit:
-                        logger.warning(f"Превышен лимит ({limit}) для user_id {user_id}. Текущий счет: {new_requests_count}.")
-                        return False
-
-            return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка при проверке лимита запросов для user_id {user_id}: {e}", exc_info=True)
-            return False
-
     # -----------------------------------------------------------------------
     # TELEGRAM МОНИТОРИНГ
     # -----------------------------------------------------------------------
@@ -305,7 +369,7 @@ class Database:
             INSERT INTO telegram_monitored_messages
             (chat_id, message_id, user_id, message_text, media_type, url_found, caption, message_timestamp, status)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (chat_id, message_id) DO NOTHING -- Не перезаписывать, если уже есть
+            ON CONFLICT DO NOTHING -- Не перезаписывать, если уже есть (UNIQUE chat_id, message_id[, message_timestamp])
             RETURNING id;
         """
         try:
@@ -0,0 +1,271 @@
+# backend/db_pool.py
+"""
+Пул соединений PostgreSQL (psycopg2) для Database.
+
+- min/max размер, ожидание свободного соединения с таймаутом;
+- проверка соединения при выдаче (закрытое/сломанное отбрасывается,
+  простаивавшее дольше DB_POOL_CHECK_IDLE проверяется SELECT 1);
+- максимальное время жизни соединения;
+- метрики ожидания (сколько раз ждали, суммарное/максимальное время, таймауты).
+
+Пулы регистрируются на уровне модуля по DSN, поэтому API, telegram_worker.py
+и tasks.py в одном процессе используют одно и то же множество соединений.
+После fork (gunicorn --preload) дочерний процесс создает собственный пул.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # ожидание свободного соединения
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 30 * 60))
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 5))  # SELECT 1, если соединение простаивало дольше
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 15))
+
+
+class PoolTimeoutError(RuntimeError):
+    """Не удалось получить соединение из пула за DB_POOL_TIMEOUT (пул исчерпан)."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений psycopg2."""
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        timeout: float = DB_POOL_TIMEOUT,
+        max_lifetime: float = DB_POOL_MAX_LIFETIME,
+        check_idle: float = DB_POOL_CHECK_IDLE,
+        connect_timeout: int = DB_CONNECT_TIMEOUT,
+        connect: Optional[Callable[[], Any]] = None,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.connect_timeout = connect_timeout
+        self._connect_factory = connect or (lambda: psycopg2.connect(self.dsn, connect_timeout=self.connect_timeout))
+        self._idle: List[_PooledConnection] = []
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._opening = 0  # соединения, которые сейчас открываются (считаются в размер пула)
+        self._cond = threading.Condition()
+        self.counters = {
+            "checkouts": 0, "created": 0, "closed_lifetime": 0, "closed_broken": 0,
+            "waits": 0, "wait_time_total": 0.0, "wait_time_max": 0.0, "timeouts": 0,
+        }
+
+    # --- создание / закрытие ---
+    def _connect(self) -> _PooledConnection:
+        try:
+            conn = self._connect_factory()
+        except psycopg2.OperationalError as e:
+            logger.error(f"❌ Ошибка подключения к PostgreSQL: {e}")
+            raise RuntimeError("Соединение с базой данных недоступно.") from e
+        self.counters["created"] += 1
+        return _PooledConnection(conn)
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def fill(self) -> None:
+        """Открывает соединения до min_size (вызывается при старте)."""
+        while True:
+            with self._cond:
+                if self._size() >= self.min_size:
+                    return
+                self._opening += 1
+            try:
+                pooled = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    # --- проверки ---
+    def _expired(self, pooled: _PooledConnection, now: float) -> bool:
+        return self.max_lifetime > 0 and now - pooled.created_at > self.max_lifetime
+
+    def _healthy(self, pooled: _PooledConnection, now: float) -> bool:
+        conn = pooled.conn
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - pooled.last_used < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # --- выдача / возврат ---
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            pooled = None
+            with self._cond:
+                while not self._idle and self._size() >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["timeouts"] += 1
+                        self._record_wait(started)
+                        raise PoolTimeoutError("Соединение с базой данных недоступно (пул исчерпан).")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    pooled = self._idle.pop()  # LIFO: самые "теплые" соединения
+                else:
+                    self._opening += 1
+
+            if pooled is None:
+                try:
+                    pooled = self._connect()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        self._cond.notify()
+            else:
+                now = time.monotonic()
+                if self._expired(pooled, now) or not self._healthy(pooled, now):
+                    key = "closed_lifetime" if self._expired(pooled, now) else "closed_broken"
+                    self.counters[key] += 1
+                    self._close_quietly(pooled.conn)
+                    with self._cond:
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._in_use[id(pooled.conn)] = pooled
+                self.counters["checkouts"] += 1
+                if waited:
+                    self._record_wait(started)
+            return pooled.conn
+
+    def _record_wait(self, started: float) -> None:
+        elapsed = time.monotonic() - started
+        self.counters["waits"] += 1
+        self.counters["wait_time_total"] += elapsed
+        self.counters["wait_time_max"] = max(self.counters["wait_time_max"], elapsed)
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            self._close_quietly(conn)
+            return
+
+        now = time.monotonic()
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed or self._expired(pooled, now):
+            self.counters["closed_lifetime" if not discard and not conn.closed else "closed_broken"] += 1
+            self._close_quietly(conn)
+        else:
+            pooled.last_used = now
+            with self._cond:
+                self._idle.append(pooled)
+        with self._cond:
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение из пула: commit при успешном выходе, rollback при исключении,
+        затем возврат в пул (сломанные соединения закрываются).
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            broken = conn.closed
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            self.putconn(conn, discard=broken)
+            raise
+        else:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._close_quietly(pooled.conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle, in_use = len(self._idle), len(self._in_use)
+        waits = self.counters["waits"]
+        return {
+            **{k: (round(v, 4) if isinstance(v, float) else v) for k, v in self.counters.items()},
+            "idle": idle,
+            "in_use": in_use,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "wait_time_avg": round(self.counters["wait_time_total"] / waits, 4) if waits else 0.0,
+        }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_pid: Optional[int] = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: str, **kwargs: Any) -> ConnectionPool:
+    """Общий пул для DSN в текущем процессе."""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # После fork соединения родителя использовать нельзя
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(dsn, **kwargs)
+            _pools[dsn] = pool
+        return pool
@@ -0,0 +1,392 @@
+# backend/gemini_client.py
+"""
+Общий слой выполнения запросов к Gemini.
+
+Все эндпоинты (/analyze, /analyze_url, /analyze_image) вызывают модели через
+GeminiExecutor, который дает:
+- ограничение параллелизма (семафор + ограничение очереди);
+- повторы с экспоненциальной задержкой и jitter;
+- circuit breaker на каждую модель: если основная модель деградировала,
+  запрос сразу уходит на fallback-модель;
+- общий дедлайн на вызов (включая ожидание в очереди и повторы).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    NON_RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+        google_exceptions.InvalidArgument,
+        google_exceptions.PermissionDenied,
+        google_exceptions.Unauthenticated,
+    )
+except ImportError:
+    NON_RETRYABLE_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", 64))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", 0.5))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", 8.0))
+GEMINI_CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", 25.0))
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", 45.0))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", 30.0))
+GEMINI_STREAM_MAX_CHARS = int(os.getenv("GEMINI_STREAM_MAX_CHARS", 64 * 1024))
+
+
+class GeminiError(Exception):
+    """Базовая ошибка слоя Gemini."""
+
+
+class GeminiUnavailableError(GeminiError):
+    """Все модели недоступны (circuit breaker, перегрузка, дедлайн или ошибки API)."""
+
+
+class GeminiResponseError(GeminiError):
+    """Модель ответила, но ответ не удалось разобрать по схеме."""
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker: closed -> open после N ошибок подряд,
+    open -> half_open через reset_timeout (пропускается одна пробная попытка).
+    """
+
+    def __init__(self, threshold: int = GEMINI_BREAKER_THRESHOLD, reset_timeout: float = GEMINI_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"⚡ Circuit breaker OPEN ({self.consecutive_failures} ошибок подряд)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Пробная попытка не состоялась (например, отказ очереди) — не считаем ее результатом."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class GeminiExecutor:
+    """
+    Выполняет generate_content_async с лимитами, повторами, breaker-ом и дедлайном.
+    models: {"text": ..., "vision": ..., "fallback": ...} — объекты genai.GenerativeModel.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, Any],
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        max_queue: int = GEMINI_MAX_QUEUE,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        backoff_base: float = GEMINI_BACKOFF_BASE,
+        backoff_max: float = GEMINI_BACKOFF_MAX,
+        call_timeout: float = GEMINI_CALL_TIMEOUT,
+        deadline: float = GEMINI_DEADLINE,
+    ):
+        self.models = {kind: model for kind, model in models.items() if model is not None}
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.call_timeout = call_timeout
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.counters = {"calls": 0, "successes": 0, "retries": 0, "failures": 0,
+                         "fallbacks": 0, "rejected": 0, "deadline_exceeded": 0}
+
+    @staticmethod
+    def model_name(model: Any) -> str:
+        return getattr(model, "model_name", None) or "gemini"
+
+    def breaker_for(self, model: Any) -> CircuitBreaker:
+        # Один breaker на имя модели: text и vision используют одну и ту же модель
+        name = self.model_name(model)
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker()
+        return self.breakers[name]
+
+    def has(self, kind: str) -> bool:
+        return kind in self.models
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: случайная задержка от 0 до base * 2^attempt
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @asynccontextmanager
+    async def _slot(self, timeout: float):
+        """Занимает место в семафоре (не дольше timeout) с учетом лимита очереди."""
+        if self._waiting >= self.max_queue:
+            self.counters["rejected"] += 1
+            self.counters["failures"] += 1
+            raise GeminiUnavailableError("Очередь запросов к Gemini переполнена")
+
+        # wait_for(acquire()) до Python 3.12 может потерять место, если acquire
+        # завершился одновременно с таймаутом или отменой: ждем через shield
+        # и сами возвращаем место, если оно досталось уже прерванному ожиданию
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(acquire), timeout=timeout)
+        except BaseException as e:
+            if acquire.done() and not acquire.cancelled():
+                self._semaphore.release()
+            else:
+                acquire.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["rejected"] += 1
+                self.counters["failures"] += 1
+                raise GeminiUnavailableError("Превышено время ожидания в очереди Gemini") from None
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def _call_once(self, model: Any, contents: Any, generation_config: Optional[Dict], timeout: float):
+        async with self._slot(timeout):
+            kwargs = {"generation_config": generation_config} if generation_config else {}
+            return await asyncio.wait_for(model.generate_content_async(contents, **kwargs), timeout=timeout)
+
+    def _candidates(self, kind: str, use_fallback: bool) -> List[Any]:
+        candidates = [self.models[kind]] if kind in self.models else []
+        if use_fallback and "fallback" in self.models and self.models["fallback"] not in candidates:
+            candidates.append(self.models["fallback"])
+        if not candidates:
+            raise GeminiUnavailableError(f"Модель '{kind}' не настроена")
+        return candidates
+
+    async def generate(
+        self,
+        kind: str,
+        contents: Any,
+        response_model: Optional[Type[BaseModel]] = None,
+        generation_config: Optional[Dict] = None,
+        deadline: Optional[float] = None,
+        use_fallback: bool = True,
+    ) -> Tuple[Any, str]:
+        """
+        Вызывает модель `kind` (затем fallback) и возвращает (результат, имя модели).
+        Если задан response_model, результат — провалидированный объект схемы,
+        иначе — сырой ответ Gemini.
+        """
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        budget = self.deadline if deadline is None else deadline
+        candidates = self._candidates(kind, use_fallback)
+
+        last_error: Optional[BaseException] = None
+        for index, model in enumerate(candidates):
+            name = self.model_name(model)
+            breaker = self.breaker_for(model)
+            if index > 0:
+                self.counters["fallbacks"] += 1
+                logger.warning(f"Эскалация на fallback-модель {name}")
+
+            for attempt in range(self.max_retries):
+                remaining = budget - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.counters["deadline_exceeded"] += 1
+                    self.counters["failures"] += 1
+                    raise GeminiUnavailableError(f"Дедлайн Gemini ({budget:.0f}s) исчерпан") from last_error
+                if not breaker.allow():
+                    logger.warning(f"Circuit breaker для {name} открыт — пропускаем модель")
+                    break
+
+                try:
+                    response = await self._call_once(model, contents, generation_config, min(self.call_timeout, remaining))
+                except GeminiUnavailableError:
+                    breaker.release_probe()
+                    raise
+                except asyncio.CancelledError:
+                    breaker.release_probe()  # вызывающий отменен — это не ошибка модели
+                    raise
+                except NON_RETRYABLE_ERRORS as e:
+                    breaker.record_success()  # модель жива, ошибка в запросе
+                    self.counters["failures"] += 1
+                    raise GeminiError(f"Gemini отклонил запрос: {e}") from e
+                except Exception as e:
+                    last_error = e
+                    breaker.record_failure()
+                    logger.error(f"...{name} попытка {attempt + 1} НЕ УДАЛАСЬ (API): {e!r}")
+                else:
+                    breaker.record_success()
+                    if response_model is None:
+                        self.counters["successes"] += 1
+                        return response, name
+                    try:
+                        parsed = response_model.model_validate_json(response.text)
+                        self.counters["successes"] += 1
+                        return parsed, name
+                    except (ValidationError, json.JSONDecodeError, ValueError) as p_err:
+                        last_error = GeminiResponseError(str(p_err))
+                        logger.error(f"...{name} попытка {attempt + 1}: ошибка парсинга JSON: {p_err}")
+
+                if attempt < self.max_retries - 1:
+                    self.counters["retries"] += 1
+                    delay = min(self._backoff(attempt), max(0.0, budget - (time.monotonic() - started)))
+                    await asyncio.sleep(delay)
+
+        self.counters["failures"] += 1
+        if isinstance(last_error, GeminiResponseError):
+            raise last_error
+        raise GeminiUnavailableError(f"Все модели Gemini недоступны: {last_error!r}") from last_error
+
+    async def stream(
+        self,
+        kind: str,
+        contents: Any,
+        generation_config: Optional[Dict] = None,
+        deadline: Optional[float] = None,
+        use_fallback: bool = True,
+        max_chars: int = GEMINI_STREAM_MAX_CHARS,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Потоковый вызов (stream=True): отдает (фрагмент текста, имя модели).
+        Повторы и переход на fallback возможны только до первого фрагмента —
+        после него клиент уже видел частичный ответ, и ошибка пробрасывается.
+        Суммарный размер ответа ограничен max_chars.
+        """
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        budget = self.deadline if deadline is None else deadline
+        kwargs = {"generation_config": generation_config} if generation_config else {}
+
+        def remaining() -> float:
+            left = budget - (time.monotonic() - started)
+            if left <= 0:
+                self.counters["deadline_exceeded"] += 1
+                self.counters["failures"] += 1
+                raise GeminiUnavailableError(f"Дедлайн Gemini ({budget:.0f}s) исчерпан")
+            return left
+
+        last_error: Optional[BaseException] = None
+        for index, model in enumerate(self._candidates(kind, use_fallback)):
+            name = self.model_name(model)
+            breaker = self.breaker_for(model)
+            if index > 0:
+                self.counters["fallbacks"] += 1
+                logger.warning(f"Эскалация (stream) на fallback-модель {name}")
+
+            for attempt in range(self.max_retries):
+                timeout = min(self.call_timeout, remaining())
+                if not breaker.allow():
+                    logger.warning(f"Circuit breaker для {name} открыт — пропускаем модель")
+                    break
+
+                emitted = 0
+                try:
+                    async with self._slot(timeout):
+                        response = await asyncio.wait_for(
+                            model.generate_content_async(contents, stream=True, **kwargs), timeout=timeout
+                        )
+                        chunks = response.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=min(self.call_timeout, remaining()))
+                            except StopAsyncIteration:
+                                break
+                            try:
+                                text = chunk.text
+                            except (ValueError, AttributeError):
+                                continue  # фрагмент без текста (например, только метаданные)
+                            if not text:
+                                continue
+                            emitted += len(text)
+                            if emitted > max_chars:
+                                raise GeminiResponseError(f"Потоковый ответ превысил {max_chars} символов")
+                            yield text, name
+                except GeminiUnavailableError:
+                    breaker.release_probe()
+                    raise
+                except GeminiResponseError:
+                    breaker.record_success()
+                    self.counters["failures"] += 1
+                    raise
+                except (GeneratorExit, asyncio.CancelledError):
+                    breaker.release_probe()  # клиент отключился — это не ошибка модели
+                    raise
+                except NON_RETRYABLE_ERRORS as e:
+                    breaker.record_success()
+                    self.counters["failures"] += 1
+                    raise GeminiError(f"Gemini отклонил запрос: {e}") from e
+                except Exception as e:
+                    last_error = e
+                    breaker.record_failure()
+                    logger.error(f"...{name} (stream) попытка {attempt + 1} НЕ УДАЛАСЬ: {e!r}")
+                    if emitted:
+                        self.counters["failures"] += 1
+                        raise GeminiUnavailableError(f"Поток Gemini прерван: {e!r}") from e
+                else:
+                    breaker.record_success()
+                    self.counters["successes"] += 1
+                    return
+
+                if attempt < self.max_retries - 1:
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(min(self._backoff(attempt), max(0.0, budget - (time.monotonic() - started))))
+
+        self.counters["failures"] += 1
+        raise GeminiUnavailableError(f"Все модели Gemini недоступны: {last_error!r}") from last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "breakers": {name: b.snapshot() for name, b in self.breakers.items()},
+        }
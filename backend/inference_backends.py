@@ -0,0 +1,193 @@
+# backend/inference_backends.py
+"""
+Подключаемые бэкенды инференса для FakeNewsDetector (CPU-узлы).
+
+INFERENCE_BACKEND:
+- "torch" — исходная модель PyTorch в полной точности (по умолчанию);
+- "int8"  — динамическая INT8-квантизация nn.Linear (torch.quantization.quantize_dynamic):
+            веса Linear в 4 раза меньше, без внешних зависимостей;
+- "onnx"  — экспорт в ONNX (кэш в ONNX_CACHE_DIR) и onnxruntime с полной
+            оптимизацией графа; onnxruntime — опциональная зависимость.
+
+Каждый бэкенд — вызываемый объект runner(**inputs) -> logits (torch.Tensor, CPU)
+с атрибутом config (id2label/label2id из HF-конфига), поэтому predict и
+rank_sources_nli возвращают те же словари при любом бэкенде. Если выбранный
+бэкенд не поднялся (нет onnxruntime, экспорт упал), используется "torch".
+
+Потоки: INFERENCE_INTRA_OP_THREADS / INFERENCE_INTER_OP_THREADS (0 — по
+умолчанию рантайма). Под gunicorn -w 4 intra-op стоит делить ядра на воркеры.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import torch
+
+try:
+    import onnxruntime
+except ImportError:  # onnxruntime — опциональная зависимость
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+INFERENCE_INTRA_OP_THREADS = int(os.getenv("INFERENCE_INTRA_OP_THREADS", 0))
+INFERENCE_INTER_OP_THREADS = int(os.getenv("INFERENCE_INTER_OP_THREADS", 0))
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", "backend/models/onnx")
+ONNX_OPSET = int(os.getenv("ONNX_OPSET", 14))
+
+
+def configure_threads(intra: int = INFERENCE_INTRA_OP_THREADS, inter: int = INFERENCE_INTER_OP_THREADS) -> None:
+    """Потоки PyTorch для torch/int8 (onnxruntime настраивается в SessionOptions)."""
+    if intra > 0:
+        torch.set_num_threads(intra)
+    if inter > 0:
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError as e:  # можно задать только до первого параллельного вызова
+            logger.warning(f"⚠️ Не удалось задать inter-op потоки PyTorch: {e}")
+
+
+class TorchRunner:
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+        self.config = model.config
+
+    def __call__(self, **inputs) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(**inputs).logits
+
+
+class QuantizedRunner(TorchRunner):
+    name = "int8"
+
+    def __init__(self, model):
+        quantized = torch.quantization.quantize_dynamic(model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8)
+        quantized.eval()
+        super().__init__(quantized)
+
+
+class OnnxRunner:
+    name = "onnx"
+
+    def __init__(self, onnx_path: str, config,
+                 intra: int = INFERENCE_INTRA_OP_THREADS, inter: int = INFERENCE_INTER_OP_THREADS):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime не установлен.")
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra > 0:
+            options.intra_op_num_threads = intra
+        if inter > 0:
+            options.inter_op_num_threads = inter
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.config = config
+        self.path = onnx_path
+
+    def __call__(self, **inputs) -> torch.Tensor:
+        feed = {name: inputs[name].cpu().numpy() for name in self.input_names if name in inputs}
+        return torch.from_numpy(self.session.run(["logits"], feed)[0])
+
+
+def cache_path_for(model_id: str, cache_dir: str, suffix: str) -> str:
+    """backend/models/truthlens_kk_model -> <cache>/truthlens_kk_model<suffix>; joeddav/x -> <cache>/joeddav__x<suffix>."""
+    name = os.path.basename(model_id.rstrip("/\\")) if os.path.isdir(model_id) else model_id.replace("/", "__")
+    return os.path.join(cache_dir, f"{name}{suffix}")
+
+
+def onnx_path_for(model_id: str, cache_dir: str = ONNX_CACHE_DIR) -> str:
+    return cache_path_for(model_id, cache_dir, ".onnx")
+
+
+def export_onnx(model, tokenizer, path: str, pair: bool = False) -> str:
+    """Экспорт классификатора в ONNX с динамическими осями batch/sequence."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sample = ("Пример текста для экспорта.", "Пример гипотезы.") if pair else ("Пример текста для экспорта.",)
+    dummy = dict(tokenizer(*sample, return_tensors="pt"))
+    input_names = list(dummy.keys())
+    started = time.monotonic()
+    torch.onnx.export(
+        model.to("cpu"),
+        (dummy,),  # dict последним элементом — именованные аргументы forward
+        path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, "logits": {0: "batch"}},
+        opset_version=ONNX_OPSET,
+    )
+    logger.info(f"✅ ONNX экспорт {path} за {time.monotonic() - started:.1f} с")
+    return path
+
+
+def load_runner(model, tokenizer, model_id: str, backend: str = INFERENCE_BACKEND, pair: bool = False):
+    """
+    Обертка над загруженной моделью PyTorch для выбранного бэкенда.
+    Для "onnx" модель экспортируется один раз (если в кэше нет файла),
+    после чего ссылку на модель PyTorch можно отпустить.
+    """
+    if backend not in BACKENDS:
+        logger.warning(f"⚠️ Неизвестный INFERENCE_BACKEND '{backend}', используется torch.")
+        backend = "torch"
+    try:
+        if backend == "int8":
+            return QuantizedRunner(model)
+        if backend == "onnx":
+            if onnxruntime is None:
+                raise RuntimeError("onnxruntime не установлен.")
+            path = onnx_path_for(model_id)
+            if not os.path.exists(path):
+                export_onnx(model, tokenizer, path, pair=pair)
+            return OnnxRunner(path, model.config)
+    except Exception as e:
+        logger.error(f"❌ Бэкенд '{backend}' для {model_id} недоступен, используется torch: {e}", exc_info=True)
+    return TorchRunner(model)
+
+
+def runner_bytes(runner) -> int:
+    """
+    Резидентный размер весов: параметры и буферы модели PyTorch
+    (у int8 — упакованные веса квантованных Linear), у ONNX — размер файла модели.
+    """
+    if isinstance(runner, tuple):  # (runner, tokenizer) из реестра моделей
+        runner = runner[0]
+    if isinstance(runner, OnnxRunner):
+        return os.path.getsize(runner.path)
+    model = getattr(runner, "model", runner)
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    total = sum(t.numel() * t.element_size() for t in model.parameters())
+    total += sum(t.numel() * t.element_size() for t in model.buffers())
+    # Веса квантованных Linear не параметры, а packed params — берем из state_dict
+    for key, value in model.state_dict().items():
+        if key.endswith("_packed_params._packed_params") and isinstance(value, tuple):
+            total += sum(t.numel() * t.element_size() for t in value if isinstance(t, torch.Tensor))
+    return total
+
+
+def compare_probabilities(reference: Sequence[Sequence[float]], candidate: Sequence[Sequence[float]]) -> Dict[str, Optional[float]]:
+    """
+    Паритет двух бэкендов на одних и тех же входах: доля совпавших argmax
+    и максимальное/среднее абсолютное расхождение вероятностей.
+    """
+    if len(reference) != len(candidate):
+        raise ValueError("Разное число строк у reference и candidate.")
+    if not reference:
+        return {"n": 0, "label_agreement": None, "max_abs_diff": None, "mean_abs_diff": None}
+    agree = 0
+    diffs: List[float] = []
+    for ref_row, cand_row in zip(reference, candidate):
+        ref_row, cand_row = list(ref_row), list(cand_row)
+        agree += ref_row.index(max(ref_row)) == cand_row.index(max(cand_row))
+        diffs.extend(abs(a - b) for a, b in zip(ref_row, cand_row))
+    return {
+        "n": len(reference),
+        "label_agreement": round(agree / len(reference), 4),
+        "max_abs_diff": round(max(diffs), 6),
+        "mean_abs_diff": round(sum(diffs) / len(diffs), 6),
+    }
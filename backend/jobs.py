@@ -0,0 +1,363 @@
+# backend/jobs.py
+"""
+Асинхронные задачи (job API): POST /jobs сразу возвращает id, работа
+выполняется пулом фоновых worker-ов, результат забирается через
+GET /jobs/{id} или доставляется на callback URL.
+
+Хранилище: Redis (очередь-список + JSON-запись задачи с TTL), чтобы задачи
+мог забирать любой процесс — API-воркер или отдельный `celery_worker.py`.
+Без Redis используется in-memory хранилище (только внутри процесса).
+
+Worker забирает id через BLMOVE в список jobs:processing (Redis >= 6.2) и
+убирает его оттуда (ack) только после сохранения результата. Если процесс
+упал посреди задачи, reaper (в каждом JobRunner, раз в JOB_REAP_INTERVAL)
+находит id, висящие в processing дольше JOB_STALE_AFTER, и возвращает их в
+очередь; после JOB_MAX_ATTEMPTS попыток задача помечается failed.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+try:
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 120))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 60 * 60 * 24))
+JOB_MEMORY_MAX = int(os.getenv("JOB_MEMORY_MAX", 10000))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", 10))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", 3))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", JOB_TIMEOUT + 60))  # > JOB_TIMEOUT: живой worker успеет
+JOB_REAP_INTERVAL = float(os.getenv("JOB_REAP_INTERVAL", 30))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+# Возврат в очередь только если id еще в processing (reaper-ов несколько — вернет один);
+# запись задачи обновляется в том же вызове, до того как id увидит worker
+_REQUEUE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[3])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+return 1
+"""
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def new_job(kind: str, payload: Dict[str, Any], callback_url: Optional[str] = None,
+            owner_id: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",  # queued -> running -> succeeded | failed
+        "payload": payload,
+        "callback_url": callback_url,
+        "owner_id": owner_id,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+
+
+class MemoryJobStore:
+    """Хранилище задач внутри процесса (fallback без Redis)."""
+
+    distributed = False
+
+    def __init__(self, max_items: int = JOB_MEMORY_MAX, ttl: int = JOB_RESULT_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Создаем лениво, чтобы очередь принадлежала работающему event loop-у
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def _prune(self) -> None:
+        # Вытесняем самые старые завершенные задачи; незавершенные не трогаем
+        if len(self._jobs) <= self.max_items:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_items:
+                break
+            if self._jobs[job_id]["finished_at"] is not None:
+                del self._jobs[job_id]
+
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+        self._prune()
+        self.queue.put_nowait(job["id"])
+
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job["finished_at"] is not None and time.time() - job["finished_at"] > self.ttl:
+            del self._jobs[job_id]
+            return None
+        return dict(job)
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+
+    async def ack(self, job_id: str) -> None:
+        pass  # задачи живут в процессе: упал процесс — пропали и они
+
+    async def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+
+class RedisJobStore(OptionalRedis):
+    """Хранилище задач в Redis: общая очередь для всех процессов."""
+
+    distributed = True
+    QUEUE_KEY = "jobs:queue"
+    PROCESSING_KEY = "jobs:processing"
+    CLAIMED_KEY = "jobs:claimed"  # ZSET: id -> время, когда id попал в processing
+    JOB_PREFIX = "job:"
+
+    def __init__(self, redis_client, ttl: int = JOB_RESULT_TTL, is_available: Optional[Callable[[], bool]] = None):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.is_available = is_available
+
+    def _client(self):
+        # Пока Redis недоступен — сразу ошибка, а не таймаут подключения
+        client = self.redis
+        if client is None:
+            raise ConnectionError("Redis недоступен.")
+        return client
+
+    async def enqueue(self, job: Dict[str, Any]) -> None:
+        pipe = self._client().pipeline()
+        pipe.set(self.JOB_PREFIX + job["id"], json.dumps(job, ensure_ascii=False, default=str), ex=self.ttl)
+        pipe.lpush(self.QUEUE_KEY, job["id"])
+        await pipe.execute()
+
+    async def dequeue(self, timeout: float) -> Optional[str]:
+        client = self._client()
+        job_id = await client.blmove(self.QUEUE_KEY, self.PROCESSING_KEY, max(1, int(timeout)), src="RIGHT", dest="LEFT")
+        if job_id:
+            await client.zadd(self.CLAIMED_KEY, {job_id: time.time()})
+        return job_id
+
+    async def ack(self, job_id: str) -> None:
+        pipe = self._client().pipeline()
+        pipe.lrem(self.PROCESSING_KEY, 1, job_id)
+        pipe.zrem(self.CLAIMED_KEY, job_id)
+        await pipe.execute()
+
+    async def requeue_stale(self, stale_after: float = JOB_STALE_AFTER,
+                            max_attempts: int = JOB_MAX_ATTEMPTS) -> Dict[str, int]:
+        """Задачи, которые дольше stale_after в processing (worker упал), — снова в очередь или в failed."""
+        client = self._client()
+        reaped = {"requeued": 0, "abandoned": 0}
+        job_ids = await client.lrange(self.PROCESSING_KEY, 0, -1)
+        if not job_ids:
+            return reaped
+        now = time.time()
+        # id без отметки (процесс упал между BLMOVE и ZADD) — отсчет с текущего момента
+        await client.zadd(self.CLAIMED_KEY, {job_id: now for job_id in job_ids}, nx=True)
+        claimed_at = await client.zmscore(self.CLAIMED_KEY, job_ids)
+        for job_id, since in zip(job_ids, claimed_at):
+            if since is None or now - since < stale_after:
+                continue
+            job = await self.get(job_id)
+            if job is None or job["finished_at"] is not None:
+                await self.ack(job_id)  # истекла или результат сохранен, а ack не дошел
+                continue
+            attempts = job.get("attempts", 0) + 1
+            if attempts >= max_attempts:
+                job.update(status="failed", attempts=attempts, finished_at=now,
+                           error={"status_code": 500, "detail": "Задача прервана: worker остановился."})
+                await self.save(job)
+                await self.ack(job_id)
+                reaped["abandoned"] += 1
+                logger.error(f"❌ Задача {job_id} брошена после {attempts} попыток.")
+                continue
+            job.update(status="queued", started_at=None, attempts=attempts)
+            moved = await client.eval(_REQUEUE_SCRIPT, 3, self.PROCESSING_KEY, self.QUEUE_KEY, self.JOB_PREFIX + job_id,
+                                      job_id, json.dumps(job, ensure_ascii=False, default=str), self.ttl)
+            await client.zrem(self.CLAIMED_KEY, job_id)
+            if moved:
+                reaped["requeued"] += 1
+                logger.warning(f"♻️ Задача {job_id} возвращена в очередь (попытка {attempts + 1}).")
+        return reaped
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._client().get(self.JOB_PREFIX + job_id)
+        return json.loads(raw) if raw else None
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        await self._client().set(self.JOB_PREFIX + job["id"], json.dumps(job, ensure_ascii=False, default=str), ex=self.ttl)
+
+    async def queue_depth(self) -> int:
+        return await self._client().llen(self.QUEUE_KEY)
+
+
+class JobRunner:
+    """
+    Пул фоновых worker-ов: забирает id из очереди, вызывает обработчик по kind
+    (с таймаутом JOB_TIMEOUT), сохраняет результат и дергает callback.
+    """
+
+    def __init__(self, store, handlers: Dict[str, JobHandler], workers: int = JOB_WORKERS,
+                 timeout: float = JOB_TIMEOUT, poll_timeout: float = 1.0,
+                 reap_interval: float = JOB_REAP_INTERVAL, stale_after: float = JOB_STALE_AFTER):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.timeout = timeout
+        self.poll_timeout = poll_timeout
+        self.reap_interval = reap_interval
+        self.stale_after = stale_after
+        self._tasks: List[asyncio.Task] = []
+        self._reaper: Optional[asyncio.Task] = None
+        self._callbacks: set = set()
+        self._stopping = False
+        self._http: Optional[httpx.AsyncClient] = None
+        self.counters = {"submitted": 0, "succeeded": 0, "failed": 0, "callbacks_sent": 0, "callbacks_failed": 0,
+                         "requeued": 0, "abandoned": 0}
+
+    async def submit(self, kind: str, payload: Dict[str, Any], callback_url: Optional[str] = None,
+                     owner_id: Optional[int] = None) -> Dict[str, Any]:
+        if kind not in self.handlers:
+            raise ValueError(f"Неизвестный тип задачи: {kind}")
+        job = new_job(kind, payload, callback_url, owner_id)
+        await self.store.enqueue(job)
+        self.counters["submitted"] += 1
+        return job
+
+    def start(self) -> None:
+        self._stopping = False
+        for i in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker(i)))
+        if hasattr(self.store, "requeue_stale") and self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap())
+        logger.info(f"✅ Job runner: {self.workers} worker(s), store={type(self.store).__name__}")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._callbacks, *([self._reaper] if self._reaper else []),
+                             return_exceptions=True)
+        self._tasks.clear()
+        self._reaper = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _worker(self, number: int) -> None:
+        while not self._stopping:
+            try:
+                job_id = await self.store.dequeue(self.poll_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Job worker {number}: ошибка очереди: {e}")
+                await asyncio.sleep(self.poll_timeout)
+                continue
+            if job_id:
+                try:
+                    await self.run_job(job_id)
+                    await self.store.ack(job_id)
+                except Exception as e:
+                    # Без ack задача останется в processing, и reaper вернет ее в очередь
+                    logger.error(f"❌ Job worker {number}: задача {job_id} не сохранена: {e}", exc_info=True)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                reaped = await self.store.requeue_stale(self.stale_after)
+                self.counters["requeued"] += reaped["requeued"]
+                self.counters["abandoned"] += reaped["abandoned"]
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Job reaper: {e}")
+
+    async def run_job(self, job_id: str) -> None:
+        job = await self.store.get(job_id)
+        if job is None or job["status"] != "queued":
+            return  # истекла или уже обработана
+        job.update(status="running", started_at=time.time())
+        await self.store.save(job)
+
+        try:
+            result = await asyncio.wait_for(self.handlers[job["kind"]](job), timeout=self.timeout)
+            job.update(status="succeeded", result=result)
+            self.counters["succeeded"] += 1
+        except asyncio.TimeoutError:
+            job.update(status="failed", error={"status_code": 504, "detail": "Превышено время выполнения задачи."})
+            self.counters["failed"] += 1
+        except Exception as e:
+            status_code = getattr(e, "status_code", 500)
+            detail = getattr(e, "detail", None) or "Внутренняя ошибка."
+            if status_code >= 500:
+                logger.error(f"❌ Задача {job_id} ({job['kind']}) упала: {e!r}")
+            job.update(status="failed", error={"status_code": status_code, "detail": detail})
+            self.counters["failed"] += 1
+        job["finished_at"] = time.time()
+        await self.store.save(job)
+
+        if job.get("callback_url"):
+            task = asyncio.ensure_future(self._deliver_callback(job))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _deliver_callback(self, job: Dict[str, Any]) -> None:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT)
+        body = public_view(job)
+        for attempt in range(JOB_CALLBACK_RETRIES):
+            try:
+                response = await self._http.post(job["callback_url"], json=body)
+                if response.status_code < 500:
+                    self.counters["callbacks_sent"] += 1
+                    return
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️ Callback для задачи {job['id']} не доставлен (попытка {attempt + 1}): {e}")
+            await asyncio.sleep(2 ** attempt)
+        self.counters["callbacks_failed"] += 1
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            depth = await self.store.queue_depth()
+        except Exception:
+            depth = None
+        return {**self.counters, "workers": len(self._tasks), "queue_depth": depth,
+                "distributed": self.store.distributed}
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """То, что видит клиент (без payload и владельца)."""
+    return {key: job.get(key) for key in ("id", "kind", "status", "created_at", "started_at", "finished_at", "result", "error")}
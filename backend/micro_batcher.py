@@ -0,0 +1,172 @@
+# backend/micro_batcher.py
+"""
+Динамический micro-batching для синхронного инференса (FakeNewsDetector.predict).
+
+По одному тексту модель на CPU использует малую часть пропускной способности
+матричных операций. MicroBatcher собирает конкурентные запросы в очередь;
+фоновый поток берет до max_batch_size элементов (или ждет max_wait_ms после
+первого), вызывает process_batch(items) одним проходом и раздает результаты
+по Future вызывающих.
+
+- submit() возвращает concurrent.futures.Future (async-код: asyncio.wrap_future);
+- очередь ограничена max_queue — при переполнении BatcherBusy сразу;
+- ошибка process_batch передается всем Future этого пакета;
+- stats(): гистограмма размеров пакетов, время ожидания и обработки.
+
+length_sorted_chunks() — разбиение уже известного набора последовательностей
+(пары NLI в rank_sources_nli) на пакеты близкой длины: padding идет до
+самой длинной последовательности пакета, поэтому сортировка по длине
+убирает большую часть пустых токенов.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREDICT_MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", 16))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", 5))
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", 256))
+NLI_MAX_BATCH = int(os.getenv("NLI_MAX_BATCH", 16))
+NLI_MAX_BATCH_TOKENS = int(os.getenv("NLI_MAX_BATCH_TOKENS", 4096))
+
+_STOP = object()
+
+
+class BatcherBusy(RuntimeError):
+    """Очередь micro-batcher переполнена."""
+
+
+def _bucket(size: int) -> str:
+    """Корзина гистограммы: 1, 2, 3-4, 5-8, 9-16, ..."""
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+
+def length_sorted_chunks(lengths: List[int], max_batch: int = NLI_MAX_BATCH,
+                         max_tokens: Optional[int] = NLI_MAX_BATCH_TOKENS) -> List[List[int]]:
+    """
+    Индексы последовательностей, сгруппированные в пакеты по возрастанию длины.
+    Пакет ограничен max_batch элементами и max_tokens токенами с учетом padding
+    (число элементов * самая длинная); одна длинная последовательность все равно
+    получает свой пакет.
+    """
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # Длины растут, так что padding пакета определяет последний элемент
+        padded = (len(current) + 1) * lengths[index]
+        if current and (len(current) >= max(1, max_batch) or (max_tokens and padded > max_tokens)):
+            chunks.append(current)
+            current = []
+        current.append(index)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class MicroBatcher:
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], name: str = "batcher",
+                 max_batch_size: int = PREDICT_MAX_BATCH, max_wait_ms: float = PREDICT_MAX_WAIT_MS,
+                 max_queue: int = PREDICT_MAX_QUEUE):
+        self.process_batch = process_batch
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue(maxsize=max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.histogram: Dict[str, int] = {}
+        self.counters = {"items": 0, "batches": 0, "rejected": 0, "failed_batches": 0,
+                         "wait_time_total": 0.0, "process_time_total": 0.0}
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, item: Any) -> Future:
+        if self._thread is None:
+            self.start()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.monotonic()))
+        except queue.Full:
+            self.counters["rejected"] += 1
+            raise BatcherBusy(f"Очередь {self.name} переполнена ({self._queue.maxsize}).")
+        return future
+
+    def _collect(self) -> Optional[List[Tuple[Any, Future, float]]]:
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                self._queue.put(_STOP)  # остановимся после этого пакета
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Вызывающий мог отменить Future, пока ждал в очереди
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                results = self.process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"process_batch вернул {len(results)} результатов на {len(batch)} элементов")
+            except Exception as e:
+                self.counters["failed_batches"] += 1
+                logger.error(f"❌ Micro-batch {self.name} ({len(batch)}) упал: {e}", exc_info=True)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            finished = time.monotonic()
+            self.counters["items"] += len(batch)
+            self.counters["batches"] += 1
+            self.counters["wait_time_total"] += sum(started - enqueued for _, _, enqueued in batch)
+            self.counters["process_time_total"] += finished - started
+            bucket = _bucket(len(batch))
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        items, batches = self.counters["items"], self.counters["batches"]
+        return {
+            **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in self.counters.items()},
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "avg_batch_size": round(items / batches, 2) if batches else None,
+            "avg_wait_ms": round(self.counters["wait_time_total"] / items * 1000, 2) if items else None,
+            "batch_size_histogram": dict(sorted(self.histogram.items(), key=lambda kv: int(kv[0].split("-")[0]))),
+        }
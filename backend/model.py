@@ -1,32 +1,52 @@
 # backend/model.py (Версия с поддержкой 'kk' модели)
 
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, XLMRobertaTokenizer
-from typing import Dict, List
+from transformers import AutoTokenizer, XLMRobertaTokenizer
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 import os
 
+try:
+    from .inference_backends import INFERENCE_BACKEND, configure_threads, load_runner, runner_bytes
+    from .micro_batcher import BatcherBusy, MicroBatcher, length_sorted_chunks
+    from .model_registry import MODEL_PRELOAD, ModelLoadError, ModelRegistry
+    from .shared_weights import load_model
+except ImportError:
+    from inference_backends import INFERENCE_BACKEND, configure_threads, load_runner, runner_bytes
+    from micro_batcher import BatcherBusy, MicroBatcher, length_sorted_chunks
+    from model_registry import MODEL_PRELOAD, ModelLoadError, ModelRegistry
+    from shared_weights import load_model
+
 logger = logging.getLogger(__name__)
 
+# Динамический micro-batching для predict (размеры пакета/очереди — в micro_batcher.py)
+PREDICT_BATCHING = os.getenv("PREDICT_BATCHING", "True").lower() in ("true", "1", "yes")
+
 class FakeNewsDetector:
     """
     Класс-менеджер для управления моделями.
-    Загружает все доступные языковые модели-"специалисты"
-    (например, 'en', 'kk') и выбирает нужную
-    в зависимости от языка текста.
+    Находит все доступные языковые модели-"специалисты"
+    (например, 'en', 'kk'), загружает нужную при первом
+    обращении и выбирает ее в зависимости от языка текста.
     Также содержит NLI модель для ранжирования источников.
     """
-    def __init__(self, device: str = None):
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Используется устройство: {self.device}")
-
-        self.classifier_models: Dict[str, AutoModelForSequenceClassification] = {}
-        self.classifier_tokenizers: Dict[str, AutoTokenizer] = {}
+    def __init__(self, device: str = None, backend: str = INFERENCE_BACKEND, preload: Optional[List[str]] = None):
+        # int8 и onnx — CPU-бэкенды (см. inference_backends.py)
+        self.backend = backend
+        self.device = device or ("cuda" if torch.cuda.is_available() and backend == "torch" else "cpu")
+        configure_threads()
+        logger.info(f"Используется устройство: {self.device}, бэкенд инференса: {self.backend}")
+
+        # Очередь micro-batching на каждую языковую модель (создается при первом predict)
+        self._batchers: Dict[str, MicroBatcher] = {}
         # Путь к папке, где лежат папки с моделями (truthlens_en_model, truthlens_kk_model)
         models_base_path = "backend/models"
+        # NLI модель одна, так как она мультиязычная (XLM-R)
+        self.nli_model_name = "joeddav/xlm-roberta-large-xnli"
+        self.model_paths: Dict[str, str] = {}
 
-        # --- ШАГ 1: АВТОМАТИЧЕСКАЯ ЗАГРУЗКА ВСЕХ КЛАССИФИКАЦИОННЫХ МОДЕЛЕЙ ---
-        # Сканирует папку models_base_path и загружает все модели, которые находит.
+        # --- ШАГ 1: ПОИСК ВСЕХ КЛАССИФИКАЦИОННЫХ МОДЕЛЕЙ ---
+        # Сканирует папку models_base_path и запоминает все модели, которые находит.
         # Ожидаются папки вида 'truthlens_xx_model', где xx - код языка (en, kk, ru и т.д.)
         logger.info(f"Поиск моделей классификации в: {models_base_path}")
         try:
@@ -52,50 +72,54 @@ class FakeNewsDetector:
                              logger.warning(f"Не удалось извлечь код языка из имени папки '{item_name}'. Пропускаем.")
                              continue
 
-                        logger.info(f"Найдена модель для языка '{lang_code}'. Загрузка из: {model_path}")
-                        try:
-                            tokenizer = AutoTokenizer.from_pretrained(model_path)
-                            model = AutoModelForSequenceClassification.from_pretrained(model_path)
-                            model.to(self.device)
-                            model.eval() # Переводим модель в режим оценки
-
-                            self.classifier_models[lang_code] = model
-                            self.classifier_tokenizers[lang_code] = tokenizer
-                            logger.info(f"✅ Модель для языка '{lang_code}' успешно загружена.")
-                        except Exception as load_err:
-                             logger.error(f"❌ Ошибка загрузки модели для языка '{lang_code}' из {model_path}: {load_err}", exc_info=True)
-
-            # Проверяем, загрузились ли хоть какие-то модели
-            if not self.classifier_models:
-                logger.error("🛑 КРИТИЧЕСКАЯ ОШИБКА: Не найдено или не удалось загрузить ни одной обученной модели классификации в 'backend/models/'.")
+                        logger.info(f"Найдена модель для языка '{lang_code}': {model_path}")
+                        self.model_paths[lang_code] = model_path
+
+            # Проверяем, нашлись ли хоть какие-то модели
+            if not self.model_paths:
+                logger.error("🛑 КРИТИЧЕСКАЯ ОШИБКА: Не найдено ни одной обученной модели классификации в 'backend/models/'.")
                 # Можно здесь выбросить исключение, чтобы приложение не запустилось
                 # raise RuntimeError("Не удалось загрузить модели классификации.")
             else:
-                 logger.info(f"Загружены модели классификации для языков: {list(self.classifier_models.keys())}")
-
-
-            # --- ШАГ 2: ЗАГРУЗКА NLI МОДЕЛИ ДЛЯ РАНЖИРОВАНИЯ ИСТОЧНИКОВ ---
-            # Эта модель остается одна, так как она мультиязычная (XLM-R)
-            nli_model_name = "joeddav/xlm-roberta-large-xnli"
-            logger.info(f"Загрузка NLI модели: {nli_model_name}")
-            try:
-                self.nli_tokenizer = XLMRobertaTokenizer.from_pretrained(nli_model_name)
-                self.nli_model = AutoModelForSequenceClassification.from_pretrained(nli_model_name)
-                self.nli_model.to(self.device)
-                self.nli_model.eval()
-                logger.info("✅ NLI модель успешно загружена.")
-            except Exception as nli_err:
-                 logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: Не удалось загрузить NLI модель {nli_model_name}: {nli_err}", exc_info=True)
-                 # Если NLI модель важна, можно тоже выбросить исключение
-                 # raise RuntimeError("Не удалось загрузить NLI модель.")
-                 self.nli_tokenizer = None
-                 self.nli_model = None
+                 logger.info(f"Найдены модели классификации для языков: {list(self.model_paths.keys())}")
 
+            # --- ШАГ 2: РЕЕСТР МОДЕЛЕЙ ---
+            # Классификаторы и NLI модель загружаются при первом использовании и
+            # вытесняются по LRU под MODEL_MEMORY_BUDGET_MB; MODEL_PRELOAD — загрузка при старте
+            loaders = {lang: (lambda path=path: self._load_classifier(path)) for lang, path in self.model_paths.items()}
+            loaders["nli"] = self._load_nli
+            self.registry = ModelRegistry(loaders, size_of=runner_bytes)
+            self.registry.preload(MODEL_PRELOAD if preload is None else preload)
 
         except Exception as e:
             logger.error(f"❌ Критическая ошибка во время инициализации FakeNewsDetector: {e}", exc_info=True)
             raise # Перебрасываем исключение, чтобы FastAPI знал о проблеме при старте
 
+    def _load_classifier(self, model_path: str):
+        logger.info(f"Загрузка модели классификации из: {model_path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = load_model(model_path, self.device)
+        model.to(self.device)
+        model.eval() # Переводим модель в режим оценки
+        return load_runner(model, tokenizer, model_path, self.backend), tokenizer
+
+    def _load_nli(self):
+        logger.info(f"Загрузка NLI модели: {self.nli_model_name}")
+        tokenizer = XLMRobertaTokenizer.from_pretrained(self.nli_model_name)
+        model = load_model(self.nli_model_name, self.device)
+        model.to(self.device)
+        model.eval()
+        return load_runner(model, tokenizer, self.nli_model_name, self.backend, pair=True), tokenizer
+
+    def _get_model(self, name: str) -> Optional[Tuple[Any, Any]]:
+        """(runner, tokenizer) из реестра; None, если модели нет или она не загрузилась."""
+        if name not in self.registry:
+            return None
+        try:
+            return self.registry.get(name)
+        except ModelLoadError:
+            return None
+
     def predict(self, text: str, language: str) -> Dict:
         """
         Предсказывает класс текста ('real' или 'fake'), используя модель
@@ -111,10 +135,7 @@ class FakeNewsDetector:
                   В случае ошибки может вернуть 'classification': 'error'.
         """
         # --- ВЫБОР НУЖНОГО КЛАССИФИКАТОРА ---
-        model = self.classifier_models.get(language)
-        tokenizer = self.classifier_tokenizers.get(language)
-
-        if not model or not tokenizer:
+        if self._get_model(language) is None:
             logger.warning(f"Модель классификации для языка '{language}' не найдена.")
             # --- ВАРИАНТ ОБРАБОТКИ ОТСУТСТВИЯ МОДЕЛИ ---
             # Можно выбрать поведение:
@@ -122,10 +143,9 @@ class FakeNewsDetector:
             return {"classification": "uncertain", "confidence": 0.5}
             # 2. Попробовать использовать модель по умолчанию (например, 'en'):
             # default_lang = 'en'
-            # if default_lang in self.classifier_models:
+            # if self._get_model(default_lang) is not None:
             #     logger.warning(f"Используется модель по умолчанию: '{default_lang}'")
-            #     model = self.classifier_models[default_lang]
-            #     tokenizer = self.classifier_tokenizers[default_lang]
+            #     language = default_lang
             # else:
             #     logger.error(f"Модель по умолчанию '{default_lang}' также не найдена.")
             #     return {"classification": "error", "confidence": 0.0, "error": "No suitable model found"}
@@ -133,24 +153,53 @@ class FakeNewsDetector:
 
         logger.info(f"Используется модель классификации для языка: {language}")
         try:
-            inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-            # Перемещаем тензоры на нужное устройство
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            if not PREDICT_BATCHING:
+                return self._predict_batch(language, [text])[0]
+            # Конкурентные вызовы собираются в один проход модели; ждем свой результат
+            return self._get_batcher(language).submit(text).result()
+        except BatcherBusy as e:
+            logger.warning(f"Очередь предсказаний для языка '{language}' переполнена: {e}")
+            return {"classification": "error", "confidence": 0.0, "error": f"Prediction queue is full for lang {language}"}
+        except Exception as e:
+            logger.error(f"Ошибка предсказания классификации для языка '{language}': {e}", exc_info=True)
+            # Возвращаем ошибку, которую может обработать app.py
+            # Важно: Не возвращай просто строку, а словарь, чтобы соответствовать ожидаемому типу Dict
+            return {"classification": "error", "confidence": 0.0, "error": f"Prediction failed for lang {language}"}
 
-            with torch.no_grad(): # Отключаем расчет градиентов для ускорения
-                outputs = model(**inputs)
-                probabilities = torch.softmax(outputs.logits, dim=-1)[0] # Берем [0], так как батч=1
+    def _get_batcher(self, language: str) -> MicroBatcher:
+        batcher = self._batchers.get(language)
+        if batcher is None:
+            batcher = self._batchers.setdefault(
+                language, MicroBatcher(lambda texts: self._predict_batch(language, texts), name=f"predict-{language}")
+            )
+        return batcher
 
-            # --- Определение класса ---
-            # Используем id2label из конфигурации модели, если он есть
-            id2label = model.config.id2label if hasattr(model.config, 'id2label') else {0: 'REAL', 1: 'FAKE'} # Значения по умолчанию
-            predicted_class_id = probabilities.argmax().item()
+    def _predict_batch(self, language: str, texts: List[str]) -> List[Dict]:
+        """
+        Один проход модели по пакету текстов: padding до самого длинного в пакете,
+        torch.no_grad(), softmax по каждой строке. Результаты — в порядке texts.
+        """
+        model, tokenizer = self.registry.get(language)
 
-            label_map = {v.upper(): k for k, v in id2label.items()} # {'REAL': 0, 'FAKE': 1}
-            fake_label_id = label_map.get('FAKE', 1) # Ищем ID для FAKE, по умолчанию 1
+        inputs = tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=512)
+        # Перемещаем тензоры на нужное устройство
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
 
-            fake_prob = probabilities[fake_label_id].item()
-            real_prob = probabilities[label_map.get('REAL', 0)].item()
+        with torch.no_grad(): # Отключаем расчет градиентов для ускорения
+            logits = model(**inputs)
+            probabilities = torch.softmax(logits, dim=-1).cpu()
+
+        # --- Определение класса ---
+        # Используем id2label из конфигурации модели, если он есть
+        id2label = model.config.id2label if hasattr(model.config, 'id2label') else {0: 'REAL', 1: 'FAKE'} # Значения по умолчанию
+        label_map = {v.upper(): k for k, v in id2label.items()} # {'REAL': 0, 'FAKE': 1}
+        fake_label_id = label_map.get('FAKE', 1) # Ищем ID для FAKE, по умолчанию 1
+        real_label_id = label_map.get('REAL', 0)
+
+        results = []
+        for row in probabilities:
+            fake_prob = row[fake_label_id].item()
+            real_prob = row[real_label_id].item()
 
             if fake_prob > real_prob:
                  classification = "fake"
@@ -160,16 +209,25 @@ class FakeNewsDetector:
                  confidence = real_prob
 
             logger.debug(f"Предсказание ({language}): fake_prob={fake_prob:.4f}, real_prob={real_prob:.4f} -> {classification} (conf: {confidence:.4f})")
-
-            return {
+            results.append({
                 "classification": classification,
                 "confidence": confidence,
-            }
-        except Exception as e:
-            logger.error(f"Ошибка предсказания классификации для языка '{language}': {e}", exc_info=True)
-            # Возвращаем ошибку, которую может обработать app.py
-            # Важно: Не возвращай просто строку, а словарь, чтобы соответствовать ожидаемому типу Dict
-            return {"classification": "error", "confidence": 0.0, "error": f"Prediction failed for lang {language}"}
+            })
+        return results
+
+    def batch_stats(self) -> Dict[str, Any]:
+        """Гистограммы размеров пакетов и глубина очередей по языкам."""
+        return {language: batcher.stats() for language, batcher in self._batchers.items()}
+
+    def model_stats(self) -> Dict[str, Any]:
+        """Резидентные модели, байты, время загрузки и вытеснения (model_registry.py)."""
+        return self.registry.stats()
+
+    def close(self) -> None:
+        """Останавливает фоновые потоки micro-batching."""
+        for batcher in self._batchers.values():
+            batcher.stop()
+        self._batchers.clear()
 
 
     def rank_sources_nli(self, query_text: str, search_results: List[Dict]) -> List[Dict]:
@@ -179,56 +237,95 @@ class FakeNewsDetector:
         Добавляет ключ 'relevance' к каждому результату.
         Возвращает отсортированный список.
         """
-        if not self.nli_model or not self.nli_tokenizer:
-             logger.warning("NLI модель недоступна. Ранжирование источников невозможно.")
-             return search_results # Возвращаем как есть
-
         if not search_results:
             return []
 
+        nli = self._get_model("nli")
+        if nli is None:
+             logger.warning("NLI модель недоступна. Ранжирование источников невозможно.")
+             return search_results # Возвращаем как есть
+
         ranked_results = []
         # Получаем ID для меток из конфигурации NLI модели
         # Значения по умолчанию (0, 1, 2) взяты из стандартной конфигурации xnli
-        entailment_id = self.nli_model.config.label2id.get('entailment', 2)
-        contradiction_id = self.nli_model.config.label2id.get('contradiction', 0)
-        neutral_id = self.nli_model.config.label2id.get('neutral', 1)
+        nli_model, nli_tokenizer = nli
+        entailment_id = nli_model.config.label2id.get('entailment', 2)
+        contradiction_id = nli_model.config.label2id.get('contradiction', 0)
+        neutral_id = nli_model.config.label2id.get('neutral', 1)
 
         logger.debug(f"NLI label IDs: Entailment={entailment_id}, Contradiction={contradiction_id}, Neutral={neutral_id}")
 
+        candidates = []
         for result in search_results:
             snippet = result.get("snippet") or result.get("description") or "" # Используем и snippet, и description
             if len(snippet) < 15: # Пропускаем слишком короткие описания
                  logger.debug(f"Пропуск источника из-за короткого сниппета: {result.get('url')}")
                  continue
+            candidates.append((result, snippet))
 
-            # NLI модель ожидает пару: (premise, hypothesis)
-            # premise - это текст источника (snippet), hypothesis - это утверждение (query_text)
-            premise, hypothesis = snippet, query_text
-
-            try:
-                inputs = self.nli_tokenizer(premise, hypothesis, return_tensors="pt", truncation=True, max_length=256).to(self.device)
-
-                with torch.no_grad():
-                    outputs = self.nli_model(**inputs)
-                    probabilities = torch.softmax(outputs.logits, dim=-1)[0]
-
-                # Считаем релевантность как (вероятность подтверждения - вероятность противоречия)
-                # Это простой способ, можно использовать и другие метрики
-                relevance = probabilities[entailment_id].item() - probabilities[contradiction_id].item()
-                # Можно добавить и neutral_prob для отладки
-                # neutral_prob = probabilities[neutral_id].item()
-                # logger.debug(f"NLI scores for '{result.get('title', '')[:30]}...': E={probabilities[entailment_id]:.3f}, C={probabilities[contradiction_id]:.3f}, N={neutral_prob:.3f} -> Relevance={relevance:.3f}")
+        if not candidates:
+            return []
 
+        # NLI модель ожидает пару: (premise, hypothesis)
+        # premise - это текст источника (snippet), hypothesis - это утверждение (query_text)
+        relevances = self._nli_relevance_batch(
+            nli_model, nli_tokenizer, [snippet for _, snippet in candidates], query_text, entailment_id, contradiction_id
+        )
 
-                result_copy = result.copy()
-                result_copy["relevance"] = relevance
-                ranked_results.append(result_copy)
-            except Exception as nli_pred_err:
-                 logger.warning(f"Ошибка NLI предсказания для источника {result.get('url')}: {nli_pred_err}", exc_info=False) # Не логируем весь трейсбек
-                 continue # Пропускаем этот источник
+        for (result, _), relevance in zip(candidates, relevances):
+            if relevance is None: # Ошибка предсказания для этого источника — пропускаем его
+                continue
+            result_copy = result.copy()
+            result_copy["relevance"] = relevance
+            ranked_results.append(result_copy)
 
         # Сортируем результаты по убыванию релевантности
         ranked_results.sort(key=lambda x: x.get("relevance", -1.0), reverse=True)
 
         logger.info(f"Ранжировано {len(ranked_results)} источников с помощью NLI.")
-        return ranked_results
\ No newline at end of file
+        return ranked_results
+
+    def _nli_relevance_batch(self, nli_model, nli_tokenizer, premises: List[str], hypothesis: str,
+                             entailment_id: int, contradiction_id: int) -> List[Optional[float]]:
+        """
+        Релевантность (P(entailment) - P(contradiction)) для всех пар (premise, hypothesis).
+        Все пары токенизируются одним вызовом, затем идут пакетами близкой длины
+        (length_sorted_chunks) с padding до самой длинной пары пакета.
+        Если пакет падает, его пары считаются по одной, как раньше: ошибка
+        одной пары дает None только для нее.
+        """
+        relevances: List[Optional[float]] = [None] * len(premises)
+        try:
+            encodings = nli_tokenizer(premises, [hypothesis] * len(premises), truncation=True, max_length=256)
+        except Exception as tok_err:
+            logger.warning(f"Ошибка пакетной токенизации NLI, считаем по одной паре: {tok_err}")
+            return [self._nli_relevance_single(nli_model, nli_tokenizer, premise, hypothesis, entailment_id, contradiction_id) for premise in premises]
+
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        for chunk in length_sorted_chunks(lengths):
+            try:
+                batch = nli_tokenizer.pad(
+                    {key: [encodings[key][i] for i in chunk] for key in encodings.keys()},
+                    padding=True, return_tensors="pt",
+                ).to(self.device)
+                with torch.no_grad():
+                    probabilities = torch.softmax(nli_model(**batch), dim=-1).cpu()
+                # Считаем релевантность как (вероятность подтверждения - вероятность противоречия)
+                for row, index in zip(probabilities, chunk):
+                    relevances[index] = row[entailment_id].item() - row[contradiction_id].item()
+            except Exception as nli_pred_err:
+                logger.warning(f"Ошибка пакетного NLI предсказания ({len(chunk)} пар), считаем по одной: {nli_pred_err}", exc_info=False)
+                for index in chunk:
+                    relevances[index] = self._nli_relevance_single(nli_model, nli_tokenizer, premises[index], hypothesis, entailment_id, contradiction_id)
+        return relevances
+
+    def _nli_relevance_single(self, nli_model, nli_tokenizer, premise: str, hypothesis: str,
+                              entailment_id: int, contradiction_id: int) -> Optional[float]:
+        try:
+            inputs = nli_tokenizer(premise, hypothesis, return_tensors="pt", truncation=True, max_length=256).to(self.device)
+            with torch.no_grad():
+                probabilities = torch.softmax(nli_model(**inputs), dim=-1)[0]
+            return probabilities[entailment_id].item() - probabilities[contradiction_id].item()
+        except Exception as nli_pred_err:
+             logger.warning(f"Ошибка NLI предсказания: {nli_pred_err}", exc_info=False) # Не логируем весь трейсбек
+             return None
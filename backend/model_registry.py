@@ -0,0 +1,172 @@
+# backend/model_registry.py
+"""
+Ленивая загрузка моделей с LRU-вытеснением под бюджет памяти.
+
+Раньше FakeNewsDetector при старте грузил все truthlens_*_model и NLI модель —
+en/ru/kk + xlm-roberta-large-xnli в каждом из 4 воркеров gunicorn.
+ModelRegistry хранит загрузчики по имени ("en", "kk", "nli") и загружает
+модель при первом get(); резидентные модели упорядочены по последнему
+использованию, и при превышении MODEL_MEMORY_BUDGET_MB вытесняются самые
+давние (только что запрошенная — никогда).
+
+- MODEL_PRELOAD: модели, которые грузятся при старте (например "en,nli"; "*" — все);
+- загрузка одной модели идет один раз, конкурентные get() ждут ее;
+- неудачная загрузка повторяется не чаще раза в MODEL_RETRY_SECONDS;
+- stats(): время загрузки, резидентные байты, попадания, вытеснения по моделям.
+
+Размер модели сообщает size_of(value) (см. inference_backends.runner_bytes);
+если размер уже известен по прошлой загрузке, место освобождается заранее.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", 0))  # 0 — без ограничения
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]
+MODEL_RETRY_SECONDS = float(os.getenv("MODEL_RETRY_SECONDS", 60))
+
+
+class ModelLoadError(RuntimeError):
+    """Модель не загрузилась (или упала недавно и ждет MODEL_RETRY_SECONDS)."""
+
+
+class ModelRegistry:
+    def __init__(self, loaders: Dict[str, Callable[[], Any]], size_of: Callable[[Any], int] = lambda value: 0,
+                 budget_bytes: int = MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+                 retry_seconds: float = MODEL_RETRY_SECONDS):
+        self.loaders = dict(loaders)
+        self.size_of = size_of
+        self.budget_bytes = budget_bytes
+        self.retry_seconds = retry_seconds
+        self._resident: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {name: threading.Lock() for name in self.loaders}
+        self._failed_at: Dict[str, float] = {}
+        self.models: Dict[str, Dict[str, Any]] = {
+            name: {"loaded": False, "bytes": 0, "loads": 0, "load_time_last": None, "load_time_total": 0.0,
+                   "hits": 0, "evictions": 0, "failures": 0, "last_error": None}
+            for name in self.loaders
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.loaders
+
+    def names(self) -> List[str]:
+        return list(self.loaders)
+
+    def resident(self) -> List[str]:
+        """Загруженные модели, от самой давно использованной к последней."""
+        with self._lock:
+            return list(self._resident)
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(self.models[name]["bytes"] for name in self.resident())
+
+    def get(self, name: str) -> Any:
+        if name not in self.loaders:
+            raise KeyError(name)
+        with self._lock:
+            if name in self._resident:
+                self._resident.move_to_end(name)
+                self.models[name]["hits"] += 1
+                return self._resident[name]
+        with self._load_locks[name]:
+            with self._lock:  # пока ждали, модель мог загрузить другой поток
+                if name in self._resident:
+                    self._resident.move_to_end(name)
+                    self.models[name]["hits"] += 1
+                    return self._resident[name]
+            return self._load(name)
+
+    def _load(self, name: str) -> Any:
+        info = self.models[name]
+        failed_at = self._failed_at.get(name)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+            raise ModelLoadError(f"Модель '{name}' недавно не загрузилась: {info['last_error']}")
+        if info["bytes"]:
+            self._evict_for(info["bytes"], keep=name)
+
+        started = time.monotonic()
+        try:
+            value = self.loaders[name]()
+        except Exception as e:
+            self._failed_at[name] = time.monotonic()
+            info["failures"] += 1
+            info["last_error"] = str(e)
+            logger.error(f"❌ Ошибка загрузки модели '{name}': {e}", exc_info=True)
+            raise ModelLoadError(f"Модель '{name}' не загрузилась: {e}") from e
+        elapsed = time.monotonic() - started
+        self._failed_at.pop(name, None)
+
+        info.update(loaded=True, bytes=self.size_of(value), load_time_last=round(elapsed, 3), last_error=None)
+        info["loads"] += 1
+        info["load_time_total"] += elapsed
+        with self._lock:
+            self._resident[name] = value
+        self._evict_for(0, keep=name)
+        logger.info(f"✅ Модель '{name}' загружена за {elapsed:.1f} с ({info['bytes'] / 2**20:.0f} МБ), "
+                    f"резидентно: {self.resident()}")
+        return value
+
+    def _evict_for(self, incoming: int, keep: str) -> None:
+        """Вытесняет самые давние модели, пока resident + incoming не уложится в бюджет."""
+        if self.budget_bytes <= 0:
+            return
+        with self._lock:
+            total = sum(self.models[n]["bytes"] for n in self._resident if n != keep) + incoming
+            if keep in self._resident:
+                total += self.models[keep]["bytes"]
+            for victim in [n for n in self._resident if n != keep]:
+                if total <= self.budget_bytes:
+                    break
+                del self._resident[victim]
+                total -= self.models[victim]["bytes"]
+                self.models[victim]["loaded"] = False
+                self.models[victim]["evictions"] += 1
+                logger.info(f"♻️ Модель '{victim}' вытеснена (бюджет {self.budget_bytes / 2**20:.0f} МБ).")
+        if total > self.budget_bytes:
+            logger.warning(f"⚠️ Модель '{keep}' одна не укладывается в бюджет MODEL_MEMORY_BUDGET_MB.")
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            if self._resident.pop(name, None) is None:
+                return False
+            self.models[name]["loaded"] = False
+            self.models[name]["evictions"] += 1
+            return True
+
+    def preload(self, names: Iterable[str] = MODEL_PRELOAD) -> List[str]:
+        """Загружает модели при старте ("*" — все); возвращает успешно загруженные."""
+        names = list(names)
+        if "*" in names:
+            names = self.names()
+        loaded = []
+        for name in names:
+            if name not in self.loaders:
+                logger.warning(f"⚠️ MODEL_PRELOAD: неизвестная модель '{name}'.")
+                continue
+            try:
+                self.get(name)
+                loaded.append(name)
+            except ModelLoadError:
+                pass
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        resident = self.resident()
+        return {
+            "budget_bytes": self.budget_bytes or None,
+            "resident_bytes": sum(self.models[n]["bytes"] for n in resident),
+            "resident": resident,
+            "models": {
+                name: {**info, "load_time_total": round(info["load_time_total"], 3)}
+                for name, info in self.models.items()
+            },
+        }
@@ -0,0 +1,262 @@
+# backend/partitions.py
+"""
+Помесячное секционирование (PARTITION BY RANGE) таблиц analyses и
+telegram_monitored_messages и удаление старых секций.
+
+- analyses секционируется по created_at, telegram_monitored_messages — по
+  message_timestamp (не меняется после вставки, в отличие от processed_at).
+  Ключ секционирования входит в PRIMARY KEY/UNIQUE (требование PostgreSQL):
+  (id, created_at), (id, message_timestamp), (chat_id, message_id, message_timestamp).
+- На секционированную analyses нельзя сослаться внешним ключом по одному id,
+  поэтому FK user_votes/telegram_monitored_messages -> analyses нет; при
+  удалении секции их действия (CASCADE / SET NULL) выполняет retire_partition.
+- Миграция со старой схемы (DB_PARTITION_MIGRATE=true): старая таблица
+  переименовывается в <table>_legacy и подключается целиком как секция
+  FROM (MINVALUE) TO (начало следующего месяца) — без копирования строк.
+  Новые строки идут в помесячные секции.
+- maintain(): создает секции на PARTITION_PREMAKE_MONTHS месяцев вперед и
+  убирает секции старше *_RETENTION_MONTHS (0 — хранить всё): archive —
+  DETACH и перенос в схему archive, drop — удаление.
+
+Нужен PostgreSQL 11+.
+"""
+
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", 3))
+PARTITION_RETENTION_MODE = os.getenv("PARTITION_RETENTION_MODE", "archive")  # archive | drop
+ANALYSES_RETENTION_MONTHS = int(os.getenv("ANALYSES_RETENTION_MONTHS", 0))
+TELEGRAM_RETENTION_MONTHS = int(os.getenv("TELEGRAM_RETENTION_MONTHS", 6))
+DB_PARTITION_MIGRATE = os.getenv("DB_PARTITION_MIGRATE", "False").lower() in ("true", "1", "t")
+PARTITION_MAINTENANCE_HOURS = float(os.getenv("PARTITION_MAINTENANCE_HOURS", 24))
+
+ARCHIVE_SCHEMA = "archive"
+MAINTENANCE_LOCK_ID = 7_305_001  # pg_try_advisory_xact_lock: обслуживание идет в одном процессе
+
+# Родительские таблицы. Типы колонок совпадают со старой схемой — иначе ATTACH старой таблицы не пройдет.
+PARENT_DDL = {
+    "analyses": """
+        CREATE TABLE IF NOT EXISTS analyses (
+            id INTEGER NOT NULL DEFAULT nextval('analyses_id_seq'),
+            user_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            verdict TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            full_response JSONB NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, created_at),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (created_at);
+    """,
+    "telegram_monitored_messages": """
+        CREATE TABLE IF NOT EXISTS telegram_monitored_messages (
+            id INTEGER NOT NULL DEFAULT nextval('telegram_monitored_messages_id_seq'),
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            user_id BIGINT, -- Может быть null в каналах
+            message_text TEXT,
+            media_type TEXT, -- 'text', 'photo'
+            url_found TEXT, -- Ссылка, если найдена
+            caption TEXT, -- Подпись к фото
+            message_timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            analysis_id INTEGER, -- Ссылка на результат анализа (если был)
+            status TEXT DEFAULT 'pending',
+            PRIMARY KEY (id, message_timestamp),
+            UNIQUE (chat_id, message_id, message_timestamp) -- дата сообщения Telegram не меняется
+        ) PARTITION BY RANGE (message_timestamp);
+    """,
+}
+
+PARTITION_KEYS = {"analyses": "created_at", "telegram_monitored_messages": "message_timestamp"}
+
+
+def retention_months(table: str) -> int:
+    return ANALYSES_RETENTION_MONTHS if table == "analyses" else TELEGRAM_RETENTION_MONTHS
+
+
+# --- календарь ---
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def months_to_create(today: date, premake: int = PARTITION_PREMAKE_MONTHS) -> List[date]:
+    """Текущий месяц и premake следующих."""
+    first = month_start(today)
+    return [add_months(first, i) for i in range(premake + 1)]
+
+
+def parse_upper_bound(bound_expr: str) -> Optional[datetime]:
+    """
+    Верхняя граница из pg_get_expr(relpartbound), например
+    "FOR VALUES FROM ('2024-05-01 00:00:00+00') TO ('2024-06-01 00:00:00+00')".
+    None для MAXVALUE/DEFAULT.
+    """
+    match = re.search(r"TO \('([^']+)'\)", bound_expr)
+    if not match:
+        return None
+    value = match.group(1)
+    if re.search(r"[+-]\d{2}$", value):
+        value += ":00"  # +00 -> +00:00 для fromisoformat
+    bound = datetime.fromisoformat(value)
+    return bound if bound.tzinfo else bound.replace(tzinfo=timezone.utc)
+
+
+def partitions_to_retire(partitions: List[Tuple[str, str]], today: date, months: int) -> List[str]:
+    """Секции, все строки которых старше months месяцев (граница TO <= начало окна хранения)."""
+    if months <= 0:
+        return []
+    horizon = datetime.combine(add_months(month_start(today), -months), datetime.min.time(), tzinfo=timezone.utc)
+    retire = []
+    for name, bound_expr in partitions:
+        upper = parse_upper_bound(bound_expr)
+        if upper is not None and upper <= horizon:
+            retire.append(name)
+    return retire
+
+
+# --- операции над курсором psycopg2 (вызываются из Database) ---
+def relkind(cur, table: str) -> Optional[str]:
+    """'r' — обычная таблица, 'p' — секционированная, None — нет таблицы."""
+    cur.execute("SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(cur, table: str) -> List[Tuple[str, str]]:
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname;
+    """, (table,))
+    return [(row[0], row[1]) for row in cur.fetchall()]
+
+
+def _bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def ensure_partitions(cur, table: str, today: date, premake: int = PARTITION_PREMAKE_MONTHS,
+                      start: Optional[date] = None) -> List[str]:
+    """Создает недостающие помесячные секции (с start или с текущего месяца)."""
+    months = months_to_create(today, premake)
+    if start is not None:
+        months = [m for m in months if m >= start] or [month_start(start)]
+    existing = {name for name, _ in list_partitions(cur, table)}
+    created = []
+    for month in months:
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+        cur.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{_bound(month)}') TO ('{_bound(add_months(month, 1))}');"
+        )
+        created.append(name)
+    return created
+
+
+def create_partitioned(cur, table: str, today: date) -> None:
+    sequence = f"{table}_id_seq"
+    cur.execute(f'CREATE SEQUENCE IF NOT EXISTS "{sequence}";')
+    cur.execute(PARENT_DDL[table])
+    # pg_get_serial_sequence('analyses', 'id') (reserve_analysis_ids) ищет sequence по владельцу
+    cur.execute(f'ALTER SEQUENCE "{sequence}" OWNED BY "{table}".id;')
+    ensure_partitions(cur, table, today)
+
+
+def migrate_table(cur, table: str, today: date) -> None:
+    """Старая таблица -> секция <table>_legacy новой секционированной таблицы (без копирования)."""
+    key = PARTITION_KEYS[table]
+    legacy = f"{table}_legacy"
+    cutover = add_months(month_start(today), 1)
+    cur.execute(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE;')
+
+    # FK на старую таблицу (user_votes, telegram -> analyses) на секционированную не перенести
+    cur.execute("""
+        SELECT conrelid::regclass::text, conname FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = %s::regclass;
+    """, (table,))
+    for referencing, constraint in cur.fetchall():
+        cur.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT "{constraint}";')
+
+    cur.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}";')
+    # Имена индексов уникальны в схеме: освобождаем их для родительской таблицы
+    cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s;", (legacy,))
+    for (index,) in cur.fetchall():
+        cur.execute(f'ALTER INDEX "{index}" RENAME TO "{("legacy_" + index)[:63]}";')
+
+    cur.execute(f'UPDATE "{legacy}" SET "{key}" = CURRENT_TIMESTAMP WHERE "{key}" IS NULL;')
+    cur.execute(f'ALTER TABLE "{legacy}" ALTER COLUMN "{key}" SET NOT NULL;')
+
+    cur.execute(PARENT_DDL[table])
+    cur.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id;')
+    cur.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" FOR VALUES FROM (MINVALUE) TO (\'{_bound(cutover)}\');')
+    ensure_partitions(cur, table, today, start=cutover)
+    logger.info(f"✅ {table}: старая таблица подключена как секция {legacy} (до {cutover}).")
+
+
+def setup(cur, today: date, migrate: bool = DB_PARTITION_MIGRATE) -> Dict[str, bool]:
+    """Создает/мигрирует секционированные таблицы. Возвращает {table: секционирована ли}."""
+    result = {}
+    for table in PARENT_DDL:
+        kind = relkind(cur, table)
+        if kind is None:
+            create_partitioned(cur, table, today)
+        elif kind == "r":
+            if migrate:
+                migrate_table(cur, table, today)
+            else:
+                logger.warning(f"⚠️ {table} не секционирована; для миграции задайте DB_PARTITION_MIGRATE=true.")
+                result[table] = False
+                continue
+        result[table] = True
+    return result
+
+
+def retire_partition(cur, table: str, partition: str, mode: str = PARTITION_RETENTION_MODE) -> None:
+    if table == "analyses":
+        # То, что раньше делали FK: голоса удаляются, ссылка из Telegram обнуляется
+        cur.execute(f'DELETE FROM user_votes WHERE analysis_id IN (SELECT id FROM "{partition}");')
+        cur.execute(f'UPDATE telegram_monitored_messages SET analysis_id = NULL '
+                    f'WHERE analysis_id IN (SELECT id FROM "{partition}");')
+    cur.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{partition}";')
+    if mode == "drop":
+        cur.execute(f'DROP TABLE "{partition}";')
+    else:
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}";')
+        cur.execute(f'ALTER TABLE "{partition}" SET SCHEMA "{ARCHIVE_SCHEMA}";')
+    logger.info(f"🗄️ {table}: секция {partition} — {'удалена' if mode == 'drop' else 'в архиве'}.")
+
+
+def maintain(cur, today: Optional[date] = None) -> Dict[str, Any]:
+    """Секции вперед + удаление старых. Пропускается, если другой процесс уже этим занят."""
+    today = today or datetime.now(timezone.utc).date()
+    cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (MAINTENANCE_LOCK_ID,))
+    if not cur.fetchone()[0]:
+        return {"skipped": True}
+    report: Dict[str, Any] = {"created": [], "retired": []}
+    for table in PARENT_DDL:
+        if relkind(cur, table) != "p":
+            continue
+        report["created"] += ensure_partitions(cur, table, today)
+        for partition in partitions_to_retire(list_partitions(cur, table), today, retention_months(table)):
+            retire_partition(cur, table, partition)
+            report["retired"].append(partition)
+    return report
@@ -0,0 +1,155 @@
+# backend/passwords.py
+"""
+Хэширование и проверка паролей (bcrypt) вне event loop.
+
+bcrypt занимает 100–300 мс CPU на вызов; в async-обработчике это блокирует
+все запросы worker-а. PasswordHasher выполняет hash/verify в отдельном
+ограниченном пуле (потоки по умолчанию, bcrypt отпускает GIL; или процессы)
+и отказывает сразу, если очередь к пулу длиннее PASSWORD_MAX_QUEUE.
+
+LoginThrottle ограничивает число попыток входа с одного IP в минуту
+(Redis, если есть, иначе счетчик внутри процесса).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from passlib.context import CryptContext
+
+try:
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", 2))
+PASSWORD_POOL_KIND = os.getenv("PASSWORD_POOL_KIND", "thread")  # thread | process
+PASSWORD_MAX_QUEUE = int(os.getenv("PASSWORD_MAX_QUEUE", 32))
+LOGIN_ATTEMPTS_PER_MINUTE = int(os.getenv("LOGIN_ATTEMPTS_PER_MINUTE", 10))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return pwd_context.verify(password, hashed)
+    except (ValueError, TypeError):
+        return False  # поврежденный хэш в БД — неверный пароль, а не 500
+
+
+class PasswordPoolBusy(RuntimeError):
+    """Очередь к пулу хэширования переполнена."""
+
+
+class PasswordHasher:
+    def __init__(self, pool_size: int = PASSWORD_POOL_SIZE, max_queue: int = PASSWORD_MAX_QUEUE,
+                 kind: str = PASSWORD_POOL_KIND):
+        self.pool_size = max(1, pool_size)
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+        self.counters = {"hashed": 0, "verified": 0, "rejected": 0, "busy_time_total": 0.0}
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args) -> Any:
+        # в работе pool_size + ожидают в очереди max_queue
+        if self._in_flight >= self.pool_size + self.max_queue:
+            self.counters["rejected"] += 1
+            raise PasswordPoolBusy("Сервис авторизации перегружен.")
+        self._in_flight += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self._in_flight -= 1
+            self.counters["busy_time_total"] += time.monotonic() - started
+
+    async def hash(self, password: str) -> str:
+        result = await self._run(_hash, password)
+        self.counters["hashed"] += 1
+        return result
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        result = await self._run(_verify, password, hashed)
+        self.counters["verified"] += 1
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in self.counters.items()},
+            "kind": self.kind,
+            "pool_size": self.pool_size,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+        }
+
+
+class LoginThrottle(OptionalRedis):
+    """Фиксированное окно: не больше `limit` попыток входа с IP за `window` секунд."""
+
+    KEY_PREFIX = "login_attempts:"
+
+    def __init__(self, redis_client=None, limit: int = LOGIN_ATTEMPTS_PER_MINUTE, window: int = 60,
+                 is_available: Optional[Callable[[], bool]] = None):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.limit = limit
+        self.window = window
+        self._local: Dict[str, Any] = {}  # ip -> [начало окна, счетчик]
+        self.throttled = 0
+
+    async def _count(self, ip: str) -> int:
+        client = self.redis
+        if client is not None:
+            try:
+                key = self.KEY_PREFIX + ip
+                pipe = client.pipeline()
+                pipe.incr(key)
+                pipe.expire(key, self.window, nx=True)
+                count, _ = await pipe.execute()
+                return count
+            except Exception as e:
+                logger.warning(f"⚠️ Login throttle: Redis недоступен ({e}), локальный счетчик.")
+        now = time.monotonic()
+        window_start, count = self._local.get(ip, (now, 0))
+        if now - window_start >= self.window:
+            window_start, count = now, 0
+        self._local[ip] = (window_start, count + 1)
+        if len(self._local) > 10000:
+            # старые окна больше не нужны
+            self._local = {k: v for k, v in self._local.items() if now - v[0] < self.window}
+        return count + 1
+
+    async def allow(self, ip: str) -> bool:
+        if self.limit <= 0:
+            return True
+        if await self._count(ip) > self.limit:
+            self.throttled += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit_per_window": self.limit, "window_seconds": self.window, "throttled": self.throttled}
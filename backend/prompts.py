@@ -0,0 +1,263 @@
+# backend/prompts.py
+"""
+Реестр промптов Gemini.
+
+Все шаблоны компилируются один раз при старте для каждой пары (шаблон, язык):
+язык ответа и JSON-схемы подставляются заранее, при запросе остаются только
+динамические поля (утверждение, источники, дата). Для каждого шаблона
+хранится оценка числа токенов, а размер отрисованных промптов доступен
+как метрика (/metrics -> "prompts").
+
+Плейсхолдеры записываются как $name (string.Template), поэтому фигурные
+скобки JSON в тексте не нужно экранировать.
+"""
+
+import json
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from pydantic import BaseModel
+
+LANGUAGE_NAMES = {"kk": "Kazakh", "ru": "Russian", "en": "English"}
+DEFAULT_OUTPUT_LANGUAGE = "ru"  # исторически: неизвестный язык -> ответ на русском
+
+_FIELD = re.compile(r"\$(\w+)")
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов (~4 байта UTF-8 на токен; кириллица ~2 символа на токен)."""
+    return max(1, round(len(text.encode("utf-8")) / 4))
+
+
+# --- Системная заметка "сейчас 2026 год" (оборачивает основные шаблоны) ---
+DATE_NOTES = {
+    "text": """[SYSTEM NOTE: IMPORTANT CONTEXT]
+Today's Date: $current_date.
+Current Year: 2026.
+Any news or events dated $current_date or earlier are PAST or PRESENT facts, not future predictions.
+Treat "2026" as the current year.
+--------------------------------------------------
+""",
+    "vision": """[SYSTEM NOTE: IMPORTANT CONTEXT]
+Today's Date: $current_date.
+Current Year: 2026.
+Treat "2026" as the current year for any visual analysis (calendars, dates on screens, etc.).
+--------------------------------------------------
+""",
+    "short": """[SYSTEM NOTE]
+Today's Date: $current_date. Current Year: 2026.
+Treat "2026" as the current year.
+-------------------
+""",
+}
+
+# --- Основные шаблоны ---
+VISION_ANALYSIS = """Ты — **очень** строгий криминалист по цифровым изображениям. Твоя главная задача — найти **любые** признаки подделки. Не доверяй изображению по умолчанию.
+
+УТВЕРЖДЕНИЕ: "$text"
+ИЗОБРАЖЕНИЕ: [прикреплено]
+ЯЗЫК ОТВЕТА: $output_lang
+
+ИНСТРУКЦИИ (Следуй **строго** по шагам):
+Ты ДОЛЖЕН заполнить ВСЕ поля JSON-схемы. НЕ выноси вердикт, пока не заполнишь 'ai_artifact_check' и 'context_check'.
+
+1.  **ai_artifact_check (КРИТИЧЕСКИЙ ШАГ - Ищи подделку!)**:
+    * **Ищи ИИ-артефакты:** 6 пальцев, странные тени, нечитаемые надписи, асимметрия, нелогичные объекты, повторяющиеся узоры, "пластиковые" лица/кожа. **Любое** подозрение — фиксируй.
+    * **Ищи МАНИПУЛЯЦИИ (Photoshop/Вставка):**
+        * **Освещение:** Совпадает ли свет на *всех* объектах и фоне?
+        * **Разрешение/Шум/Фокус:** Все ли части изображения одинаково четкие/размытые/шумные? Нет ли резких перепадов?
+        * **Края объектов:** Есть ли неестественно резкие, "вырезанные" или наоборот, "грязные", размытые края? Особенно вокруг людей, предметов.
+        * **Перспектива/Масштаб:** Соответствуют ли размеры и углы объектов друг другу и фону?
+        * **Отражения/Тени:** Правильно ли расположены тени и отражения? Соответствуют ли они источникам света?
+        * **Нелогичность:** Есть ли что-то странное в самой сцене? (Например, Байтерек за окном автобуса).
+    * **ЗАПИШИ СЮДА свой подробный вывод** (на $output_lang). Если нашел **хотя бы один** подозрительный признак, опиши его четко. Если *абсолютно* ничего нет, напиши "Признаков ИИ-генерации или манипуляций не обнаружено." **Будь скептиком!**
+
+2.  **context_check (Второстепенный шаг)**:
+    * **Только после** Шага 1, если изображение кажется подлинным, выполни "обратный поиск по картинке" в своих знаниях.
+    * Где и когда это фото появлялось *впервые*? Соответствует ли контекст утверждению? Это старое фото, выдаваемое за новое?
+    * **ЗАПИШИ СЮДА свой вывод** (на $output_lang). Если ничего нет, напиши "Контекст изображения не найден."
+
+3.  **verdict (ВЕРДИКТ - Артефакты важнее контекста!)**:
+    * **ПРАВИЛО 1 (ВАЖНЕЙШЕЕ):** Если в 'ai_artifact_check' найден **хотя бы один** признак ИИ или манипуляции, вердикт **ОБЯЗАТЕЛЬНО** должен быть "Фейк (ИИ-генерация)" или "Фейк (Манипуляция)", **даже если контекст кажется правильным**.
+    * **ПРАВИЛО 2:** НЕ ПЫТАЙСЯ оправдать ИИ-фейк или манипуляцию, придумывая им реальный контекст. Артефакты главнее.
+    * **ПРАВИЛО 3:** Вердикт "Подлинное" ставь **только** если 'ai_artifact_check' **абсолютно чист** И 'context_check' подтверждает контекст утверждения.
+    * Во всех остальных сомнительных случаях (например, артефактов нет, но контекст не найден или противоречив) — ставь "Спорное".
+    * Вынеси вердикт (на $output_lang).
+
+4.  **explanation (Объяснение)**:
+    * Кратко (2-3 предложения на $output_lang) объясни свой вердикт, **обязательно ссылаясь** на конкретные находки из 'ai_artifact_check' и 'context_check'. Объясни, **почему** ты считаешь это фейком/подлинным/спорным.
+
+5.  **confidence (Уверенность)**:
+    * Оцени свою **общую уверенность** в вердикте от 0.0 до 1.0. Будь честен: если есть сомнения, уверенность не должна быть 1.0.
+
+Твой ответ ДОЛЖЕН быть в строгом JSON-формате ($schema_json) на $output_lang языке. Не добавляй никакого текста до или после JSON.
+Do NOT return the JSON schema or 'properties' key. Return ONLY the raw JSON data matching the structure.
+"""
+
+FULL_ANALYSIS = """Ты — главный фактчекер (Chief Fact-Checker). 
+Твоя задача — определить достоверность утверждения на $output_lang языке.
+
+Утверждение: "$text"$rec_line
+
+Источники:
+$sources_text
+
+Проанализируй:
+1. Соответствие утверждения источникам.
+2. Предвзятость или манипулятивные формулировки.
+3. Вероятность того, что утверждение является ложным.
+
+Ответ дай строго в формате JSON:
+{
+  "verdict": "real | fake | controversial",
+  "confidence": 0.0-1.0,
+  "bias_identification": "Текстовое описание предвзятости",
+  "detailed_explanation": "Развернутое объяснение вывода",
+  "sources": [{ "title": "...", "url": "...", "description": "..." }],
+  "search_suggestions": ["ключевое слово 1", "ключевое слово 2"]
+}"""
+
+BATCH_ANALYSIS = """Ты — главный фактчекер (Chief Fact-Checker).
+Проверь КАЖДОЕ утверждение ниже НЕЗАВИСИМО от остальных. Ответы пиши на $output_lang языке.
+
+$claims_text
+
+Для каждого утверждения проанализируй соответствие источникам, предвзятость и вероятность ложности.
+
+Ответ дай строго в формате JSON — массив, по одному объекту на каждый id:
+[
+  {
+    "id": 0,
+    "verdict": "real | fake | controversial",
+    "confidence": 0.0-1.0,
+    "bias_identification": "Текстовое описание предвзятости",
+    "detailed_explanation": "Развернутое объяснение вывода",
+    "sources": [{ "title": "...", "url": "...", "description": "..." }],
+    "search_suggestions": ["ключевое слово 1", "ключевое слово 2"]
+  }
+]"""
+
+BATCH_CLAIM = """### Утверждение id=$claim_id
+"$text"
+Источники:
+$sources_text"""
+
+# имя -> (тело шаблона, системная заметка или None)
+TEMPLATES = {
+    "full_analysis": (FULL_ANALYSIS, "text"),
+    "url_full_analysis": (FULL_ANALYSIS, "short"),
+    "batch_analysis": (BATCH_ANALYSIS, "text"),
+    "batch_claim": (BATCH_CLAIM, None),
+    "vision_analysis": (VISION_ANALYSIS, "vision"),
+    "url_vision_analysis": (VISION_ANALYSIS, "short"),
+}
+
+# Необязательные поля и их значения по умолчанию
+FIELD_DEFAULTS = {"rec_line": ""}
+
+
+class CompiledPrompt:
+    """Шаблон, разобранный на литералы и динамические поля; статические поля уже подставлены."""
+
+    def __init__(self, name: str, language: str, source: str, static: Dict[str, str]):
+        self.name = name
+        self.language = language
+        # Сначала делим исходный текст, потом подставляем статику — так "$" внутри
+        # подставленных значений (например, "$defs" в JSON-схеме) не станет полем
+        raw = _FIELD.split(source)
+        literals, fields = [raw[0]], []
+        for i in range(1, len(raw), 2):
+            field, literal = raw[i], raw[i + 1]
+            if field in static:
+                literals[-1] += static[field] + literal
+            else:
+                fields.append(field)
+                literals.append(literal)
+        self.literals: List[str] = literals
+        self.fields: List[str] = fields
+        static_text = "".join(literals)
+        self.static_chars = len(static_text)
+        self.static_tokens = estimate_tokens(static_text)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        out = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            value = values[field] if field in values else FIELD_DEFAULTS[field]
+            out.append(str(value))
+            out.append(literal)
+        return "".join(out)
+
+
+class _SizeStats:
+    __slots__ = ("renders", "total_chars", "max_chars", "last_chars", "total_tokens")
+
+    def __init__(self):
+        self.renders = 0
+        self.total_chars = 0
+        self.max_chars = 0
+        self.last_chars = 0
+        self.total_tokens = 0
+
+    def observe(self, chars: int, tokens: int) -> None:
+        self.renders += 1
+        self.total_chars += chars
+        self.max_chars = max(self.max_chars, chars)
+        self.last_chars = chars
+        self.total_tokens += tokens
+
+
+class PromptRegistry:
+    """
+    Скомпилированные шаблоны для всех (шаблон, язык).
+    schemas: {"vision": GeminiVisionAnalysisInternal, ...} — JSON-схемы сериализуются один раз.
+    """
+
+    def __init__(self, schemas: Optional[Dict[str, Type[BaseModel]]] = None,
+                 languages: Iterable[str] = tuple(LANGUAGE_NAMES)):
+        self.schema_json: Dict[str, str] = {
+            name: json.dumps(model.model_json_schema(), indent=2, ensure_ascii=False)
+            for name, model in (schemas or {}).items()
+        }
+        self.languages = tuple(languages)
+        self._compiled: Dict[tuple, CompiledPrompt] = {}
+        self._stats: Dict[str, _SizeStats] = {name: _SizeStats() for name in TEMPLATES}
+        self._lock = threading.Lock()
+        for name, (body, note) in TEMPLATES.items():
+            source = (DATE_NOTES[note] + body) if note else body
+            for language in self.languages:
+                static = {"output_lang": LANGUAGE_NAMES.get(language, LANGUAGE_NAMES[DEFAULT_OUTPUT_LANGUAGE])}
+                if "vision" in self.schema_json:
+                    static["schema_json"] = self.schema_json["vision"]
+                self._compiled[(name, language)] = CompiledPrompt(name, language, source, static)
+
+    def get(self, name: str, language: str) -> CompiledPrompt:
+        compiled = self._compiled.get((name, language))
+        if compiled is None:
+            compiled = self._compiled[(name, DEFAULT_OUTPUT_LANGUAGE)]
+        return compiled
+
+    def render(self, name: str, language: str, **values: Any) -> str:
+        """Отрисовывает шаблон; current_date подставляется автоматически."""
+        compiled = self.get(name, language)
+        if "current_date" in compiled.fields and "current_date" not in values:
+            values["current_date"] = datetime.now().strftime("%Y-%m-%d (%A)")
+        prompt = compiled.render(values)
+        with self._lock:
+            self._stats[name].observe(len(prompt), estimate_tokens(prompt))
+        return prompt
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        with self._lock:
+            for name, s in self._stats.items():
+                result[name] = {
+                    "static_tokens": {lang: self._compiled[(name, lang)].static_tokens for lang in self.languages},
+                    "renders": s.renders,
+                    "avg_chars": round(s.total_chars / s.renders, 1) if s.renders else 0,
+                    "max_chars": s.max_chars,
+                    "last_chars": s.last_chars,
+                    "avg_tokens": round(s.total_tokens / s.renders, 1) if s.renders else 0,
+                }
+        return result
@@ -0,0 +1,200 @@
+# backend/rate_limit.py
+"""
+Единый rate limiting для пользователей, гостей и Telegram.
+
+Счетчики живут в Redis; проверка и списание — один Lua-скрипт (один round
+trip, атомарно): скользящее окно (sliding window counter) — текущее окно
+плюс доля предыдущего. Отклоненный запрос лимит не расходует.
+
+Политики (limit за window секунд):
+- user      — USER_DAILY_REQUEST_LIMIT в сутки на user_id;
+- guest     — GUEST_REQUEST_LIMIT за GUEST_WINDOW_SECONDS на IP;
+- telegram  — TELEGRAM_USER_DAILY_LIMIT в сутки на Telegram user_id.
+
+Без Redis (не настроен, недоступен по is_available — например,
+RedisManager.available — или ошибка скрипта) работает локальный уровень:
+token bucket в памяти процесса на каждую identity (емкость limit, пополнение
+limit/window). Лимит при этом считается на процесс, а не на весь кластер.
+
+prefilter — token bucket перед Redis (для гостей — на IP): явный флуд
+отклоняется без сетевого вызова.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 60 * 60 * 24
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", 10000))
+GUEST_PREFILTER_RATE = float(os.getenv("GUEST_PREFILTER_RATE", 1))  # токенов в секунду на IP
+GUEST_PREFILTER_BURST = float(os.getenv("GUEST_PREFILTER_BURST", 5))
+
+# KEYS[1] — HASH счетчиков по номерам окон; ARGV: limit, window_ms, cost
+# Возвращает {allowed (0/1), count после списания (или текущий при отказе), retry_after_ms}
+SLIDING_WINDOW_LUA = """
+pcall(redis.replicate_commands)
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local current = math.floor(now / window_ms)
+local current_count = tonumber(redis.call('HGET', key, tostring(current)) or '0')
+local previous_count = tonumber(redis.call('HGET', key, tostring(current - 1)) or '0')
+local elapsed = (now % window_ms) / window_ms
+local estimated = math.floor(previous_count * (1 - elapsed) + current_count)
+
+if cost > 0 and estimated + cost > limit then
+    -- когда доля предыдущего окна "выветрится" настолько, чтобы поместился cost
+    local retry_ms = window_ms - (now % window_ms)
+    if previous_count > 0 and current_count + cost <= limit then
+        local need_elapsed = 1 - (limit - current_count - cost) / previous_count
+        retry_ms = math.max(1, math.ceil((need_elapsed - elapsed) * window_ms))
+    end
+    return {0, estimated, retry_ms}
+end
+
+if cost > 0 then
+    redis.call('HINCRBY', key, tostring(current), cost)
+    redis.call('HDEL', key, tostring(current - 2))
+    redis.call('PEXPIRE', key, window_ms * 2)
+end
+return {1, estimated + cost, 0}
+"""
+
+
+class TokenBuckets:
+    """
+    Token bucket на ключ в памяти процесса, не больше max_keys ключей.
+    dict хранит порядок вставки; ключ переставляется в конец при обращении,
+    при переполнении вытесняются самые давние (LRU). Вытесненный ключ
+    начинает с полного bucket — то же, что долго молчавший клиент.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max(1, max_keys)
+        self._buckets: Dict[Any, Tuple[float, float]] = {}  # key -> (токены, время обновления)
+        self.evictions = 0
+
+    def _level(self, key: Any, now: float) -> float:
+        tokens, updated = self._buckets.pop(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def take(self, key: Any, cost: float = 1, now: Optional[float] = None) -> Tuple[bool, float, float]:
+        """Возвращает (allowed, оставшиеся токены, retry_after_seconds)."""
+        now = time.monotonic() if now is None else now
+        tokens = self._level(key, now)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+            self.evictions += 1
+        retry_after = 0.0 if allowed else (cost - tokens) / self.rate if self.rate > 0 else float("inf")
+        return allowed, tokens, retry_after
+
+    def level(self, key: Any, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        if key not in self._buckets:
+            return self.capacity
+        tokens = self._level(key, now)
+        self._buckets[key] = (tokens, now)
+        return tokens
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    """
+    hit(policy, identity, cost) — проверить и списать; peek(...) — только посмотреть.
+    Оба возвращают (allowed, count, retry_after_seconds).
+    """
+
+    KEY_PREFIX = "rl:"
+
+    def __init__(self, redis_client=None, policies: Optional[Dict[str, Tuple[int, int]]] = None,
+                 is_available: Optional[Callable[[], bool]] = None,
+                 prefilter: Optional[Dict[str, Tuple[float, float]]] = None,
+                 local_max_keys: int = RATE_LIMIT_LOCAL_MAX_KEYS):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.policies: Dict[str, Tuple[int, int]] = dict(policies or {})
+        self._script = redis_client.register_script(SLIDING_WINDOW_LUA) if redis_client is not None else None
+        # Локальный уровень: тот же limit за window, но token bucket в памяти процесса
+        self._local: Dict[str, TokenBuckets] = {
+            name: TokenBuckets(rate=limit / window, capacity=limit, max_keys=local_max_keys)
+            for name, (limit, window) in self.policies.items()
+        }
+        # policy -> (токенов в секунду, burst)
+        self._prefilter: Dict[str, TokenBuckets] = {
+            name: TokenBuckets(rate=rate, capacity=burst, max_keys=local_max_keys)
+            for name, (rate, burst) in (prefilter or {}).items()
+        }
+        self.counters: Dict[str, Dict[str, int]] = {
+            name: {"allowed": 0, "rejected": 0, "errors": 0, "local": 0, "prefiltered": 0}
+            for name in self.policies
+        }
+
+    def limit(self, policy: str) -> int:
+        return self.policies[policy][0]
+
+    def _call_local(self, policy: str, identity: Any, cost: int) -> Tuple[bool, int, float]:
+        self.counters[policy]["local"] += 1
+        buckets, limit = self._local[policy], self.limit(policy)
+        if cost == 0:
+            return True, round(limit - buckets.level(identity)), 0.0
+        allowed, tokens, retry_after = buckets.take(identity, cost)
+        return allowed, round(limit - tokens), retry_after
+
+    async def _call(self, policy: str, identity: Any, cost: int) -> Tuple[bool, int, float]:
+        limit, window = self.policies[policy]
+        if self._script is None or (self.is_available is not None and not self.is_available()):
+            return self._call_local(policy, identity, cost)
+        try:
+            allowed, count, retry_ms = await self._script(
+                keys=[f"{self.KEY_PREFIX}{policy}:{identity}"], args=[limit, window * 1000, cost]
+            )
+        except Exception as e:
+            self.counters[policy]["errors"] += 1
+            logger.error(f"❌ Rate limit ({policy}): ошибка Redis: {e}; локальный лимит.")
+            return self._call_local(policy, identity, cost)
+        return bool(allowed), int(count), int(retry_ms) / 1000
+
+    async def hit(self, policy: str, identity: Any, cost: int = 1) -> Tuple[bool, int, float]:
+        cost = max(1, cost)
+        prefilter = self._prefilter.get(policy)
+        if prefilter is not None:
+            allowed, _, retry_after = prefilter.take(identity, cost)
+            if not allowed:
+                self.counters[policy]["prefiltered"] += 1
+                self.counters[policy]["rejected"] += 1
+                return False, self.limit(policy), retry_after
+        result = await self._call(policy, identity, cost)
+        self.counters[policy]["allowed" if result[0] else "rejected"] += 1
+        return result
+
+    async def peek(self, policy: str, identity: Any) -> Tuple[bool, int, float]:
+        return await self._call(policy, identity, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self._script is not None else "local",
+            "policies": {
+                name: {
+                    "limit": limit, "window_seconds": window, **self.counters[name],
+                    "local_keys": len(self._local[name]),
+                    "local_evictions": self._local[name].evictions,
+                    **({"prefilter_keys": len(self._prefilter[name])} if name in self._prefilter else {}),
+                }
+                for name, (limit, window) in self.policies.items()
+            },
+        }
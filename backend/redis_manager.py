@@ -0,0 +1,162 @@
+# backend/redis_manager.py
+"""
+Один асинхронный клиент Redis на процесс и фоновая проверка его здоровья.
+
+Раньше get_redis() делал PING перед каждым запросом (лишний round trip на
+/analyze_image, /analyze_url). RedisManager пингует Redis в фоне каждые
+REDIS_HEALTH_INTERVAL секунд и хранит состояние (available, задержка,
+число сбоев), а get() сразу отдает готовый клиент — или None, пока Redis
+недоступен.
+
+Клиент создается даже если Redis при старте лежит: пул redis-py сам
+переподключается (Retry с экспоненциальной задержкой), а фоновая проверка
+замечает, когда Redis вернулся.
+
+Компоненты с необязательным Redis (кэши, single-flight, журнал write-behind...)
+наследуют OptionalRedis и получают is_available=manager.is_available: пока
+Redis недоступен, их self.redis — None, и запрос идет по пути «без Redis»,
+не дожидаясь REDIS_CONNECT_TIMEOUT в каждом компоненте.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+logger = logging.getLogger(__name__)
+
+REDIS_HEALTH_INTERVAL = float(os.getenv("REDIS_HEALTH_INTERVAL", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5.0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5.0))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100))
+
+
+class OptionalRedis:
+    """
+    self.redis — клиент, пока is_available() истинно (или проверка не задана),
+    иначе None. Присваивание self.redis задает сам клиент.
+    """
+
+    _redis_client = None
+    is_available: Optional[Callable[[], bool]] = None
+
+    @property
+    def redis(self):
+        if self._redis_client is None or (self.is_available is not None and not self.is_available()):
+            return None
+        return self._redis_client
+
+    @redis.setter
+    def redis(self, client) -> None:
+        self._redis_client = client
+
+
+class RedisManager:
+    def __init__(self, url: Optional[str] = None, client=None,
+                 health_interval: float = REDIS_HEALTH_INTERVAL):
+        self.url = url
+        self.health_interval = health_interval
+        self.client = client
+        if self.client is None and url:
+            self.client = aioredis.from_url(
+                url,
+                decode_responses=True,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), retries=1),  # оборванное соединение после рестарта Redis
+                retry_on_error=[RedisConnectionError, RedisTimeoutError],
+            )
+        self.available = False
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, Any] = {
+            "checks": 0, "failures": 0, "outages": 0, "recoveries": 0,
+            "last_latency_ms": None, "last_error": None,
+        }
+        self._state_since = time.monotonic()
+
+    @property
+    def configured(self) -> bool:
+        return self.client is not None
+
+    def get(self):
+        """Готовый клиент без сетевого вызова; None, если Redis не настроен или недоступен."""
+        return self.client if self.available else None
+
+    def is_available(self) -> bool:
+        """Для OptionalRedis и RateLimiter (is_available=manager.is_available)."""
+        return self.available
+
+    async def check(self) -> bool:
+        """Один PING; обновляет available и счетчики."""
+        if self.client is None:
+            return False
+        self.counters["checks"] += 1
+        started = time.monotonic()
+        try:
+            await self.client.ping()
+            ok = True
+            self.counters["last_latency_ms"] = round((time.monotonic() - started) * 1000, 2)
+        except Exception as e:
+            ok = False
+            self.counters["failures"] += 1
+            self.counters["last_error"] = str(e)
+        if ok != self.available and self.counters["checks"] > 1:
+            self._state_since = time.monotonic()
+            if ok:
+                self.counters["recoveries"] += 1
+                logger.info("✅ Redis доступен.")
+            else:
+                self.counters["outages"] += 1
+                logger.error(f"❌ Redis недоступен: {self.counters['last_error']}")
+        self.available = ok
+        return ok
+
+    async def start(self) -> bool:
+        """Первая проверка (ее результат — состояние при старте) и фоновый цикл."""
+        if self.client is None:
+            logger.warning("⚠️ REDIS_URL не задан, Redis не используется.")
+            return False
+        ok = await self.check()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return ok
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Проверка Redis упала: {e}", exc_info=True)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.client is not None:
+            await self.client.aclose()
+        self.available = False
+
+    def stats(self) -> Dict[str, Any]:
+        pool = getattr(self.client, "connection_pool", None)
+        return {
+            **self.counters,
+            "configured": self.configured,
+            "available": self.available,
+            "state_seconds": round(time.monotonic() - self._state_since, 1),
+            "pool": {
+                "max_connections": getattr(pool, "max_connections", None),
+                "in_use": len(getattr(pool, "_in_use_connections", ()) or ()),
+                "idle": len(getattr(pool, "_available_connections", ()) or ()),
+            } if pool is not None else None,
+        }
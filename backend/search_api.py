@@ -3,8 +3,10 @@ TruthLens AI - Web Search Module
 Real-time web search for evidence gathering
 """
 
+import asyncio
 import requests
-from typing import List, Dict, Optional
+import httpx
+from typing import List, Dict, Optional, Tuple
 import logging
 import os
 from bs4 import BeautifulSoup
@@ -13,6 +15,93 @@ import time
 
 logger = logging.getLogger(__name__)
 
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", 10))
+SEARCH_MAX_CONNECTIONS = int(os.getenv("SEARCH_MAX_CONNECTIONS", 100))
+SEARCH_MAX_KEEPALIVE = int(os.getenv("SEARCH_MAX_KEEPALIVE", 20))
+SEARCH_KEEPALIVE_EXPIRY = float(os.getenv("SEARCH_KEEPALIVE_EXPIRY", 30))
+
+# Default endpoints (overridable, e.g. to point tests at local stub servers)
+DEFAULT_ENDPOINTS = {
+    "serpapi": "https://serpapi.com/search",
+    "bing": "https://api.bing.microsoft.com/v7.0/search",
+    "google": "https://www.googleapis.com/customsearch/v1",
+    "fallback": "https://html.duckduckgo.com/html/",
+}
+
+PROVIDER_NAMES = {
+    "serpapi": "SerpAPI",
+    "bing": "Bing API",
+    "google": "Google API",
+    "fallback": "Fallback search",
+}
+
+# Hedged search: fire the next provider if the current one is slower than its usual latency
+SEARCH_HEDGE = os.getenv("SEARCH_HEDGE", "False").lower() in ("true", "1", "t")
+SEARCH_HEDGE_DELAY_MS = float(os.getenv("SEARCH_HEDGE_DELAY_MS", 800))
+SEARCH_HEDGE_MIN_DELAY_MS = float(os.getenv("SEARCH_HEDGE_MIN_DELAY_MS", 100))
+SEARCH_HEDGE_MAX_DELAY_MS = float(os.getenv("SEARCH_HEDGE_MAX_DELAY_MS", 3000))
+SEARCH_HEDGE_QUANTILE = float(os.getenv("SEARCH_HEDGE_QUANTILE", 0.95))
+SEARCH_HEDGE_MIN_SAMPLES = int(os.getenv("SEARCH_HEDGE_MIN_SAMPLES", 20))
+
+# Histogram bucket upper bounds, milliseconds
+LATENCY_BUCKETS_MS = (25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Bucketed latency histogram with exponential decay
+    Counts are halved every `window` observations, so quantiles follow recent behaviour
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, window: int = 500):
+        self.buckets = tuple(buckets)
+        self.counts = [0.0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.window = window
+        self.observations = 0
+        self.errors = 0
+        self._since_decay = 0
+        self.total_ms = 0.0
+
+    def observe(self, latency_ms: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if latency_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.observations += 1
+        self.total_ms += latency_ms
+        self._since_decay += 1
+        if self._since_decay >= self.window:
+            self.counts = [c / 2 for c in self.counts]
+            self._since_decay = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None without data)"""
+        total = sum(self.counts)
+        if total <= 0:
+            return None
+        threshold = q * total
+        cumulative = 0.0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return float(self.buckets[i]) if i < len(self.buckets) else float(self.buckets[-1])
+        return float(self.buckets[-1])
+
+    def snapshot(self) -> Dict:
+        return {
+            "observations": self.observations,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.observations, 1) if self.observations else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": {
+                **{f"le_{bound}": round(count, 2) for bound, count in zip(self.buckets, self.counts)},
+                "le_inf": round(self.counts[-1], 2),
+            },
+        }
+
 
 class WebSearcher:
     """
@@ -20,8 +109,29 @@ class WebSearcher:
     Supports multiple search APIs: SerpAPI, Bing, Google Custom Search
     """
     
-    def __init__(self):
-        """Initialize web searcher with available API keys"""
+    def __init__(
+        self,
+        endpoints: Optional[Dict[str, str]] = None,
+        timeout: float = SEARCH_TIMEOUT,
+        hedge: bool = SEARCH_HEDGE,
+        hedge_delay_ms: float = SEARCH_HEDGE_DELAY_MS,
+        cache=None
+    ):
+        """
+        Initialize web searcher with available API keys
+
+        Args:
+            endpoints: Override provider URLs (e.g. local stub servers)
+            timeout: Per-request timeout, seconds
+            hedge: Enable hedged multi-provider search
+            hedge_delay_ms: Hedge delay used until latency samples exist
+            cache: Optional SearchCache used by asearch()
+        """
+        self.endpoints = {**DEFAULT_ENDPOINTS, **(endpoints or {})}
+        self.timeout = timeout
+        self.cache = cache
+        self._async_client: Optional[httpx.AsyncClient] = None
+
         self.serp_api_key = os.getenv("SERP_API_KEY")
         self.bing_api_key = os.getenv("BING_API_KEY")
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
@@ -40,6 +150,21 @@ class WebSearcher:
         else:
             self.search_method = "fallback"
             logger.warning("No API keys found. Using fallback search method")
+
+        # Every configured provider, in priority order (used by hedged search)
+        self.providers = [p for p, ok in (
+            ("serpapi", bool(self.serp_api_key)),
+            ("bing", bool(self.bing_api_key)),
+            ("google", bool(self.google_api_key and self.google_cx)),
+        ) if ok] or ["fallback"]
+
+        self.hedge = hedge and len(self.providers) > 1
+        self.hedge_delay_ms = hedge_delay_ms
+        self.latency = {p: LatencyHistogram() for p in self.providers}
+        self.hedges_fired = 0
+        self.wins = {p: 0 for p in self.providers}
+        if self.hedge:
+            logger.info(f"Hedged search enabled across providers: {self.providers}")
         
         # Trusted sources by language
         self.trusted_sources = {
@@ -91,113 +216,151 @@ class WebSearcher:
             logger.error(f"Search error: {e}")
             return []
     
-    def _search_serpapi(self, query: str, language: str, max_results: int) -> List[Dict]:
-        """Search using SerpAPI"""
-        try:
-            url = "https://serpapi.com/search"
-            
-            # Language mapping
-            lang_map = {"en": "en", "ru": "ru", "kz": "kk"}
-            
-            params = {
+    # ------------------------------------------------------------------
+    # Provider request builders / response parsers
+    # (shared by the blocking and the async code paths)
+    # ------------------------------------------------------------------
+    def _serpapi_request(self, query: str, language: str, max_results: int) -> Dict:
+        # Language mapping
+        lang_map = {"en": "en", "ru": "ru", "kz": "kk"}
+        return {
+            "method": "GET",
+            "url": self.endpoints["serpapi"],
+            "params": {
                 "q": query,
                 "api_key": self.serp_api_key,
                 "num": max_results,
                 "hl": lang_map.get(language, "en")
             }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            results = []
-            for item in data.get("organic_results", []):
+        }
+
+    def _parse_serpapi(self, data: Dict, max_results: int) -> List[Dict]:
+        results = []
+        for item in data.get("organic_results", []):
+            results.append({
+                "title": item.get("title", ""),
+                "url": item.get("link", ""),
+                "snippet": item.get("snippet", ""),
+                "source": item.get("source", "")
+            })
+        return results
+
+    def _bing_request(self, query: str, language: str, max_results: int) -> Dict:
+        # Language mapping
+        lang_map = {"en": "en-US", "ru": "ru-RU", "kz": "kk-KZ"}
+        return {
+            "method": "GET",
+            "url": self.endpoints["bing"],
+            "headers": {"Ocp-Apim-Subscription-Key": self.bing_api_key},
+            "params": {
+                "q": query,
+                "count": max_results,
+                "mkt": lang_map.get(language, "en-US"),
+                "responseFilter": "Webpages"
+            }
+        }
+
+    def _parse_bing(self, data: Dict, max_results: int) -> List[Dict]:
+        results = []
+        for item in data.get("webPages", {}).get("value", []):
+            results.append({
+                "title": item.get("name", ""),
+                "url": item.get("url", ""),
+                "snippet": item.get("snippet", ""),
+                "source": item.get("displayUrl", "")
+            })
+        return results
+
+    def _google_request(self, query: str, language: str, max_results: int) -> Dict:
+        # Language mapping
+        lang_map = {"en": "lang_en", "ru": "lang_ru", "kz": "lang_kk"}
+        return {
+            "method": "GET",
+            "url": self.endpoints["google"],
+            "params": {
+                "q": query,
+                "key": self.google_api_key,
+                "cx": self.google_cx,
+                "num": min(max_results, 10),
+                "lr": lang_map.get(language, "lang_en")
+            }
+        }
+
+    def _parse_google(self, data: Dict, max_results: int) -> List[Dict]:
+        results = []
+        for item in data.get("items", []):
+            results.append({
+                "title": item.get("title", ""),
+                "url": item.get("link", ""),
+                "snippet": item.get("snippet", ""),
+                "source": item.get("displayLink", "")
+            })
+        return results
+
+    def _fallback_request(self, query: str, language: str, max_results: int) -> Dict:
+        # DuckDuckGo HTML search
+        return {
+            "method": "POST",
+            "url": self.endpoints["fallback"],
+            "data": {"q": query},
+            "headers": {
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            }
+        }
+
+    def _parse_fallback(self, html: str, max_results: int) -> List[Dict]:
+        soup = BeautifulSoup(html, 'html.parser')
+
+        results = []
+        for result in soup.find_all('div', class_='result')[:max_results]:
+            title_tag = result.find('a', class_='result__a')
+            snippet_tag = result.find('a', class_='result__snippet')
+
+            if title_tag:
                 results.append({
-                    "title": item.get("title", ""),
-                    "url": item.get("link", ""),
-                    "snippet": item.get("snippet", ""),
-                    "source": item.get("source", "")
+                    "title": title_tag.get_text(strip=True),
+                    "url": title_tag.get('href', ''),
+                    "snippet": snippet_tag.get_text(strip=True) if snippet_tag else "",
+                    "source": "web"
                 })
-            
-            return results
-            
+        return results
+
+    # ------------------------------------------------------------------
+    # Blocking providers
+    # ------------------------------------------------------------------
+    def _search_serpapi(self, query: str, language: str, max_results: int) -> List[Dict]:
+        """Search using SerpAPI"""
+        try:
+            req = self._serpapi_request(query, language, max_results)
+            response = requests.request(req.pop("method"), req.pop("url"), timeout=self.timeout, **req)
+            response.raise_for_status()
+            return self._parse_serpapi(response.json(), max_results)
         except Exception as e:
             logger.error(f"SerpAPI error: {e}")
             return []
-    
+
     def _search_bing(self, query: str, language: str, max_results: int) -> List[Dict]:
         """Search using Bing Search API"""
         try:
-            url = "https://api.bing.microsoft.com/v7.0/search"
-            
-            # Language mapping
-            lang_map = {"en": "en-US", "ru": "ru-RU", "kz": "kk-KZ"}
-            
-            headers = {
-                "Ocp-Apim-Subscription-Key": self.bing_api_key
-            }
-            
-            params = {
-                "q": query,
-                "count": max_results,
-                "mkt": lang_map.get(language, "en-US"),
-                "responseFilter": "Webpages"
-            }
-            
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            req = self._bing_request(query, language, max_results)
+            response = requests.request(req.pop("method"), req.pop("url"), timeout=self.timeout, **req)
             response.raise_for_status()
-            data = response.json()
-            
-            results = []
-            for item in data.get("webPages", {}).get("value", []):
-                results.append({
-                    "title": item.get("name", ""),
-                    "url": item.get("url", ""),
-                    "snippet": item.get("snippet", ""),
-                    "source": item.get("displayUrl", "")
-                })
-            
-            return results
-            
+            return self._parse_bing(response.json(), max_results)
         except Exception as e:
             logger.error(f"Bing API error: {e}")
             return []
-    
+
     def _search_google(self, query: str, language: str, max_results: int) -> List[Dict]:
         """Search using Google Custom Search API"""
         try:
-            url = "https://www.googleapis.com/customsearch/v1"
-            
-            # Language mapping
-            lang_map = {"en": "lang_en", "ru": "lang_ru", "kz": "lang_kk"}
-            
-            params = {
-                "q": query,
-                "key": self.google_api_key,
-                "cx": self.google_cx,
-                "num": min(max_results, 10),
-                "lr": lang_map.get(language, "lang_en")
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
+            req = self._google_request(query, language, max_results)
+            response = requests.request(req.pop("method"), req.pop("url"), timeout=self.timeout, **req)
             response.raise_for_status()
-            data = response.json()
-            
-            results = []
-            for item in data.get("items", []):
-                results.append({
-                    "title": item.get("title", ""),
-                    "url": item.get("link", ""),
-                    "snippet": item.get("snippet", ""),
-                    "source": item.get("displayLink", "")
-                })
-            
-            return results
-            
+            return self._parse_google(response.json(), max_results)
         except Exception as e:
             logger.error(f"Google API error: {e}")
             return []
-    
+
     def _search_fallback(self, query: str, language: str, max_results: int) -> List[Dict]:
         """
         Fallback search method using DuckDuckGo HTML scraping
@@ -205,41 +368,196 @@ class WebSearcher:
         """
         try:
             logger.info("Using fallback search (DuckDuckGo)")
-            
-            # DuckDuckGo HTML search
-            url = "https://html.duckduckgo.com/html/"
-            params = {"q": query}
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            
-            response = requests.post(url, data=params, headers=headers, timeout=10)
+            req = self._fallback_request(query, language, max_results)
+            response = requests.request(req.pop("method"), req.pop("url"), timeout=self.timeout, **req)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            results = []
-            for result in soup.find_all('div', class_='result')[:max_results]:
-                title_tag = result.find('a', class_='result__a')
-                snippet_tag = result.find('a', class_='result__snippet')
-                
-                if title_tag:
-                    results.append({
-                        "title": title_tag.get_text(strip=True),
-                        "url": title_tag.get('href', ''),
-                        "snippet": snippet_tag.get_text(strip=True) if snippet_tag else "",
-                        "source": "web"
-                    })
-            
-            return results
-            
+            return self._parse_fallback(response.text, max_results)
         except Exception as e:
             logger.error(f"Fallback search error: {e}")
-            
+
             # Return mock results for demo purposes
             return self._get_mock_results(query, language)
-    
+
+    # ------------------------------------------------------------------
+    # Async providers (shared pooled httpx.AsyncClient)
+    # ------------------------------------------------------------------
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Return the long-lived pooled client, creating it on first use"""
+        if self._async_client is None or self._async_client.is_closed:
+            try:
+                import h2  # noqa: F401 -- HTTP/2 support is optional
+                http2 = True
+            except ImportError:
+                logger.warning("Package 'h2' is not installed. Async search uses HTTP/1.1")
+                http2 = False
+            self._async_client = httpx.AsyncClient(
+                http2=http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=SEARCH_MAX_CONNECTIONS,
+                    max_keepalive_connections=SEARCH_MAX_KEEPALIVE,
+                    keepalive_expiry=SEARCH_KEEPALIVE_EXPIRY
+                ),
+                follow_redirects=True
+            )
+        return self._async_client
+
+    async def _asearch_provider(self, provider: str, query: str, language: str, max_results: int) -> List[Dict]:
+        """Run one provider through the pooled async client (raises on HTTP errors)"""
+        req = getattr(self, f"_{provider}_request")(query, language, max_results)
+        client = self._get_async_client()
+        response = await client.request(req.pop("method"), req.pop("url"), **req)
+        response.raise_for_status()
+        parse = getattr(self, f"_parse_{provider}")
+        if provider == "fallback":
+            return parse(response.text, max_results)
+        return parse(response.json(), max_results)
+
+    async def _fetch_results(self, query: str, language: str, max_results: int) -> Optional[List[Dict]]:
+        """Raw provider results (hedged or single provider); None if the provider failed"""
+        if self.hedge:
+            results, _provider = await self._hedged_search(query, language, max_results)
+            return results
+        return await self._timed_provider(self.search_method, query, language, max_results)
+
+    async def asearch(
+        self,
+        query: str,
+        language: str = "en",
+        max_results: int = 5,
+        prioritize_trusted: bool = True
+    ) -> List[Dict]:
+        """
+        Non-blocking version of search() for use inside async handlers
+
+        Args:
+            query: Search query
+            language: Language code (en/ru/kz)
+            max_results: Maximum number of results
+            prioritize_trusted: Prioritize trusted sources
+
+        Returns:
+            List of search results with title, url, snippet
+        """
+        try:
+            logger.info(f"Searching (async): '{query}' (lang: {language}, max: {max_results})")
+
+            if self.cache is not None:
+                provider_key = ",".join(self.providers) if self.hedge else self.search_method
+                results = await self.cache.get_or_fetch(
+                    (provider_key, query, language, max_results),
+                    lambda: self._fetch_results(query, language, max_results)
+                )
+            else:
+                results = await self._fetch_results(query, language, max_results)
+
+            if results is None:
+                # Return mock results for demo purposes (fallback search only)
+                results = self._get_mock_results(query, language) if self.search_method == "fallback" else []
+
+            # Filter and prioritize trusted sources
+            if prioritize_trusted:
+                results = self._prioritize_trusted_sources(results, language)
+
+            logger.info(f"Found {len(results)} search results")
+            return results[:max_results]
+
+        except Exception as e:
+            logger.error(f"Search error: {e}")
+            return []
+
+    def hedge_delay(self, provider: str) -> float:
+        """
+        Hedge delay in seconds for a provider
+        The configured quantile of its recent latency, clamped to [min, max];
+        the static SEARCH_HEDGE_DELAY_MS until enough samples are collected
+        """
+        histogram = self.latency.get(provider)
+        delay_ms = self.hedge_delay_ms
+        if histogram and histogram.observations >= SEARCH_HEDGE_MIN_SAMPLES:
+            delay_ms = histogram.quantile(SEARCH_HEDGE_QUANTILE) or delay_ms
+        return min(max(delay_ms, SEARCH_HEDGE_MIN_DELAY_MS), SEARCH_HEDGE_MAX_DELAY_MS) / 1000
+
+    async def _timed_provider(self, provider: str, query: str, language: str, max_results: int) -> Optional[List[Dict]]:
+        """Run a provider and record its latency (errors are counted, not timed; None on error)"""
+        started = time.perf_counter()
+        try:
+            results = await self._asearch_provider(provider, query, language, max_results)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.latency[provider].errors += 1
+            logger.error(f"{PROVIDER_NAMES[provider]} error: {e}")
+            return None
+        self.latency[provider].observe((time.perf_counter() - started) * 1000)
+        return results
+
+    async def _hedged_search(self, query: str, language: str, max_results: int) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Query providers in priority order, starting the next one whenever the
+        current one is slower than its hedge delay or comes back empty.
+        The first non-empty result wins; the remaining requests are cancelled.
+
+        Returns:
+            (results, winning provider or None); results is [] if providers
+            answered with nothing and None if every provider failed
+        """
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        answered = False
+
+        def launch():
+            nonlocal next_index
+            provider = self.providers[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._timed_provider(provider, query, language, max_results))
+            pending[task] = provider
+            return provider
+
+        last_launched = launch()
+        try:
+            while pending:
+                can_hedge = next_index < len(self.providers)
+                timeout = self.hedge_delay(last_launched) if can_hedge else None
+                done, _ = await asyncio.wait(pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    provider = pending.pop(task)
+                    results = task.result()
+                    if results:
+                        self.wins[provider] += 1
+                        return results, provider
+                    answered = answered or results is not None
+
+                # Either the hedge delay expired or a provider came back empty
+                if can_hedge:
+                    if not done:
+                        self.hedges_fired += 1
+                        logger.info(f"Hedging search: {PROVIDER_NAMES[last_launched]} slower than {timeout:.2f}s")
+                    last_launched = launch()
+            # Failed providers must not turn into a cached "no results" entry
+            return ([] if answered else None), None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "providers": self.providers,
+            "hedge": self.hedge,
+            "hedges_fired": self.hedges_fired,
+            "wins": self.wins,
+            "hedge_delay_ms": {p: round(self.hedge_delay(p) * 1000, 1) for p in self.providers},
+            "latency": {p: h.snapshot() for p, h in self.latency.items()},
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+    async def aclose(self):
+        """Close the pooled async client (call on application shutdown)"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
     def _get_mock_results(self, query: str, language: str) -> List[Dict]:
         """Generate mock search results for demo/testing"""
         mock_data = {
@@ -0,0 +1,162 @@
+# backend/search_cache.py
+"""
+Кэш результатов веб-поиска со stale-while-revalidate.
+
+Ключ — (провайдер, запрос, язык, max_results). Уровни: in-process LRU и Redis.
+Свежая запись отдается как есть; устаревшая — тоже отдается сразу,
+а в фоне запускается обновление. Пустые результаты живут меньше.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from .caching import TTLCache
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from caching import TTLCache
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 60 * 60))  # свежесть, 1 час
+SEARCH_CACHE_NEGATIVE_TTL = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", 60 * 2))  # "нет результатов", 2 минуты
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", 60 * 60 * 6))  # сколько еще можно отдавать устаревшее
+SEARCH_CACHE_MAX_ITEMS = int(os.getenv("SEARCH_CACHE_MAX_ITEMS", 4096))
+
+
+class SearchCache(OptionalRedis):
+    """
+    Кэш поиска (memory + Redis) с фоновым обновлением устаревших записей.
+    fetch() возвращает список результатов, [] если ничего не найдено,
+    или None при ошибке провайдера (такой ответ не кэшируется).
+    """
+
+    KEY_PREFIX = "search:"
+
+    def __init__(
+        self,
+        redis_client=None,
+        ttl: int = SEARCH_CACHE_TTL,
+        negative_ttl: int = SEARCH_CACHE_NEGATIVE_TTL,
+        stale_ttl: int = SEARCH_CACHE_STALE_TTL,
+        max_items: int = SEARCH_CACHE_MAX_ITEMS,
+        is_available: Optional[Callable[[], bool]] = None,
+    ):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.local = TTLCache(max_items=max_items, ttl=ttl + stale_ttl)
+        self._refreshing: Set[str] = set()
+        self._background: Set[asyncio.Task] = set()
+        self.counters = {
+            "fresh_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "redis_hits": 0,
+            "redis_errors": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(key_parts: Tuple) -> str:
+        provider, query, language, max_results = key_parts
+        digest = hashlib.sha256(query.strip().casefold().encode("utf-8")).hexdigest()[:32]
+        return f"{provider}:{language}:{max_results}:{digest}"
+
+    def _ttl_for(self, results: List[Dict]) -> int:
+        return self.ttl if results else self.negative_ttl
+
+    async def _read(self, key: str) -> Optional[Dict]:
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(self.KEY_PREFIX + key)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            logger.warning(f"⚠️ Search cache: ошибка чтения из Redis: {e}")
+            return None
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+        except (TypeError, ValueError):
+            return None
+        self.counters["redis_hits"] += 1
+        self.local.set(key, entry, ttl=self._ttl_for(entry["results"]) + self.stale_ttl)
+        return entry
+
+    async def _write(self, key: str, results: List[Dict]) -> None:
+        entry = {"results": results, "fetched_at": time.time()}
+        lifetime = self._ttl_for(results) + self.stale_ttl
+        self.local.set(key, entry, ttl=lifetime)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self.KEY_PREFIX + key, json.dumps(entry, ensure_ascii=False), ex=lifetime)
+        except Exception as e:
+            self.counters["redis_errors"] += 1
+            logger.warning(f"⚠️ Search cache: ошибка записи в Redis: {e}")
+
+    async def _fetch_and_store(self, key: str, fetch: Callable[[], Awaitable[Optional[List[Dict]]]]) -> Optional[List[Dict]]:
+        results = await fetch()
+        if results is not None:
+            await self._write(key, results)
+        return results
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[Optional[List[Dict]]]]) -> None:
+        try:
+            self.counters["refreshes"] += 1
+            if await self._fetch_and_store(key, fetch) is None:
+                self.counters["refresh_errors"] += 1
+        except Exception as e:
+            self.counters["refresh_errors"] += 1
+            logger.warning(f"⚠️ Search cache: фоновое обновление {key} не удалось: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: str, fetch: Callable[[], Awaitable[Optional[List[Dict]]]]) -> None:
+        if key in self._refreshing:
+            return  # Обновление уже идет
+        self._refreshing.add(key)
+        task = asyncio.ensure_future(self._refresh(key, fetch))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def get_or_fetch(self, key_parts: Tuple, fetch: Callable[[], Awaitable[Optional[List[Dict]]]]) -> Optional[List[Dict]]:
+        """Возвращает результаты из кэша (свежие или устаревшие) либо вызывает fetch()."""
+        key = self.make_key(key_parts)
+        entry = await self._read(key)
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < self._ttl_for(entry["results"]):
+                self.counters["fresh_hits"] += 1
+            else:
+                self.counters["stale_hits"] += 1
+                self._schedule_refresh(key, fetch)
+            return entry["results"]
+
+        self.counters["misses"] += 1
+        return await self._fetch_and_store(key, fetch)
+
+    def stats(self) -> Dict[str, Any]:
+        served = self.counters["fresh_hits"] + self.counters["stale_hits"]
+        total = served + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(served / total, 4) if total else 0.0,
+            "refreshing": len(self._refreshing),
+            "memory": self.local.stats(),
+            "redis_enabled": self.redis is not None,
+        }
@@ -0,0 +1,109 @@
+# backend/shared_weights.py
+"""
+Общие для воркеров веса моделей через memory-mapped файл.
+
+gunicorn -w 4: при from_pretrained каждый воркер держит свою копию весов
+XLM-R в анонимной памяти. В режиме MODEL_WEIGHTS_MODE=mmap state_dict модели
+один раз сериализуется в WEIGHTS_CACHE_DIR, а затем загружается
+torch.load(mmap=True) + load_state_dict(assign=True): тензоры ссылаются на
+страницы файла в page cache, и все воркеры (и перезапуски воркеров) делят
+одну физическую копию. Инференс веса не пишет, поэтому страницы остаются
+общими (MAP_PRIVATE копирует только при записи).
+
+Замечания:
+- RSS каждого воркера по-прежнему включает общие страницы; реальную цену
+  воркера показывают PSS/Private из /proc/<pid>/smaps_rollup
+  (benchmark_worker_rss.py);
+- только CPU и torch >= 2.1 (torch.load(mmap=...)), иначе обычный from_pretrained;
+- INFERENCE_BACKEND=int8/onnx создают свои копии весов — общими остаются
+  только веса бэкенда torch;
+- файл кэша пересоздается, если файлы локальной модели новее него; запись
+  атомарная (os.replace), так что воркеры при старте не видят недописанный файл.
+"""
+
+import inspect
+import logging
+import os
+import time
+from typing import Optional
+
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification
+
+try:
+    from transformers.modeling_utils import no_init_weights
+except ImportError:  # старые версии transformers: случайная инициализация перед assign
+    no_init_weights = None
+
+try:
+    from .inference_backends import cache_path_for
+except ImportError:
+    from inference_backends import cache_path_for
+
+logger = logging.getLogger(__name__)
+
+MODEL_WEIGHTS_MODE = os.getenv("MODEL_WEIGHTS_MODE", "mmap").lower()  # mmap | copy
+WEIGHTS_CACHE_DIR = os.getenv("WEIGHTS_CACHE_DIR", "backend/models/mmap")
+MMAP_SUPPORTED = "mmap" in inspect.signature(torch.load).parameters
+
+
+def weights_path_for(model_id: str, cache_dir: str = WEIGHTS_CACHE_DIR) -> str:
+    return cache_path_for(model_id, cache_dir, ".pt")
+
+
+def _source_mtime(model_id: str) -> Optional[float]:
+    """Самый новый файл локальной модели; None для моделей из Hugging Face Hub."""
+    if not os.path.isdir(model_id):
+        return None
+    return max((os.path.getmtime(os.path.join(model_id, f)) for f in os.listdir(model_id)), default=None)
+
+
+def is_stale(model_id: str, path: str) -> bool:
+    if not os.path.exists(path):
+        return True
+    source = _source_mtime(model_id)
+    return source is not None and source > os.path.getmtime(path)
+
+
+def serialize(model, path: str) -> str:
+    """state_dict в формате torch.save (zip, выровненные записи — пригоден для mmap)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    started = time.monotonic()
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)
+    logger.info(f"✅ Веса сохранены для mmap: {path} за {time.monotonic() - started:.1f} с")
+    return path
+
+
+def load_model(model_id: str, device: str = "cpu", mode: str = MODEL_WEIGHTS_MODE):
+    """
+    AutoModelForSequenceClassification для model_id (папка или имя в Hub).
+    mode="mmap" на CPU — веса из memory-mapped файла, общие для процессов;
+    при любой ошибке — обычный from_pretrained.
+    """
+    if mode != "mmap" or device != "cpu":
+        return AutoModelForSequenceClassification.from_pretrained(model_id)
+    if not MMAP_SUPPORTED:
+        logger.warning("⚠️ torch.load без mmap (нужен torch >= 2.1), веса загружаются копией.")
+        return AutoModelForSequenceClassification.from_pretrained(model_id)
+
+    path = weights_path_for(model_id)
+    try:
+        if is_stale(model_id, path):
+            serialize(AutoModelForSequenceClassification.from_pretrained(model_id), path)
+
+        config = AutoConfig.from_pretrained(model_id)
+        if no_init_weights is not None:
+            with no_init_weights():
+                model = AutoModelForSequenceClassification.from_config(config)
+        else:
+            model = AutoModelForSequenceClassification.from_config(config)
+        state = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+        # assign=True: параметры становятся mmap-тензорами, а не копируются в уже выделенные
+        model.load_state_dict(state, assign=True)
+        model.tie_weights()
+        return model
+    except Exception as e:
+        logger.error(f"❌ mmap-загрузка {model_id} не удалась, веса загружаются копией: {e}", exc_info=True)
+        return AutoModelForSequenceClassification.from_pretrained(model_id)
@@ -0,0 +1,144 @@
+# backend/singleflight.py
+"""
+Single-flight (коалесцирование запросов).
+
+Одновременные запросы с одинаковым ключом (отпечаток утверждения или
+нормализованный URL) ждут одну общую задачу вместо того, чтобы каждый
+вызывать SerpAPI и Gemini заново.
+
+Межпроцессный режим (gunicorn -w 4): если передан redis.asyncio клиент,
+лидер берет Redis-блокировку и публикует результат, а остальные worker-ы
+ждут этот результат. Результат должен сериализоваться в JSON.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", 60))
+SINGLEFLIGHT_RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", 30))
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", 0.1))
+
+# Удаляем блокировку, только если она все еще наша
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight(OptionalRedis):
+    """
+    Объединяет одновременные вызовы с одинаковым ключом в один.
+    Общая задача не отменяется, если клиент-лидер отключился.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        lock_ttl: float = SINGLEFLIGHT_LOCK_TTL,
+        result_ttl: int = SINGLEFLIGHT_RESULT_TTL,
+        poll_interval: float = SINGLEFLIGHT_POLL_INTERVAL,
+        is_available: Optional[Callable[[], bool]] = None,
+    ):
+        self.redis = redis_client
+        self.is_available = is_available
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.remote_hits = 0
+        self.remote_fallbacks = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Выполняет fn() один раз на ключ.
+        Возвращает (результат, shared), где shared=True, если результат получен от чужого вызова.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            result, _ = await asyncio.shield(task)
+            return result, True
+
+        self.leaders += 1
+        task = asyncio.ensure_future(self._run(key, fn))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Помечаем исключение как полученное, даже если все клиенты ушли
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        if self.redis is None:
+            return await fn(), False
+
+        lock_key = f"singleflight:lock:{key}"
+        result_key = f"singleflight:result:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"⚠️ SingleFlight: Redis недоступен, выполняем локально: {e}")
+            return await fn(), False
+
+        if acquired:
+            try:
+                result = await fn()
+                try:
+                    await self.redis.set(result_key, json.dumps(result, ensure_ascii=False, default=str), ex=self.result_ttl)
+                except Exception as e:
+                    logger.warning(f"⚠️ SingleFlight: не удалось опубликовать результат {key}: {e}")
+                return result, False
+            finally:
+                try:
+                    await self.redis.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except Exception:
+                    pass  # Блокировка истечет сама по TTL
+
+        # Другой worker уже выполняет этот запрос — ждем его результат
+        deadline = time.monotonic() + self.lock_ttl
+        try:
+            while time.monotonic() < deadline:
+                raw = await self.redis.get(result_key)
+                if raw is not None:
+                    self.remote_hits += 1
+                    return json.loads(raw), True
+                if not await self.redis.exists(lock_key):
+                    # Лидер завершился без результата (ошибка) — пробуем сами
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"⚠️ SingleFlight: ошибка ожидания результата {key}: {e}")
+
+        self.remote_fallbacks += 1
+        return await fn(), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "remote_hits": self.remote_hits,
+            "remote_fallbacks": self.remote_fallbacks,
+            "distributed": self.redis is not None,
+        }
+
@@ -1,18 +1,55 @@
-# backend/tasks.py - ФИНАЛЬНАЯ ВЕРСИЯ
+# backend/tasks.py
+"""
+Обработчики фоновых задач (job API).
+
+Не зависят от FastAPI и импортов app.py: все нужное (db, функции анализа)
+передается аргументами, поэтому их одинаково вызывают API-процесс и
+отдельный worker (celery_worker.py).
+"""
 import logging
-# Используем относительные импорты (с точкой)
-from .celery_worker import celery_app
-from .database import Database
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task(name="save_analysis_to_db")
-def save_analysis_task(analysis_data: dict):
-    """Задача Celery для асинхронного сохранения анализа в БД."""
-    db_task = Database()
-    db_task.initialize()
-    logger.info(f"Celery task started for user: {analysis_data.get('user_id')}")
-    db_task.save_analysis(analysis_data)
-    db_task.close()
-    logger.info(f"Celery task finished successfully.")
-    return {"status": "success", "classification": analysis_data["classification"]}
\ No newline at end of file
+
+async def save_analysis_task(db, analysis_data: dict) -> Optional[int]:
+    """
+    Сохраняет результат анализа в БД (db — AsyncDatabase/ThreadedAsyncDatabase).
+    analysis_data: {"user_id", "text", "verdict", "confidence", "full_response"}.
+    """
+    logger.info(f"Job: сохранение анализа для user_id {analysis_data.get('user_id')}")
+    return await db.save_analysis(
+        user_id=analysis_data["user_id"],
+        text=analysis_data["text"],
+        verdict=analysis_data["verdict"],
+        confidence=analysis_data["confidence"],
+        full_response=analysis_data["full_response"],
+    )
+
+
+async def analyze_task(job: Dict[str, Any], db, analyze: Callable[[str], Awaitable[dict]]) -> dict:
+    """Задача 'analyze': analyze(text) -> response_data (формат FullAnalysisResponse)."""
+    text = job["payload"]["text"]
+    response_data = await analyze(text)
+    if job.get("owner_id"):
+        # Результат singleflight общий для всех конкурентных вызовов — id пишем в свою копию
+        response_data = dict(response_data)
+        response_data["analysis_id"] = await save_analysis_task(db, {
+            "user_id": job["owner_id"], "text": text, "verdict": response_data["verdict"],
+            "confidence": response_data["confidence"], "full_response": response_data,
+        })
+    return response_data
+
+
+async def analyze_url_task(job: Dict[str, Any], db, analyze_url: Callable[[str, str], Awaitable[dict]]) -> dict:
+    """Задача 'analyze_url': analyze_url(url, text) -> response_data."""
+    url, text = job["payload"]["url"], job["payload"]["text"]
+    response_data = await analyze_url(url, text)
+    if job.get("owner_id"):
+        # Результат singleflight общий для всех конкурентных вызовов — id пишем в свою копию
+        response_data = dict(response_data)
+        response_data["analysis_id"] = await save_analysis_task(db, {
+            "user_id": job["owner_id"], "text": f"URL: {url} | {text}", "verdict": response_data["verdict"],
+            "confidence": response_data["confidence"], "full_response": response_data,
+        })
+    return response_data
@@ -4,10 +4,14 @@ import os
 import httpx
 import re
 import io
-import redis # ✅ Добавлен импорт Redis
 # ✅ Добавлены timezone, timedelta для лимитов Redis
 from typing import List, Optional
+from urllib.parse import quote
 from backend.database import Database
+from backend.async_database import ThreadedAsyncDatabase
+from backend.write_behind import WriteBehindBuffer
+from backend.rate_limit import DAY_SECONDS, RateLimiter
+from backend.redis_manager import RedisManager
 # ✅✅✅ ДОБАВЛЕНЫ ИМПОРТЫ ✅✅✅
 import psycopg2
 import psycopg2.extras
@@ -51,26 +55,54 @@ except Exception as e:
     exit()
 
 # --- Настройка Redis ---
-redis_client: Optional[redis.Redis] = None
-try:
-    if REDIS_URL:
-        redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-    else:
-        redis_host = os.getenv("REDIS_HOST", "localhost")
-        redis_port = int(os.getenv("REDIS_PORT", 6379))
-        redis_password = os.getenv("REDIS_PASSWORD", None)
-        redis_db_num = int(os.getenv("REDIS_DB", 0))
-        redis_client = redis.Redis(
-            host=redis_host, port=redis_port, password=redis_password,
-            db=redis_db_num, decode_responses=True
-        )
-    redis_client.ping()
-    logger.info("✅ Worker подключился к Redis.")
-except Exception as e:
-    logger.error(f"❌ Worker НЕ СМОГ подключиться к Redis: {e}. Лимиты для Telegram работать не будут.")
-    redis_client = None
+# Async клиент создается в start_async_services (нужен event loop); здоровье проверяет RedisManager в фоне
+if not REDIS_URL:
+    _redis_password = os.getenv("REDIS_PASSWORD", None)
+    REDIS_URL = "redis://{auth}{host}:{port}/{db}".format(
+        auth=f":{quote(_redis_password, safe='')}@" if _redis_password else "",
+        host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", 6379)),
+        db=int(os.getenv("REDIS_DB", 0)),
+    )
+redis_manager: Optional[RedisManager] = None
 # --- Конец настройки Redis ---
 
+# --- Write-behind для статусов сообщений (пачками, журнал в Redis) и лимиты ---
+status_writer: Optional[WriteBehindBuffer] = None
+# Лимит Telegram: тот же Lua-скрипт, что и у API (backend/rate_limit.py); без Redis — локальный token bucket
+rate_limiter = RateLimiter(policies={"telegram": (TELEGRAM_USER_DAILY_LIMIT, DAY_SECONDS)})
+
+
+async def set_message_status(message_db_id: int, status: str, analysis_id: Optional[int] = None) -> None:
+    """Статус пишется через write-behind буфер; до его запуска — напрямую."""
+    if status_writer is not None:
+        await status_writer.update_telegram_message_status(message_db_id, status, analysis_id)
+    else:
+        db.update_telegram_message_status(message_db_id, status=status, analysis_id=analysis_id)
+
+
+async def start_async_services(application: Application) -> None:
+    global status_writer, rate_limiter, redis_manager
+    redis_manager = RedisManager(REDIS_URL)
+    if await redis_manager.start():
+        logger.info("✅ Worker подключился к Redis.")
+    else:
+        logger.error("❌ Worker НЕ СМОГ подключиться к Redis. Лимиты — локальные, пока Redis не вернется.")
+    # Журнал write-behind и лимиты — на одном async клиенте
+    rate_limiter = RateLimiter(redis_manager.client, rate_limiter.policies,
+                               is_available=lambda: redis_manager.available)
+    status_writer = WriteBehindBuffer(ThreadedAsyncDatabase(db), redis_client=redis_manager.client)
+    await status_writer.start()
+
+
+async def stop_async_services(application: Application) -> None:
+    global status_writer, redis_manager
+    if status_writer is not None:
+        writer, status_writer = status_writer, None
+        await writer.stop()
+    if redis_manager is not None:
+        manager, redis_manager = redis_manager, None
+        await manager.close()
+
 KEYWORDS = [ # Ключевые слова
     'новость', 'новости', 'событие', 'происшествие', 'заявил', 'сообщил',
     'сказал', 'аким', 'президент', 'министр', 'депутат',
@@ -80,37 +112,15 @@ KEYWORDS = [ # Ключевые слова
 KEYWORDS_LOWER = [kw.lower() for kw in KEYWORDS]
 
 # --- Вспомогательная функция для лимитов ---
-def check_telegram_limit(user_id: int) -> tuple[bool, int, int]:
+async def check_telegram_limit(user_id: int) -> tuple[bool, int, int]:
     """
-    Проверяет и инкрементирует лимит запросов для Telegram user_id в Redis.
+    Проверяет и списывает лимит запросов для Telegram user_id (скользящие сутки, Redis).
     Возвращает (разрешено_ли, текущее_количество, лимит).
     """
-    if not redis_client:
-        return True, 0, TELEGRAM_USER_DAILY_LIMIT # Если Redis не работает, разрешаем
-
-    key = f"tg_limit:{user_id}"
-    try:
-        pipe = redis_client.pipeline()
-        pipe.incr(key) # Увеличиваем счетчик
-        pipe.ttl(key) # Проверяем, есть ли у ключа время жизни
-        count, ttl = pipe.execute()
-
-        if ttl == -2 or ttl == -1:
-             now = datetime.now(timezone.utc)
-             end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
-             seconds_until_eod = int((end_of_day - now).total_seconds())
-             if seconds_until_eod > 0:
-                 redis_client.expire(key, seconds_until_eod)
-             logger.info(f"Установлен TTL для ключа {key} на {seconds_until_eod} секунд.")
-
-        if count > TELEGRAM_USER_DAILY_LIMIT:
-            logger.warning(f"Превышен Telegram лимит ({TELEGRAM_USER_DAILY_LIMIT}) для user_id {user_id}. Текущий счет: {count}.")
-            return False, count, TELEGRAM_USER_DAILY_LIMIT
-        else:
-            return True, count, TELEGRAM_USER_DAILY_LIMIT
-    except Exception as e:
-        logger.error(f"Ошибка Redis при проверке лимита для user_id {user_id}: {e}")
-        return True, 0, TELEGRAM_USER_DAILY_LIMIT # В случае ошибки разрешаем
+    allowed, count, _ = await rate_limiter.hit("telegram", user_id)
+    if not allowed:
+        logger.warning(f"Превышен Telegram лимит ({TELEGRAM_USER_DAILY_LIMIT}) для user_id {user_id}. Текущий счет: {count}.")
+    return allowed, count, TELEGRAM_USER_DAILY_LIMIT
 
 # --- Функции-обработчики ---
 
@@ -130,24 +140,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отвечает пользователю о его текущем лимите запросов."""
     user_id = update.effective_user.id
-    if not redis_client:
-        await update.message.reply_text("Не могу проверить лимит, сервис временно недоступен.")
-        return
-
-    key = f"tg_limit:{user_id}"
-    current_count = 0
-    try:
-        value = redis_client.get(key)
-        if value:
-            current_count = int(value)
-    except Exception as e:
-        logger.error(f"Ошибка Redis при получении лимита для user_id {user_id}: {e}")
-        await update.message.reply_text("Ошибка при проверке лимита.")
-        return
+    # Без Redis ответ — по локальному счетчику процесса
+    _, current_count, _ = await rate_limiter.peek("telegram", user_id)
 
     remaining = TELEGRAM_USER_DAILY_LIMIT - current_count
     await update.message.reply_text(
-        f"Использовано запросов сегодня: {current_count}/{TELEGRAM_USER_DAILY_LIMIT}\n"
+        f"Использовано запросов за сутки: {current_count}/{TELEGRAM_USER_DAILY_LIMIT}\n"
         f"Осталось: {max(0, remaining)}"
     )
 
@@ -188,7 +186,7 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     logger.debug(f"Получено сообщение {message_id} из чата {chat_id} от user {user_id}")
 
     # --- Проверка лимита ---
-    allowed, count, limit = check_telegram_limit(user_id)
+    allowed, count, limit = await check_telegram_limit(user_id)
     if not allowed:
         if not SILENT_MODE and message.chat.type == ChatType.PRIVATE:
              await message.reply_text(f"❌ Вы превысили дневной лимит ({limit}) запросов. Попробуйте завтра.")
@@ -205,7 +203,7 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     message_text_lower = message_text.lower()
     has_keyword = any(keyword in message_text_lower for keyword in KEYWORDS_LOWER)
     if not has_keyword:
-        db.update_telegram_message_status(message_db_id, status='ignored_no_keyword')
+        await set_message_status(message_db_id, status='ignored_no_keyword')
         return
 
     # --- ✅✅✅ ИЗМЕНЕННАЯ ЛОГИКА: URL ИЛИ ТОЛЬКО ТЕКСТ ✅✅✅ ---
@@ -221,7 +219,7 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
         # Проверяем дубликат URL
         if db.check_if_url_analyzed(url_to_check):
-            db.update_telegram_message_status(message_db_id, status='ignored_duplicate_url')
+            await set_message_status(message_db_id, status='ignored_duplicate_url')
             logger.info(f"Сообщение [{chat_id}/{message_id}] проигнорировано: URL {url_to_check} уже анализировался.")
             # if not SILENT_MODE and message.chat.type == ChatType.PRIVATE:
             #    await message.reply_text("ℹ️ Эта ссылка уже была проверена ранее.")
@@ -242,7 +240,7 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     else:
         # --- Если ссылка НЕ НАЙДЕНА ---
-        db.update_telegram_message_status(message_db_id, status='pending_text_only')
+        await set_message_status(message_db_id, status='pending_text_only')
         logger.info(f"Найдено сообщение [{chat_id}/{message_id}] с ключом, но БЕЗ ссылки. Вызов /analyze.")
         action_description = "текст"
         endpoint = "/analyze"
@@ -268,7 +266,7 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             logger.info(f"Получен результат от API ({endpoint}) для [{chat_id}/{message_id}]: {result.get('verdict')}")
 
             api_analysis_id = result.get('analysis_id')
-            db.update_telegram_message_status(message_db_id, status='analyzed', analysis_id=api_analysis_id)
+            await set_message_status(message_db_id, status='analyzed', analysis_id=api_analysis_id)
 
             # --- Отправка результата в чат ---
             if not SILENT_MODE:
@@ -310,14 +308,14 @@ async def check_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
     except httpx.HTTPStatusError as e:
         logger.error(f"Ошибка API (HTTP {e.response.status_code}) для [{chat_id}/{message_id}]: {e.request.url} - {e.response.text}")
-        db.update_telegram_message_status(message_db_id, status='error_api')
+        await set_message_status(message_db_id, status='error_api')
         if not SILENT_MODE:
             if message.chat.type == ChatType.PRIVATE:
                 await message.reply_text(f"❌ Ошибка при проверке: API вернул {e.response.status_code}")
             if thinking_message: await thinking_message.delete()
     except Exception as e:
         logger.error(f"Неизвестная ошибка при обработке сообщения [{chat_id}/{message_id}]: {e}", exc_info=True)
-        db.update_telegram_message_status(message_db_id, status='error_worker')
+        await set_message_status(message_db_id, status='error_worker')
         if not SILENT_MODE:
             if message.chat.type == ChatType.PRIVATE:
                 await message.reply_text("❌ Внутренняя ошибка worker'а при проверке.")
@@ -340,7 +338,7 @@ async def check_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     logger.debug(f"Получено фото {message_id} из чата {chat_id} от user {user_id}")
 
     # --- Проверка лимита ---
-    allowed, count, limit = check_telegram_limit(user_id)
+    allowed, count, limit = await check_telegram_limit(user_id)
     if not allowed:
         if not SILENT_MODE and message.chat.type == ChatType.PRIVATE:
              await message.reply_text(f"❌ Вы превысили дневной лимит ({limit}) запросов. Попробуйте завтра.")
@@ -356,7 +354,7 @@ async def check_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     caption_lower = caption.lower()
     if not caption or not any(keyword in caption_lower for keyword in KEYWORDS_LOWER):
-        db.update_telegram_message_status(message_db_id, status='ignored_no_keyword')
+        await set_message_status(message_db_id, status='ignored_no_keyword')
         return
 
     logger.info(f"Найдено фото [{chat_id}/{message_id}] с ключевым словом в подписи. Начинаю анализ.")
@@ -391,7 +389,7 @@ async def check_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             logger.info(f"Получен результат от API (Image) для [{chat_id}/{message_id}]: {result.get('verdict')}")
 
             api_analysis_id = result.get('analysis_id')
-            db.update_telegram_message_status(message_db_id, status='analyzed', analysis_id=api_analysis_id)
+            await set_message_status(message_db_id, status='analyzed', analysis_id=api_analysis_id)
 
             # --- Отправка результата в чат ---
             if not SILENT_MODE:
@@ -420,14 +418,14 @@ async def check_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     except httpx.HTTPStatusError as e:
         logger.error(f"Ошибка API (HTTP {e.response.status_code}) для фото [{chat_id}/{message_id}]: {e.request.url} - {e.response.text}")
-        db.update_telegram_message_status(message_db_id, status='error_api')
+        await set_message_status(message_db_id, status='error_api')
         if not SILENT_MODE:
             if message.chat.type == ChatType.PRIVATE:
                 await message.reply_text(f"❌ Ошибка при анализе изображения: API вернул {e.response.status_code}")
             if thinking_message: await thinking_message.delete()
     except Exception as e:
         logger.error(f"Неизвестная ошибка при обработке фото [{chat_id}/{message_id}]: {e}", exc_info=True)
-        db.update_telegram_message_status(message_db_id, status='error_worker')
+        await set_message_status(message_db_id, status='error_worker')
         if not SILENT_MODE:
             if message.chat.type == ChatType.PRIVATE:
                 await message.reply_text("❌ Внутренняя ошибка worker'а при анализе изображения.")
@@ -439,11 +437,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     try:
         with db._get_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                # Считаем статусы за последние 24 часа
+                # Считаем статусы за последние 24 часа. Условие по message_timestamp
+                # (ключ секционирования) ограничивает просмотр последними секциями
                 cur.execute("""
                     SELECT status, COUNT(*) as count
                     FROM telegram_monitored_messages
                     WHERE processed_at >= NOW() - INTERVAL '24 hours'
+                      AND message_timestamp >= NOW() - INTERVAL '7 days'
                     GROUP BY status;
                 """)
                 stats_raw = cur.fetchall()
@@ -504,7 +504,12 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 
 def main() -> None:
     """Запускает бота."""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder().token(TELEGRAM_TOKEN)
+        .post_init(start_async_services)
+        .post_shutdown(stop_async_services)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("limit", limit_command))
@@ -1,7 +1,9 @@
 # backend/utils.py
 
+import base64
 import re
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from langdetect import detect, DetectorFactory
 import logging
 from datetime import datetime
@@ -98,6 +100,51 @@ def preprocess_text(text: str) -> str:
     except:
         return text # Возвращаем как есть в случае ошибки
 
+def encode_history_cursor(created_at: datetime, analysis_id: int) -> str:
+    """Непрозрачный курсор /history: позиция последней строки страницы (created_at, id)."""
+    raw = f"{created_at.isoformat()}|{analysis_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Обратное к encode_history_cursor; ValueError, если курсор поврежден."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, analysis_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(analysis_id)
+    except Exception as e:
+        raise ValueError(f"Некорректный курсор: {cursor!r}") from e
+
+
+def trusted_client_ip(forwarded_for: Optional[str], peer: Optional[str], trusted_hops: int = 0) -> str:
+    """
+    IP клиента для лимитов. Левые записи X-Forwarded-For задает сам клиент,
+    поэтому берется запись, добавленная последним доверенным прокси
+    (trusted_hops-я с конца); при trusted_hops=0 — адрес TCP-соединения.
+    """
+    if trusted_hops > 0 and forwarded_for:
+        hops = [part.strip() for part in forwarded_for.split(",") if part.strip()]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return peer or "unknown"
+
+
+def normalize_url(url: str) -> str:
+    """
+    Нормализует URL для сравнения: схема/хост в нижнем регистре, без фрагмента,
+    без utm-меток, параметры запроса отсортированы, без завершающего '/'.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        query = sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if not k.lower().startswith("utm_")
+        )
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+    except Exception:
+        return url
+
 def get_final_verdict(prediction: dict, sources: list, original_text: str) -> dict:
     """
     Принимает решение о финальном вердикте, комбинируя предсказание модели
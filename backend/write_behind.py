@@ -0,0 +1,313 @@
+# backend/write_behind.py
+"""
+Write-behind буфер для записей, которые не нужны на пути запроса сразу:
+анализы (save_analysis), голоса (save_vote) и статусы сообщений Telegram.
+
+- записи копятся в памяти и сбрасываются пачкой каждые WRITE_BEHIND_FLUSH_MS
+  или при WRITE_BEHIND_MAX_ROWS строк — multi-row INSERT/UPDATE на пачку;
+- ID анализа выдается сразу: ID заранее резервируются блоками из sequence
+  (nextval), строка пишется позже с этим ID — /vote получает analysis_id как раньше;
+- каждая запись сначала попадает в журнал Redis (HASH на процесс), из
+  журнала удаляется только после записи в БД. Журнал процесса, у которого
+  истек heartbeat (упал), при старте забирает и дописывает другой процесс.
+  Все записи идемпотентны (ON CONFLICT / UPDATE), повтор безопасен;
+- неудачная пачка повторяется построчно, строка отбрасывается (с логом)
+  после WRITE_BEHIND_MAX_ATTEMPTS попыток;
+- голос за анализ, строки которого в БД еще нет (его ID зарезервировал и
+  пока не записал другой процесс), остается в очереди и журнале и
+  повторяется до WRITE_BEHIND_VOTE_WAIT_SECONDS, затем отбрасывается с логом.
+
+sink — AsyncDatabase/ThreadedAsyncDatabase (методы *_batch пробрасывают ошибки).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+try:
+    from .redis_manager import OptionalRedis
+except ImportError:
+    from redis_manager import OptionalRedis
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", 50))
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", 200))
+WRITE_BEHIND_ID_BLOCK = int(os.getenv("WRITE_BEHIND_ID_BLOCK", 50))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", 5))
+WRITE_BEHIND_HEARTBEAT_TTL = int(os.getenv("WRITE_BEHIND_HEARTBEAT_TTL", 30))
+WRITE_BEHIND_VOTE_WAIT_SECONDS = float(os.getenv("WRITE_BEHIND_VOTE_WAIT_SECONDS", 300))
+
+# Порядок записи внутри пачки: голос и статус ссылаются на анализ (FK)
+KIND_ORDER = ("analysis", "vote", "telegram_status")
+
+
+def _dedupe_key(record: Dict[str, Any]) -> Any:
+    """Для голосов и статусов важна только последняя запись по ключу."""
+    row = record["row"]
+    if record["kind"] == "vote":
+        return ("vote", row[0], row[1])  # (user_id, analysis_id)
+    if record["kind"] == "telegram_status":
+        return ("telegram_status", row[0])  # message_db_id
+    return record["key"]
+
+
+class WriteBehindBuffer(OptionalRedis):
+    JOURNAL_PREFIX = "writebehind:journal:"
+    RECOVERING_PREFIX = "writebehind:recovering:"
+    ALIVE_PREFIX = "writebehind:alive:"
+
+    def __init__(self, sink, redis_client=None, flush_interval_ms: int = WRITE_BEHIND_FLUSH_MS,
+                 max_rows: int = WRITE_BEHIND_MAX_ROWS, id_block: int = WRITE_BEHIND_ID_BLOCK,
+                 max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS, heartbeat_ttl: int = WRITE_BEHIND_HEARTBEAT_TTL,
+                 vote_wait_seconds: float = WRITE_BEHIND_VOTE_WAIT_SECONDS,
+                 is_available: Optional[Callable[[], bool]] = None):
+        self.sink = sink
+        self.redis = redis_client
+        self.is_available = is_available
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max(1, max_rows)
+        self.id_block = max(1, id_block)
+        self.max_attempts = max(1, max_attempts)
+        self.heartbeat_ttl = heartbeat_ttl
+        self.vote_wait_seconds = vote_wait_seconds
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.journal_key = self.JOURNAL_PREFIX + self.consumer
+        self._pending: List[Dict[str, Any]] = []
+        self._ids: Deque[int] = deque()
+        self._id_lock: Optional[asyncio.Lock] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_heartbeat = 0.0
+        self.counters = {
+            "enqueued": 0, "written": 0, "flushes": 0, "failed_batches": 0,
+            "dropped": 0, "recovered": 0, "journal_errors": 0, "ids_reserved": 0, "orphan_votes": 0,
+        }
+
+    # --- жизненный цикл ---
+    async def start(self) -> None:
+        self._id_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        await self._heartbeat(force=True)
+        await self.recover()
+        self._task = asyncio.ensure_future(self._run())
+        logger.info(f"✅ Write-behind: flush={int(self.flush_interval * 1000)}ms/{self.max_rows} строк, "
+                    f"журнал={'Redis' if self.redis is not None else 'нет'}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self.redis is not None and not self._pending:
+            try:
+                await self.redis.delete(self.ALIVE_PREFIX + self.consumer)
+            except Exception:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                await self._heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Write-behind flush упал: {e}", exc_info=True)
+
+    async def _heartbeat(self, force: bool = False) -> None:
+        if self.redis is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_heartbeat < self.heartbeat_ttl / 3:
+            return
+        try:
+            await self.redis.set(self.ALIVE_PREFIX + self.consumer, "1", ex=self.heartbeat_ttl)
+            self._last_heartbeat = now
+        except Exception as e:
+            logger.warning(f"⚠️ Write-behind heartbeat не записан: {e}")
+
+    # --- публичные методы (как у Database) ---
+    async def save_analysis(self, user_id: int, text: str, verdict: str, confidence: float,
+                            full_response: dict) -> Optional[int]:
+        """Возвращает ID сразу; сама строка будет записана при ближайшем flush."""
+        try:
+            analysis_id = await self._next_analysis_id()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось зарезервировать ID анализа ({e}), запись напрямую.")
+            return await self.sink.save_analysis(user_id=user_id, text=text, verdict=verdict,
+                                                 confidence=confidence, full_response=full_response)
+        await self._enqueue("analysis", [analysis_id, user_id, text, verdict, confidence, full_response])
+        return analysis_id
+
+    async def save_vote(self, user_id: int, analysis_id: int, vote: int) -> bool:
+        await self._enqueue("vote", [user_id, analysis_id, vote])
+        return True
+
+    async def update_telegram_message_status(self, message_db_id: int, status: str,
+                                             analysis_id: Optional[int] = None) -> None:
+        await self._enqueue("telegram_status", [message_db_id, status, analysis_id])
+
+    async def _next_analysis_id(self) -> int:
+        async with self._id_lock:
+            if not self._ids:
+                ids = await self.sink.reserve_analysis_ids(self.id_block)
+                self._ids.extend(ids)
+                self.counters["ids_reserved"] += len(ids)
+            return self._ids.popleft()
+
+    async def _enqueue(self, kind: str, row: List[Any]) -> None:
+        record = {"key": uuid.uuid4().hex, "seq": time.time_ns(), "kind": kind, "row": row, "attempts": 0}
+        if self.redis is not None:
+            try:
+                await self.redis.hset(self.journal_key, record["key"], json.dumps(record, ensure_ascii=False, default=str))
+            except Exception as e:
+                # Без журнала запись все равно попадет в БД, но не переживет падение процесса
+                self.counters["journal_errors"] += 1
+                logger.warning(f"⚠️ Write-behind журнал недоступен: {e}")
+        self._pending.append(record)
+        self.counters["enqueued"] += 1
+        if len(self._pending) >= self.max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    # --- запись в БД ---
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            self.counters["flushes"] += 1
+
+            # Последняя запись по ключу вытесняет более ранние
+            latest: Dict[Any, Dict[str, Any]] = {}
+            superseded: List[str] = []
+            for record in batch:
+                key = _dedupe_key(record)
+                if key in latest:
+                    superseded.append(latest[key]["key"])
+                latest[key] = record
+
+            done: List[str] = list(superseded)
+            retry: List[Dict[str, Any]] = []
+            for kind in KIND_ORDER:
+                records = [r for r in latest.values() if r["kind"] == kind]
+                if not records:
+                    continue
+                try:
+                    waiting = await self._write(kind, records)
+                    written = [r for r in records if r not in waiting]
+                    done.extend(r["key"] for r in written)
+                    self.counters["written"] += len(written)
+                    self._hold(waiting, retry, done)
+                except Exception as e:
+                    self.counters["failed_batches"] += 1
+                    logger.warning(f"⚠️ Write-behind: пачка {kind} ({len(records)}) не записана: {e}; построчно.")
+                    for record in records:
+                        try:
+                            if await self._write(kind, [record]):
+                                self._hold([record], retry, done)
+                                continue
+                            done.append(record["key"])
+                            self.counters["written"] += 1
+                        except Exception as row_e:
+                            record["attempts"] += 1
+                            if record["attempts"] >= self.max_attempts:
+                                self.counters["dropped"] += 1
+                                logger.error(f"❌ Write-behind: {kind} {record['row'][:3]} отброшена: {row_e}")
+                                done.append(record["key"])
+                            else:
+                                retry.append(record)
+
+            if retry:
+                self._pending[:0] = retry  # повтор при следующем flush
+            if done and self.redis is not None:
+                try:
+                    await self.redis.hdel(self.journal_key, *done)
+                except Exception as e:
+                    self.counters["journal_errors"] += 1
+                    logger.warning(f"⚠️ Write-behind: журнал не очищен ({e}), записи будут повторены идемпотентно.")
+
+    async def _write(self, kind: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Пишет пачку; возвращает голоса, отложенные до появления строки анализа."""
+        rows = [tuple(r["row"]) for r in records]
+        if kind == "analysis":
+            await self.sink.save_analyses_with_ids(rows)
+        elif kind == "vote":
+            missing = set(await self.sink.save_votes_batch(rows) or [])
+            return [r for r in records if (r["row"][0], r["row"][1]) in missing]
+        else:
+            await self.sink.update_telegram_statuses_batch(rows)
+        return []
+
+    def _hold(self, records: List[Dict[str, Any]], retry: List[Dict[str, Any]], done: List[str]) -> None:
+        """Голос без строки анализа ждет ее до vote_wait_seconds (в очереди и журнале)."""
+        now = time.time()
+        for record in records:
+            waiting_since = record.setdefault("waiting_since", now)
+            if now - waiting_since >= self.vote_wait_seconds:
+                self.counters["orphan_votes"] += 1
+                logger.error(f"❌ Write-behind: голос {record['row']} отброшен — анализа нет "
+                             f"{self.vote_wait_seconds:.0f} с.")
+                done.append(record["key"])
+            else:
+                retry.append(record)
+
+    # --- восстановление после падения другого процесса ---
+    async def recover(self) -> int:
+        """Забирает журналы процессов без heartbeat и ставит их записи в свою очередь."""
+        redis = self.redis
+        if redis is None:
+            return 0
+        recovered = 0
+        try:
+            keys = [key async for key in redis.scan_iter(match=self.JOURNAL_PREFIX + "*")]
+            # Журналы, которые другой процесс начал забирать и не успел (упал)
+            keys += [key async for key in redis.scan_iter(match=self.RECOVERING_PREFIX + "*")]
+        except Exception as e:
+            logger.warning(f"⚠️ Write-behind: журналы не просмотрены: {e}")
+            return 0
+        for key in keys:
+            if key.startswith(self.RECOVERING_PREFIX):
+                consumer = key[len(self.RECOVERING_PREFIX):].rsplit(":", 1)[0]
+            else:
+                consumer = key[len(self.JOURNAL_PREFIX):]
+            if consumer == self.consumer or await redis.exists(self.ALIVE_PREFIX + consumer):
+                continue
+            claimed = f"{self.RECOVERING_PREFIX}{self.consumer}:{uuid.uuid4().hex[:8]}"
+            try:
+                await redis.rename(key, claimed)  # атомарно: забирает только один процесс
+            except Exception:
+                continue
+            entries = await redis.hgetall(claimed)
+            records = sorted((json.loads(raw) for raw in entries.values()), key=lambda r: r["seq"])
+            if records:
+                pipe = redis.pipeline()
+                pipe.hset(self.journal_key, mapping={r["key"]: json.dumps(r, ensure_ascii=False) for r in records})
+                pipe.delete(claimed)
+                await pipe.execute()
+                self._pending[:0] = records
+            else:
+                await redis.delete(claimed)
+            recovered += len(records)
+            logger.info(f"♻️ Write-behind: восстановлено {len(records)} записей процесса {consumer}.")
+        self.counters["recovered"] += recovered
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "pending": len(self._pending), "ids_available": len(self._ids)}
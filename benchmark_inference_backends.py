@@ -0,0 +1,214 @@
+# benchmark_inference_backends.py
+"""
+Сравнение бэкендов инференса FakeNewsDetector (torch / int8 / onnx) на CPU.
+
+Каждый бэкенд запускается в отдельном процессе (чистый RSS):
+- паритет с torch: совпадение меток и расхождение вероятностей классификатора и NLI;
+- точность на размеченном CSV (колонки text, label), если указан --csv;
+- время загрузки, задержка predict (1 текст и пакет), rank_sources_nli;
+- RSS после загрузки и пиковый RSS.
+
+Запуск из корня проекта:
+    python benchmark_inference_backends.py --lang en --backends torch,int8,onnx --csv dataset_en_test.csv
+Отчет: reports/inference_backends.md
+"""
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import time
+
+logging.getLogger("transformers").setLevel(logging.ERROR)
+
+SAMPLE_TEXTS = [
+    "Scientists have discovered water on Mars, a finding that could have significant implications for future space exploration.",
+    "BREAKING: Drinking hot water every hour cures all viral infections, doctors hide the truth!",
+    "The central bank kept its key rate unchanged at the meeting on Friday, citing slowing inflation.",
+    "Вчера в Москве прошел сильный снегопад, который привел к транспортному коллапсу в центре города.",
+    "Бүгін Астана қаласында жаңа технологиялық хабтың тұсаукесері өтті, шараға көптеген инвесторлар қатысты.",
+    "A secret government memo proves the moon landing was filmed in a studio in Nevada.",
+    "The city council approved a new budget for public transport, adding 40 electric buses next year.",
+    "Celebrities are being replaced by clones, an anonymous insider revealed on social media.",
+]
+SAMPLE_CLAIM = "The president signed a new decree on environmental protection."
+SAMPLE_SNIPPETS = [
+    "A new presidential decree regarding ecology and environmental protection was signed into law.",
+    "A great victory for the local football team in the national championship final.",
+    "The president met with foreign ministers to discuss trade and tariffs on Tuesday.",
+    "Environmental groups welcomed the decree but said enforcement remains a concern.",
+    "How to bake the perfect apple pie with a crispy crust and soft filling.",
+    "The decree on environmental protection was rejected by parliament last week.",
+    "Weather forecast: sunny skies and mild temperatures expected through the weekend.",
+    "Officials confirmed the signing ceremony took place at the presidential residence.",
+]
+LABEL_MAP = {"0": "fake", "1": "real", "real": "real", "fake": "fake"}
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux: /proc/self/status), иначе пиковый."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB на Linux
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def load_labeled(path, limit):
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            label = LABEL_MAP.get(str(row.get("label", "")).strip().lower())
+            if row.get("text") and label:
+                rows.append((row["text"], label))
+            if limit and len(rows) >= limit:
+                break
+    return rows
+
+
+def run_backend(backend, language, texts, labels, runs, out):
+    import torch
+    from backend.model import FakeNewsDetector
+
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    # Время загрузки — классификатора и NLI, как при старте с MODEL_PRELOAD
+    detector = FakeNewsDetector(device="cpu", backend=backend, preload=[language, "nli"])
+    load_s = time.perf_counter() - started
+    rss_loaded = rss_mb()
+
+    loaded = detector._get_model(language)
+    if loaded is None:
+        out.put({"backend": backend, "error": f"нет модели для языка '{language}'"})
+        return
+    runner, tokenizer = loaded
+
+    # Вероятности классификатора — для паритета с torch
+    probabilities = []
+    for i in range(0, len(texts), 16):
+        inputs = tokenizer(texts[i:i + 16], return_tensors="pt", truncation=True, padding=True, max_length=512)
+        probabilities.extend(torch.softmax(runner(**inputs), dim=-1).tolist())
+
+    predictions = detector._predict_batch(language, texts) if texts else []
+    accuracy = None
+    if labels:
+        hits = sum(p["classification"] == label for p, label in zip(predictions, labels))
+        accuracy = hits / len(labels)
+
+    single = []
+    for _ in range(runs):
+        for text in texts[:8]:
+            t = time.perf_counter()
+            detector._predict_batch(language, [text])
+            single.append((time.perf_counter() - t) * 1000)
+    batch = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        detector._predict_batch(language, texts[:16])
+        batch.append((time.perf_counter() - t) * 1000)
+
+    nli, nli_scores = [], []
+    if detector._get_model("nli") is not None:
+        search_results = [{"url": f"http://example.com/{i}", "snippet": s} for i, s in enumerate(SAMPLE_SNIPPETS)]
+        for _ in range(runs):
+            t = time.perf_counter()
+            ranked = detector.rank_sources_nli(SAMPLE_CLAIM, search_results)
+            nli.append((time.perf_counter() - t) * 1000)
+        nli_scores = [[r["relevance"]] for r in sorted(ranked, key=lambda r: r["url"])]
+
+    detector.close()
+    out.put({
+        "backend": backend,
+        "effective": type(runner).name,
+        "load_s": load_s,
+        "rss_start_mb": rss_start,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": peak_rss_mb(),
+        "single_p50_ms": statistics.median(single) if single else None,
+        "single_p95_ms": percentile(single, 0.95) if single else None,
+        "batch16_ms": statistics.median(batch) if batch else None,
+        "nli_ms": statistics.median(nli) if nli else None,
+        "accuracy": accuracy,
+        "probabilities": probabilities,
+        "nli_scores": nli_scores,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    parser.add_argument("--csv", help="размеченный тест (колонки text, label)")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--report", default="reports/inference_backends.md")
+    args = parser.parse_args()
+
+    from backend.inference_backends import compare_probabilities
+
+    labeled = load_labeled(args.csv, args.limit) if args.csv else []
+    texts = [t for t, _ in labeled] or SAMPLE_TEXTS
+    labels = [label for _, label in labeled]
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"--- {backend} ---")
+        out = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(backend, args.lang, texts, labels, args.runs, out))
+        proc.start()
+        result = out.get()
+        proc.join()
+        results.append(result)
+        print({k: v for k, v in result.items() if k not in ("probabilities", "nli_scores")})
+
+    reference = next((r for r in results if r.get("backend") == "torch" and "error" not in r), None)
+
+    def fmt(value, digits=1):
+        return "—" if value is None else f"{value:.{digits}f}"
+
+    lines = [
+        f"# Бэкенды инференса: язык `{args.lang}`, {len(texts)} текстов" + (f" из `{args.csv}`" if args.csv else " (встроенные примеры)"),
+        "",
+        "| Бэкенд | Фактически | Загрузка, с | RSS после загрузки, МБ | Пиковый RSS, МБ | predict p50, мс | predict p95, мс | пакет 16, мс | NLI 8 источников, мс | Точность | Совпадение меток с torch | Макс. Δp | Макс. Δ NLI |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        if "error" in r:
+            lines.append(f"| {r['backend']} | ошибка: {r['error']} |" + " |" * 11)
+            continue
+        parity = compare_probabilities(reference["probabilities"], r["probabilities"]) if reference else {}
+        nli_parity = (compare_probabilities(reference["nli_scores"], r["nli_scores"])
+                      if reference and len(reference["nli_scores"]) == len(r["nli_scores"]) else {})
+        lines.append(
+            f"| {r['backend']} | {r['effective']} | {fmt(r['load_s'])} | {fmt(r['rss_loaded_mb'], 0)} | {fmt(r['rss_peak_mb'], 0)} "
+            f"| {fmt(r['single_p50_ms'])} | {fmt(r['single_p95_ms'])} | {fmt(r['batch16_ms'])} | {fmt(r['nli_ms'])} "
+            f"| {fmt(r['accuracy'], 3)} | {fmt(parity.get('label_agreement'), 3)} | {fmt(parity.get('max_abs_diff'), 4)} "
+            f"| {fmt(nli_parity.get('max_abs_diff'), 4)} |"
+        )
+    lines += ["", f"Потоки: INFERENCE_INTRA_OP_THREADS={os.getenv('INFERENCE_INTRA_OP_THREADS', '0')}, "
+                  f"INFERENCE_INTER_OP_THREADS={os.getenv('INFERENCE_INTER_OP_THREADS', '0')}, прогонов: {args.runs}.", ""]
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    print(f"✅ Отчет сохранен: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmark_worker_rss.py
+"""
+Память воркеров с моделями FakeNewsDetector: MODEL_WEIGHTS_MODE=copy против mmap.
+
+Запускает N процессов (как gunicorn -w N), каждый загружает модели и делает
+predict; когда все загружены, каждый снимает /proc/self/smaps_rollup:
+- Rss      — резидентная память процесса, включая общие с другими страницы;
+- Pss      — доля с учетом разделения (общая страница делится на число процессов);
+- Private  — страницы только этого процесса (Private_Clean + Private_Dirty).
+Сколько памяти добавляет каждый новый воркер, показывают Private и сумма Pss,
+а не Rss.
+
+Запуск из корня проекта (Linux):
+    python benchmark_worker_rss.py --workers 4 --lang en --nli
+Отчет: reports/worker_rss.md
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+SAMPLE_TEXT = "Scientists have discovered water on Mars, a finding that could have significant implications for future space exploration."
+
+
+def smaps_rollup_mb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": values.get("Rss", 0.0),
+        "pss": values.get("Pss", 0.0),
+        "shared": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        "private": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def worker(mode, language, with_nli, barrier, out):
+    os.environ["MODEL_WEIGHTS_MODE"] = mode  # до импорта backend.shared_weights
+    from backend.model import FakeNewsDetector
+
+    baseline = smaps_rollup_mb()
+    started = time.perf_counter()
+    detector = FakeNewsDetector(device="cpu", backend="torch", preload=[language] + (["nli"] if with_nli else []))
+    detector.predict(SAMPLE_TEXT, language)
+    load_s = time.perf_counter() - started
+    barrier.wait()  # все воркеры загружены — страницы разделены настолько, насколько могут
+    out.put({"pid": os.getpid(), "load_s": load_s, "baseline": baseline, **smaps_rollup_mb()})
+    barrier.wait()  # держим процесс, пока остальные не сняли замеры
+    detector.close()
+
+
+def run(mode, workers, language, with_nli):
+    ctx = multiprocessing.get_context("spawn")  # чистые процессы, как воркеры после перезапуска
+    barrier = ctx.Barrier(workers)
+    out = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, language, with_nli, barrier, out)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    results = [out.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--nli", action="store_true", help="загружать и NLI модель (xlm-roberta-large-xnli)")
+    parser.add_argument("--modes", default="copy,mmap")
+    parser.add_argument("--report", default="reports/worker_rss.md")
+    args = parser.parse_args()
+
+    models = args.lang + (" + nli" if args.nli else "")
+    lines = [
+        f"# Память воркеров: {args.workers} процессов, модели: {models}",
+        "",
+        "| Режим | Воркер | Загрузка, с | RSS, МБ | PSS, МБ | Shared, МБ | Private, МБ |",
+        "|---|---|---|---|---|---|---|",
+    ]
+    summary = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        # Первый прогон mmap создает файл кэша; замеряем уже на готовом
+        if mode == "mmap":
+            run(mode, 1, args.lang, args.nli)
+        print(f"--- {mode} ---")
+        results = run(mode, args.workers, args.lang, args.nli)
+        for i, r in enumerate(sorted(results, key=lambda r: r["pid"]), 1):
+            lines.append(f"| {mode} | {i} | {r['load_s']:.1f} | {r['rss']:.0f} | {r['pss']:.0f} | {r['shared']:.0f} | {r['private']:.0f} |")
+        total_pss = sum(r["pss"] for r in results)
+        avg_private = sum(r["private"] - r["baseline"]["private"] for r in results) / len(results)
+        summary.append(f"| {mode} | {total_pss:.0f} | {avg_private:.0f} |")
+        print(f"{mode}: сумма PSS {total_pss:.0f} МБ, Private на воркер (сверх импорта) {avg_private:.0f} МБ")
+
+    lines += [
+        "",
+        "| Режим | Сумма PSS всех воркеров, МБ | Private на воркер сверх импорта, МБ |",
+        "|---|---|---|",
+        *summary,
+        "",
+    ]
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    print(f"✅ Отчет сохранен: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
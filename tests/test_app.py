@@ -0,0 +1,151 @@
+# tests/test_app.py
+"""
+Unit Tests for the analysis handlers in backend/app.py (no server, no Redis, no DB)
+
+app.py uses flat imports (it is run from backend/), so backend/ is put on sys.path.
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_app.py
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+import app as app_module  # noqa: E402
+
+GEMINI_JSON = {
+    "verdict": "fake",
+    "confidence": 0.9,
+    "bias_identification": "—",
+    "detailed_explanation": "Нет подтверждений в источниках.",
+    "sources": [{"title": "Источник", "url": "http://example.com", "description": "..."}],
+    "search_suggestions": [],
+}
+CLAIM = "Scientists confirmed that drinking hot water every hour cures all viral infections."
+
+
+class FakeSearcher:
+    async def asearch(self, text, language, max_results=3):
+        return [{"title": "Источник", "url": "http://example.com", "snippet": "..."}]
+
+
+class FakeGemini:
+    def __init__(self):
+        self.calls = 0
+
+    async def stream(self, kind, prompt):
+        self.calls += 1
+        yield json.dumps(GEMINI_JSON), None
+
+    async def generate(self, kind, prompt, response_model=None):
+        self.calls += 1
+        return response_model.model_validate(GEMINI_JSON), None
+
+
+def parse_events(chunks):
+    events = {}
+    for chunk in chunks:
+        head, data = chunk.strip().split("\n", 1)
+        events[head[len("event: "):]] = json.loads(data[len("data: "):])
+    return events
+
+
+@pytest.mark.asyncio
+async def test_guest_stream_then_analyze_uses_clean_cache_entry():
+    gemini = FakeGemini()
+    state = SimpleNamespace(
+        searcher=FakeSearcher(), gemini=gemini, adb=object(),
+        verdict_cache=app_module.VerdictCache(redis_client=None),
+    )
+
+    chunks = [c async for c in app_module.stream_text_analysis(
+        state.searcher, gemini, None, state.verdict_cache, CLAIM, None)]
+    events = parse_events(chunks)
+    assert "error" not in events
+    assert events["result"]["cache"]["hit"] is False
+
+    # Кэш хранит ответ без полей конкретного запроса
+    cached, _ = await state.verdict_cache.get(events["result"]["cache"]["fingerprint"])
+    assert "cache" not in cached
+
+    request = SimpleNamespace(app=SimpleNamespace(state=state), headers={}, client=SimpleNamespace(host="10.0.0.1"))
+    response = await app_module.analyze_text(app_module.AnalysisRequest(text=CLAIM), request, current_user=None)
+
+    assert response.cache.hit is True
+    assert response.cache.tier == "memory"
+    assert response.verdict == "fake"
+    assert gemini.calls == 1
+
+
+class FakeVotesDB:
+    def __init__(self, issued):
+        self.issued = issued
+
+    async def analysis_id_issued(self, analysis_id):
+        return analysis_id in self.issued
+
+
+@pytest.mark.asyncio
+async def test_buffered_vote_for_unknown_analysis_is_rejected():
+    adb = FakeVotesDB(issued={100})
+    writer = app_module.WriteBehindBuffer(adb)
+    request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(adb=adb, writer=writer)))
+    user = {"id": 1, "email": "user@example.com"}
+
+    with pytest.raises(app_module.HTTPException) as exc:
+        await app_module.submit_vote(app_module.VoteRequest(analysis_id=555, vote=1), request, current_user=user)
+    assert exc.value.status_code == 404
+    assert writer.stats()["enqueued"] == 0
+
+    # Зарезервированный ID принимается, даже если строка анализа еще в буфере
+    await app_module.submit_vote(app_module.VoteRequest(analysis_id=100, vote=1), request, current_user=user)
+    assert writer.stats()["enqueued"] == 1
+
+
+def test_guests_behind_the_heroku_router_get_separate_ips():
+    # Procfile: приложение за роутером Heroku, соединение всегда с адреса роутера
+    router = SimpleNamespace(host="10.1.2.3")
+    first = SimpleNamespace(headers={"X-Forwarded-For": "203.0.113.7"}, client=router)
+    second = SimpleNamespace(headers={"X-Forwarded-For": "6.6.6.6, 198.51.100.9"}, client=router)
+
+    assert app_module.TRUSTED_PROXY_HOPS == 1
+    assert app_module.client_ip(first) == "203.0.113.7"
+    assert app_module.client_ip(second) == "198.51.100.9"
+
+
+class FakeBatchDB:
+    async def save_analyses_batch(self, rows):
+        return list(range(1, len(rows) + 1))
+
+
+@pytest.mark.asyncio
+async def test_batch_larger_than_remaining_quota_gets_per_item_429():
+    claims = [f"Claim number {i} about the city budget for public transport next year." for i in range(5)]
+    cache = app_module.VerdictCache(redis_client=None)
+    for text in claims:
+        clean = app_module.preprocess_text(text)
+        await cache.set(app_module.claim_fingerprint(clean, app_module.detect_language(text)),
+                        {**GEMINI_JSON, "original_statement": text})
+    state = SimpleNamespace(
+        searcher=FakeSearcher(), gemini=FakeGemini(), adb=FakeBatchDB(), verdict_cache=cache,
+        rate_limiter=app_module.RateLimiter(None, {"user": (3, app_module.DAY_SECONDS)}),
+    )
+    request = SimpleNamespace(app=SimpleNamespace(state=state))
+    user = {"id": 1, "email": "user@example.com"}
+    items = [app_module.AnalysisRequest(text=text) for text in claims]
+
+    results = await app_module.analyze_batch(items, request, current_user=user)
+
+    assert [r.status_code for r in results] == [200, 200, 200, 429, 429]
+    assert all(r.ok for r in results[:3]) and not any(r.ok for r in results[3:])
+
+    # Квота исчерпана — весь пакет получает 429 с Retry-After
+    with pytest.raises(app_module.HTTPException) as exc:
+        await app_module.analyze_batch(items, request, current_user=user)
+    assert exc.value.status_code == 429 and "Retry-After" in exc.value.headers
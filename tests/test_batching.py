@@ -0,0 +1,56 @@
+# tests/test_batching.py
+"""
+Unit Tests for /analyze_batch helpers (backend/batching.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_batching.py
+"""
+
+import asyncio
+import pytest
+from backend.batching import dedupe, gather_bounded, pack_claims
+
+
+def test_dedupe_keeps_first_occurrence_order():
+    groups = dedupe(["b", "a", "b", None, "a"])
+    assert list(groups) == ["b", "a", None]
+    assert groups["b"] == [0, 2]
+    assert groups["a"] == [1, 4]
+
+
+def test_pack_claims_groups_short_claims_by_language():
+    claims = [
+        ("k1", "short ru 1", "ru"),
+        ("k2", "x" * 500, "ru"),
+        ("k3", "short en", "en"),
+        ("k4", "short ru 2", "ru"),
+        ("k5", "short ru 3", "ru"),
+    ]
+    packs, singles = pack_claims(claims, pack_size=2, max_chars=100)
+
+    assert [[key for key, _, _ in pack] for pack in packs] == [["k1", "k4"]]
+    # длинное, одинокое английское и остаток русской группы идут по одному
+    assert sorted(key for key, _, _ in singles) == ["k2", "k3", "k5"]
+
+
+@pytest.mark.asyncio
+async def test_gather_bounded_limits_concurrency_and_keeps_errors():
+    running = 0
+    peak = 0
+
+    async def job(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if i == 3:
+            raise ValueError("boom")
+        return i
+
+    results = await gather_bounded([lambda i=i: job(i) for i in range(10)], limit=3)
+
+    assert peak == 3
+    assert isinstance(results[3], ValueError)
+    assert [r for r in results if not isinstance(r, Exception)] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
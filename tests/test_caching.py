@@ -0,0 +1,138 @@
+# tests/test_caching.py
+"""
+Unit Tests for the verdict cache (backend/caching.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_caching.py
+"""
+
+import asyncio
+
+import pytest
+from backend.caching import TTLCache, UserCache, VerdictCache, claim_fingerprint
+
+
+class InMemoryRedis:
+    """Минимальная замена redis.asyncio.Redis (только get/set)."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+
+class PubSubRedis:
+    """Минимальная замена redis.asyncio.Redis для pub/sub (publish/pubsub)."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    async def publish(self, channel, message):
+        for queue in self.subscribers:
+            queue.put_nowait({"type": "message", "channel": channel, "data": message})
+
+    def pubsub(self):
+        broker = self
+
+        class PubSub:
+            async def subscribe(self, channel):
+                self.queue = asyncio.Queue()
+                broker.subscribers.append(self.queue)
+
+            async def listen(self):
+                while True:
+                    yield await self.queue.get()
+
+            async def aclose(self):
+                broker.subscribers.remove(self.queue)
+
+        return PubSub()
+
+
+def test_fingerprint_normalizes_case_and_whitespace():
+    a = claim_fingerprint("The  President signed a decree", "en")
+    b = claim_fingerprint("the president SIGNED a decree", "en")
+    assert a == b
+    assert a != claim_fingerprint("the president signed a decree", "ru")
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_items=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # 'a' становится самым свежим
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_items=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_verdict_cache_tiers():
+    redis_client = InMemoryRedis()
+    cache = VerdictCache(redis_client=redis_client)
+    fp = claim_fingerprint("some claim", "en")
+
+    assert await cache.get(fp) == (None, None)
+
+    await cache.set(fp, {"verdict": "fake", "confidence": 0.9})
+    assert await cache.get(fp) == ({"verdict": "fake", "confidence": 0.9}, "memory")
+
+    # Новый процесс: локальный уровень пуст, значение приходит из Redis
+    other_worker = VerdictCache(redis_client=redis_client)
+    value, tier = await other_worker.get(fp)
+    assert tier == "redis" and value["verdict"] == "fake"
+    _, tier = await other_worker.get(fp)
+    assert tier == "memory"
+
+    stats = other_worker.stats()
+    assert stats["redis"]["hits"] == 1
+    assert stats["memory"]["hits"] == 1
+
+
+def test_user_cache_hit_skips_password_and_checks_token_email():
+    cache = UserCache()
+    stored = cache.set({"id": 7, "email": "a@b.c", "hashed_password": "secret"})
+    assert stored == {"id": 7, "email": "a@b.c"}
+
+    assert cache.get(7, "a@b.c") == {"id": 7, "email": "a@b.c"}
+    assert cache.get(7, "other@b.c") is None  # id из токена не совпал с email
+    assert cache.get(7, "a@b.c") is None  # запись удалена
+
+    stats = cache.stats()
+    assert stats["memory"]["hits"] == 1
+    assert stats["mismatches"] == 1
+    assert stats["memory"]["hit_ratio"] == round(1 / 3, 4)
+
+
+@pytest.mark.asyncio
+async def test_user_cache_invalidation_reaches_other_workers():
+    redis_client = PubSubRedis()
+    worker_a, worker_b = UserCache(redis_client=redis_client), UserCache(redis_client=redis_client)
+    worker_b.start()
+    try:
+        await asyncio.sleep(0)  # подписка
+        worker_a.set({"id": 1, "email": "a@b.c"})
+        worker_b.set({"id": 1, "email": "a@b.c"})
+
+        await worker_a.invalidate(1)
+        await asyncio.sleep(0.01)
+
+        assert worker_a.get(1, "a@b.c") is None
+        assert worker_b.get(1, "a@b.c") is None
+        # Без start() worker не держит подписку
+        assert worker_a.stats()["invalidation_channel"] is False
+        assert worker_b.stats()["invalidation_channel"] is True
+    finally:
+        await worker_b.stop()
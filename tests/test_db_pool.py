@@ -0,0 +1,132 @@
+# tests/test_db_pool.py
+"""
+Unit Tests for the PostgreSQL connection pool (backend/db_pool.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_db_pool.py
+"""
+
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+from backend.db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self.conn.executed.append(sql)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    @property
+    def info(self):
+        return self
+
+    @property
+    def transaction_status(self):
+        return self.status
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    params = dict(min_size=1, max_size=2, timeout=0.2, max_lifetime=0, check_idle=60)
+    params.update(kwargs)
+    return ConnectionPool("postgresql://test", connect=connect, **params), created
+
+
+def test_connections_are_reused_and_committed():
+    pool, created = make_pool()
+    pool.fill()
+    for _ in range(3):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+    assert len(created) == 1
+    assert created[0].commits == 3
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE users SET x = 1")
+            raise ValueError("boom")
+    assert created[0].rollbacks == 1
+    assert pool.stats()["idle"] == 1
+
+
+def test_exhausted_pool_waits_then_times_out():
+    pool, created = make_pool(max_size=1, timeout=0.5)
+    conn = pool.getconn()
+
+    def release_later():
+        time.sleep(0.1)
+        pool.putconn(conn)
+
+    threading.Thread(target=release_later).start()
+    assert pool.getconn() is conn  # дождались возврата
+    stats = pool.stats()
+    assert stats["waits"] == 1 and stats["wait_time_max"] > 0
+
+    pool.timeout = 0.05
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_broken_and_expired_connections_are_replaced():
+    pool, created = make_pool(check_idle=0)
+    with pool.connection():
+        pass
+    created[0].broken = True  # SELECT 1 при выдаче не пройдет
+    with pool.connection() as conn:
+        assert conn is created[1]
+    assert created[0].closed
+    assert pool.stats()["closed_broken"] == 1
+
+    pool.max_lifetime = 0.01
+    time.sleep(0.02)
+    with pool.connection() as conn:
+        assert conn is created[2]
+    assert pool.stats()["closed_lifetime"] >= 1
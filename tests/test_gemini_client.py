@@ -0,0 +1,209 @@
+# tests/test_gemini_client.py
+"""
+Unit Tests for the shared Gemini execution layer (backend/gemini_client.py)
+
+Models are replaced by small fakes exposing `model_name` and
+`generate_content_async`, so no API key is needed.
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_gemini_client.py
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pydantic import BaseModel
+from backend.gemini_client import GeminiExecutor, GeminiResponseError, GeminiUnavailableError
+
+
+class Verdict(BaseModel):
+    verdict: str
+    confidence: float
+
+
+class FakeModel:
+    """Отвечает по очереди элементами `script`: строка — текст ответа, исключение — ошибка."""
+
+    def __init__(self, name, script, delay=0.0):
+        self.model_name = name
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        item = self.script[min(self.calls, len(self.script)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return SimpleNamespace(text=item)
+
+
+OK = '{"verdict": "real", "confidence": 0.9}'
+
+
+def make_executor(**models):
+    return GeminiExecutor(models=models, backoff_base=0.001, backoff_max=0.01)
+
+
+@pytest.mark.asyncio
+async def test_transient_error_is_retried_on_same_model():
+    primary = FakeModel("flash", [RuntimeError("503"), OK])
+    fallback = FakeModel("pro", [OK])
+    executor = make_executor(text=primary, fallback=fallback)
+
+    result, model_name = await executor.generate("text", "prompt", response_model=Verdict)
+
+    assert result.verdict == "real"
+    assert model_name == "flash"
+    assert primary.calls == 2 and fallback.calls == 0
+    assert executor.stats()["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_sends_calls_straight_to_fallback():
+    primary = FakeModel("flash", [RuntimeError("overloaded")])
+    fallback = FakeModel("pro", [OK])
+    executor = make_executor(text=primary, fallback=fallback)
+    executor.max_retries = 5
+    executor.breaker_for(primary).threshold = 3
+
+    _, model_name = await executor.generate("text", "prompt", response_model=Verdict)
+    assert model_name == "pro"
+    assert primary.calls == 3  # breaker открылся до исчерпания повторов
+    assert executor.breakers["flash"].state == "open"
+
+    _, model_name = await executor.generate("text", "prompt", response_model=Verdict)
+    assert model_name == "pro"
+    assert primary.calls == 3  # основная модель больше не вызывается
+
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_probe_releases_breaker():
+    slow = FakeModel("flash", [OK], delay=1.0)
+    executor = make_executor(text=slow)
+    breaker = executor.breaker_for(slow)
+    breaker.state = "half_open"
+
+    task = asyncio.ensure_future(executor.generate("text", "prompt", use_fallback=False))
+    await asyncio.sleep(0.05)
+    assert not breaker.allow()  # пробная попытка уже идет
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # следующая пробная попытка снова разрешена
+
+
+@pytest.mark.asyncio
+async def test_interrupted_queue_wait_never_leaks_a_slot():
+    executor = GeminiExecutor(models={}, max_concurrency=1)
+
+    async def wait_for_slot(timeout):
+        async with executor._slot(timeout):
+            pass
+
+    # Освобождение места и отмена/таймаут ожидающего в разных порядках
+    for ticks in range(4):
+        for interrupt in ("cancel", "timeout"):
+            async with executor._slot(1.0):
+                waiter = asyncio.ensure_future(wait_for_slot(0.05 if interrupt == "timeout" else 1.0))
+                await asyncio.sleep(0.04 if interrupt == "timeout" else 0)
+            for _ in range(ticks):
+                await asyncio.sleep(0)
+            if interrupt == "cancel":
+                waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+
+            assert executor._semaphore._value == 1
+            assert executor._waiting == 0 and executor._in_flight == 0
+
+    await asyncio.wait_for(wait_for_slot(0.1), timeout=1.0)  # место свободно
+
+
+@pytest.mark.asyncio
+async def test_deadline_bounds_total_time():
+    slow = FakeModel("flash", [OK], delay=1.0)
+    executor = make_executor(text=slow)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with pytest.raises(GeminiUnavailableError):
+        await executor.generate("text", "prompt", deadline=0.2)
+    assert loop.time() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_unparseable_response_raises_response_error():
+    primary = FakeModel("flash", ["not json"])
+    executor = make_executor(text=primary)
+
+    with pytest.raises(GeminiResponseError):
+        await executor.generate("text", "prompt", response_model=Verdict)
+    assert primary.calls == executor.max_retries
+
+
+class FakeStreamingModel:
+    """Потоковая модель: `script` — список ответов на вызовы (список фрагментов или исключение)."""
+
+    def __init__(self, name, script, fail_after=None):
+        self.model_name = name
+        self.script = list(script)
+        self.fail_after = fail_after
+        self.calls = 0
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        item = self.script[min(self.calls, len(self.script)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        fail_after = self.fail_after
+
+        async def chunks():
+            for i, text in enumerate(item):
+                if fail_after is not None and i == fail_after:
+                    raise RuntimeError("connection reset")
+                await asyncio.sleep(0)
+                yield SimpleNamespace(text=text)
+        return chunks()
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_chunks_and_falls_back_before_first_chunk():
+    primary = FakeStreamingModel("flash", [RuntimeError("503")])
+    fallback = FakeStreamingModel("pro", [['{"verdict": ', '"real", "confidence": 0.9}']])
+    executor = make_executor(text=primary, fallback=fallback)
+
+    received = [item async for item in executor.stream("text", "prompt")]
+
+    assert "".join(text for text, _ in received) == OK
+    assert {name for _, name in received} == {"pro"}
+    assert primary.calls == executor.max_retries
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_after_first_chunk_is_not_retried():
+    primary = FakeStreamingModel("flash", [["{", "}"]], fail_after=1)
+    executor = make_executor(text=primary)
+
+    received = []
+    with pytest.raises(GeminiUnavailableError):
+        async for text, _ in executor.stream("text", "prompt"):
+            received.append(text)
+
+    assert received == ["{"]
+    assert primary.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_is_bounded_by_max_chars():
+    primary = FakeStreamingModel("flash", [["x" * 10] * 10])
+    executor = make_executor(text=primary)
+
+    with pytest.raises(GeminiResponseError):
+        async for _ in executor.stream("text", "prompt", max_chars=25):
+            pass
+    assert executor.stats()["in_flight"] == 0
@@ -0,0 +1,54 @@
+# tests/test_inference_backends.py
+"""
+Unit Tests for pluggable CPU inference backends (backend/inference_backends.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_inference_backends.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from backend.inference_backends import (  # noqa: E402
+    QuantizedRunner, TorchRunner, compare_probabilities, load_runner, onnx_path_for
+)
+
+
+class TinyClassifier(torch.nn.Module):
+    """Минимальная замена AutoModelForSequenceClassification: forward(**inputs).logits."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.embed = torch.nn.Embedding(100, 32)
+        self.head = torch.nn.Linear(32, 2)
+        self.config = SimpleNamespace(id2label={0: "REAL", 1: "FAKE"})
+
+    def forward(self, input_ids, attention_mask=None):
+        hidden = self.embed(input_ids).mean(dim=1)
+        return SimpleNamespace(logits=self.head(hidden))
+
+
+def test_int8_runner_keeps_labels_of_torch_runner():
+    inputs = {"input_ids": torch.randint(0, 100, (16, 12)), "attention_mask": torch.ones(16, 12, dtype=torch.long)}
+    reference = torch.softmax(TorchRunner(TinyClassifier())(**inputs), dim=-1).tolist()
+    quantized = QuantizedRunner(TinyClassifier())
+    candidate = torch.softmax(quantized(**inputs), dim=-1).tolist()
+
+    parity = compare_probabilities(reference, candidate)
+    assert parity["n"] == 16 and parity["max_abs_diff"] < 0.05
+    assert quantized.config.id2label == {0: "REAL", 1: "FAKE"}
+
+
+def test_unknown_backend_falls_back_to_torch():
+    assert isinstance(load_runner(TinyClassifier(), None, "tiny", backend="tpu"), TorchRunner)
+
+
+def test_compare_probabilities_and_onnx_cache_names():
+    parity = compare_probabilities([[0.9, 0.1], [0.4, 0.6]], [[0.8, 0.2], [0.7, 0.3]])
+    assert parity["label_agreement"] == 0.5 and parity["max_abs_diff"] == pytest.approx(0.3)
+    assert onnx_path_for("joeddav/xlm-roberta-large-xnli", cache_dir="cache") == "cache/joeddav__xlm-roberta-large-xnli.onnx"
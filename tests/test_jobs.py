@@ -0,0 +1,264 @@
+# tests/test_jobs.py
+"""
+Unit Tests for the background job runner (backend/jobs.py)
+
+Uses the in-memory store; callbacks are sent to a local stub HTTP server.
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_jobs.py
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from backend.jobs import JobRunner, MemoryJobStore, RedisJobStore
+
+
+async def wait_for_status(store, job_id, statuses=("succeeded", "failed"), timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        job = await store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, detail):
+        self.status_code = status_code
+        self.detail = detail
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_immediately_and_worker_stores_result():
+    release = asyncio.Event()
+
+    async def slow_analysis(job):
+        await release.wait()
+        return {"verdict": "real", "text": job["payload"]["text"]}
+
+    store = MemoryJobStore()
+    runner = JobRunner(store, {"analyze": slow_analysis}, workers=2, poll_timeout=0.05)
+    runner.start()
+    try:
+        job = await runner.submit("analyze", {"text": "claim"})
+        assert job["status"] == "queued"
+
+        await wait_for_status(store, job["id"], statuses=("running",))
+        release.set()
+        done = await wait_for_status(store, job["id"])
+    finally:
+        await runner.stop()
+
+    assert done["status"] == "succeeded"
+    assert done["result"] == {"verdict": "real", "text": "claim"}
+    assert done["finished_at"] >= done["started_at"] >= done["created_at"]
+
+
+@pytest.mark.asyncio
+async def test_handler_errors_are_recorded_with_status_code():
+    async def failing(job):
+        raise HTTPError(400, "Не удалось скачать контент")
+
+    store = MemoryJobStore()
+    runner = JobRunner(store, {"analyze_url": failing}, workers=1, poll_timeout=0.05)
+    runner.start()
+    try:
+        job = await runner.submit("analyze_url", {"url": "http://x", "text": "t"})
+        done = await wait_for_status(store, job["id"])
+    finally:
+        await runner.stop()
+
+    assert done["status"] == "failed"
+    assert done["error"] == {"status_code": 400, "detail": "Не удалось скачать контент"}
+    assert runner.counters["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_callback_receives_public_job_view():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    async def ok(job):
+        return {"verdict": "fake"}
+
+    store = MemoryJobStore()
+    runner = JobRunner(store, {"analyze": ok}, workers=1, poll_timeout=0.05)
+    runner.start()
+    try:
+        job = await runner.submit("analyze", {"text": "secret"}, callback_url=f"http://127.0.0.1:{httpd.server_address[1]}/hook", owner_id=7)
+        await wait_for_status(store, job["id"])
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await runner.stop()
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert received and received[0]["id"] == job["id"]
+    assert received[0]["result"] == {"verdict": "fake"}
+    assert "payload" not in received[0] and "owner_id" not in received[0]
+
+
+@pytest.mark.asyncio
+async def test_analysis_id_is_not_written_into_shared_singleflight_result():
+    from backend.tasks import analyze_url_task
+
+    class FakeDB:
+        def __init__(self):
+            self.next_id = 0
+
+        async def save_analysis(self, **kwargs):
+            self.next_id += 1
+            return self.next_id
+
+    shared = {"verdict": "fake", "confidence": 0.9}
+
+    async def analyze_url(url, text):
+        return shared  # один объект для всех конкурентных вызовов
+
+    db = FakeDB()
+    first = await analyze_url_task({"payload": {"url": "http://x", "text": "claim"}, "owner_id": 1}, db, analyze_url)
+    second = await analyze_url_task({"payload": {"url": "http://x", "text": "claim"}, "owner_id": 2}, db, analyze_url)
+
+    assert (first["analysis_id"], second["analysis_id"]) == (1, 2)
+    assert "analysis_id" not in shared
+
+
+class ListRedis:
+    """Замена redis.asyncio.Redis для RedisJobStore: строки, списки, ZSET и скрипт возврата в очередь."""
+
+    def __init__(self):
+        self.strings, self.lists, self.zsets = {}, {}, {}
+
+    async def set(self, key, value, ex=None):
+        self.strings[key] = value
+
+    async def get(self, key):
+        return self.strings.get(key)
+
+    async def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    async def lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        if value in items:
+            items.remove(value)
+            return 1
+        return 0
+
+    async def blmove(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        items = self.lists.get(first_list, [])
+        if not items:
+            await asyncio.sleep(0.01)
+            return None
+        value = items.pop()  # RIGHT -> LEFT, как вызывает RedisJobStore
+        self.lists.setdefault(second_list, []).insert(0, value)
+        return value
+
+    async def zadd(self, key, mapping, nx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and member in zset):
+                zset[member] = score
+
+    async def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    async def zmscore(self, key, members):
+        return [self.zsets.get(key, {}).get(m) for m in members]
+
+    async def eval(self, script, numkeys, processing, queue, job_key, job_id, job_json, ttl):
+        if not await self.lrem(processing, 1, job_id):
+            return 0
+        self.strings[job_key] = job_json
+        await self.lpush(queue, job_id)
+        return 1
+
+    def pipeline(self):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append(getattr(redis, name)(*args, **kwargs))
+
+            async def execute(self):
+                return [await call for call in self.calls]
+
+        return Pipeline()
+
+
+@pytest.mark.asyncio
+async def test_job_of_crashed_worker_is_requeued_and_finished_by_another():
+    redis = ListRedis()
+    store = RedisJobStore(redis)
+
+    async def analysis(job):
+        return {"verdict": "real"}
+
+    crashed = JobRunner(store, {"analyze": analysis}, workers=0)
+    job = await crashed.submit("analyze", {"text": "claim"})
+    # Worker забрал задачу и упал посреди обработки
+    assert await store.dequeue(1) == job["id"]
+    running = await store.get(job["id"])
+    running.update(status="running", started_at=1.0)
+    await store.save(running)
+    assert await store.requeue_stale(stale_after=60) == {"requeued": 0, "abandoned": 0}  # еще не просрочена
+
+    redis.zsets[RedisJobStore.CLAIMED_KEY][job["id"]] -= 120
+    runner = JobRunner(store, {"analyze": analysis}, workers=1, poll_timeout=0.05, reap_interval=0.01, stale_after=60)
+    runner.start()
+    try:
+        done = await wait_for_status(store, job["id"])
+    finally:
+        await runner.stop()
+
+    assert done["status"] == "succeeded" and done["attempts"] == 1
+    assert runner.counters["requeued"] == 1
+    assert redis.lists[RedisJobStore.PROCESSING_KEY] == [] and redis.zsets[RedisJobStore.CLAIMED_KEY] == {}
+
+
+@pytest.mark.asyncio
+async def test_job_interrupted_too_many_times_is_failed():
+    redis = ListRedis()
+    store = RedisJobStore(redis)
+    runner = JobRunner(store, {"analyze": None}, workers=0)
+    job = await runner.submit("analyze", {"text": "claim"})
+
+    for attempt in range(3):
+        assert await store.dequeue(1) == job["id"]
+        redis.zsets[RedisJobStore.CLAIMED_KEY][job["id"]] -= 120
+        reaped = await store.requeue_stale(stale_after=60, max_attempts=3)
+
+    assert reaped == {"requeued": 0, "abandoned": 1}
+    failed = await store.get(job["id"])
+    assert failed["status"] == "failed" and failed["error"]["status_code"] == 500
+    assert await store.queue_depth() == 0 and redis.lists[RedisJobStore.PROCESSING_KEY] == []
@@ -0,0 +1,71 @@
+# tests/test_micro_batcher.py
+"""
+Unit Tests for dynamic micro-batching of model inference (backend/micro_batcher.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_micro_batcher.py
+"""
+
+import threading
+
+import pytest
+from backend.micro_batcher import BatcherBusy, MicroBatcher, length_sorted_chunks
+
+
+def test_concurrent_submits_share_one_batch():
+    release = threading.Event()
+    batches = []
+
+    def process(items):
+        release.wait(5)  # первый пакет держим, пока остальные копятся в очереди
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50, max_queue=16)
+    futures = [batcher.submit(i) for i in range(6)]
+    release.set()
+
+    assert [f.result(5) for f in futures] == [0, 10, 20, 30, 40, 50]
+    sizes = [len(b) for b in batches]
+    assert sum(sizes) == 6 and max(sizes) <= 4 and len(sizes) < 6  # max_batch_size ограничивает пакет
+    stats = batcher.stats()
+    assert stats["items"] == 6 and stats["batches"] == len(sizes)
+    assert sum(stats["batch_size_histogram"].values()) == len(sizes)
+    batcher.stop()
+
+
+def test_batch_error_reaches_every_caller():
+    def process(items):
+        raise ValueError("forward failed")
+
+    batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+    assert batcher.stats()["failed_batches"] >= 1
+    batcher.stop()
+
+
+def test_full_queue_rejects_immediately():
+    release = threading.Event()
+    batcher = MicroBatcher(lambda items: release.wait(5) and items, max_batch_size=1, max_wait_ms=0, max_queue=1)
+    busy = batcher.submit("a")
+    while batcher._queue.qsize():  # "a" уже в обработке
+        pass
+    queued = batcher.submit("b")
+    with pytest.raises(BatcherBusy):
+        batcher.submit("c")
+    release.set()
+    assert busy.result(5) == "a" and queued.result(5) == "b"
+    assert batcher.stats()["rejected"] == 1
+    batcher.stop()
+
+
+def test_length_sorted_chunks_limit_count_and_padded_tokens():
+    lengths = [120, 30, 250, 35, 32, 118]
+    assert length_sorted_chunks(lengths, max_batch=3, max_tokens=None) == [[1, 4, 3], [5, 0, 2]]
+    # 4 * 118 > 300 токенов с padding — длинные пары уходят в отдельные пакеты
+    assert length_sorted_chunks(lengths, max_batch=8, max_tokens=300) == [[1, 4, 3], [5, 0], [2]]
+    assert length_sorted_chunks([], max_batch=4) == []
@@ -0,0 +1,81 @@
+# tests/test_model_registry.py
+"""
+Unit Tests for the lazy LRU model registry (backend/model_registry.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_model_registry.py
+"""
+
+import threading
+import time
+
+import pytest
+from backend.model_registry import ModelLoadError, ModelRegistry
+
+MB = 1024 * 1024
+
+
+def make_registry(sizes, budget_mb, calls):
+    def loader(name):
+        def load():
+            calls.append(name)
+            return {"name": name, "bytes": sizes[name] * MB}
+        return load
+
+    return ModelRegistry({name: loader(name) for name in sizes}, size_of=lambda value: value["bytes"],
+                         budget_bytes=budget_mb * MB)
+
+
+def test_models_load_on_first_use_and_lru_is_evicted_under_budget():
+    calls = []
+    registry = make_registry({"en": 300, "kk": 300, "nli": 500}, budget_mb=800, calls=calls)
+    assert registry.resident() == [] and calls == []
+
+    registry.get("en")
+    registry.get("kk")
+    registry.get("en")  # en снова самая свежая
+    registry.get("nli")  # 300 + 300 + 500 > 800 — вытесняется kk
+
+    assert registry.resident() == ["en", "nli"]
+    assert calls == ["en", "kk", "nli"]
+    stats = registry.stats()
+    assert stats["resident_bytes"] == 800 * MB
+    assert stats["models"]["kk"]["evictions"] == 1 and stats["models"]["en"]["hits"] == 1
+
+    registry.get("kk")  # размер известен — место освобождается до загрузки
+    assert registry.resident() == ["nli", "kk"] and calls[-1] == "kk"
+
+
+def test_concurrent_first_use_loads_once():
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry = ModelRegistry({"en": slow_load})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("en"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1 and len({id(r) for r in results}) == 1
+
+
+def test_failed_load_is_not_retried_immediately_and_preload_skips_it():
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise OSError("no weights")
+
+    registry = ModelRegistry({"en": broken, "kk": lambda: "kk-model"}, retry_seconds=60)
+    assert registry.preload(["*"]) == ["kk"]
+    with pytest.raises(ModelLoadError):
+        registry.get("en")
+    assert len(attempts) == 1
+    assert registry.stats()["models"]["en"]["failures"] == 1
@@ -0,0 +1,124 @@
+# tests/test_partitions.py
+"""
+Unit Tests for monthly table partitioning and retention (backend/partitions.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_partitions.py
+"""
+
+from datetime import date, datetime, timezone
+
+from backend import partitions
+from backend.partitions import (
+    add_months, months_to_create, parse_upper_bound, partition_name, partitions_to_retire
+)
+
+
+class RecordingCursor:
+    """Курсор psycopg2 без PostgreSQL: запоминает SQL, отвечает на запросы к каталогу."""
+
+    def __init__(self, relkinds=None, existing=()):
+        self.relkinds = dict(relkinds or {})
+        self.existing = list(existing)
+        self.sql = []
+        self._result = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(" ".join(sql.split()))
+        if "c.relkind FROM pg_class" in sql:
+            kind = self.relkinds.get(params[0])
+            self._result = [(kind,)] if kind else []
+        elif "FROM pg_inherits" in sql:
+            self._result = [(name, "") for name in self.existing]
+        elif "pg_try_advisory_xact_lock" in sql:
+            self._result = [(True,)]
+        else:
+            self._result = []
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+
+def test_month_arithmetic_and_names():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert months_to_create(date(2024, 12, 15), premake=2) == [date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1)]
+    assert partition_name("analyses", date(2024, 3, 1)) == "analyses_p2024_03"
+
+
+def test_retention_uses_partition_upper_bound():
+    bounds = [
+        ("analyses_legacy", "FOR VALUES FROM (MINVALUE) TO ('2024-02-01 00:00:00+00')"),
+        ("analyses_p2024_02", "FOR VALUES FROM ('2024-02-01 05:00:00+05') TO ('2024-03-01 05:00:00+05')"),
+        ("analyses_p2024_03", "FOR VALUES FROM ('2024-03-01 00:00:00+00') TO ('2024-04-01 00:00:00+00')"),
+    ]
+    assert parse_upper_bound(bounds[1][1]) == datetime(2024, 3, 1, tzinfo=timezone.utc)
+    # 6 месяцев хранения на 15.09.2024: окно начинается 01.03.2024
+    assert partitions_to_retire(bounds, date(2024, 9, 15), months=6) == ["analyses_legacy", "analyses_p2024_02"]
+    assert partitions_to_retire(bounds, date(2024, 9, 15), months=0) == []
+
+
+def test_fresh_database_gets_partitioned_tables():
+    cur = RecordingCursor()
+    assert partitions.setup(cur, today=date(2024, 5, 10), migrate=False) == {
+        "analyses": True, "telegram_monitored_messages": True,
+    }
+    ddl = "\n".join(cur.sql)
+    assert "PARTITION BY RANGE (created_at)" in ddl and "PARTITION BY RANGE (message_timestamp)" in ddl
+    assert ('CREATE TABLE IF NOT EXISTS "analyses_p2024_06" PARTITION OF "analyses" '
+            "FOR VALUES FROM ('2024-06-01 00:00:00+00') TO ('2024-07-01 00:00:00+00');") in cur.sql
+    assert 'ALTER SEQUENCE "analyses_id_seq" OWNED BY "analyses".id;' in cur.sql
+
+
+def test_legacy_table_is_left_alone_without_migrate_flag_and_attached_with_it():
+    cur = RecordingCursor(relkinds={"analyses": "r", "telegram_monitored_messages": "p"})
+    assert partitions.setup(cur, today=date(2024, 5, 10), migrate=False)["analyses"] is False
+    assert not any("RENAME" in sql for sql in cur.sql)
+
+    cur = RecordingCursor(relkinds={"analyses": "r", "telegram_monitored_messages": "p"})
+    assert partitions.setup(cur, today=date(2024, 5, 10), migrate=True)["analyses"] is True
+    assert 'ALTER TABLE "analyses" RENAME TO "analyses_legacy";' in cur.sql
+    assert ('ALTER TABLE "analyses" ATTACH PARTITION "analyses_legacy" '
+            "FOR VALUES FROM (MINVALUE) TO ('2024-06-01 00:00:00+00');") in cur.sql
+    # текущий месяц остается в legacy; помесячные секции — с момента переключения
+    assert not any("analyses_p2024_05" in sql for sql in cur.sql)
+
+
+class VoteConnection:
+    """Соединение пула без PostgreSQL: INSERT голоса ничего не вставляет (анализа нет)."""
+
+    def __init__(self):
+        self.sql = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.sql.append((" ".join(sql.split()), params))
+
+    def commit(self):
+        pass
+
+
+def test_vote_for_missing_analysis_is_rejected_without_fk():
+    from backend.database import Database
+
+    conn = VoteConnection()
+    db = Database.__new__(Database)
+    db.pool = type("Pool", (), {"connection": lambda self: conn})()
+
+    assert db.save_vote(user_id=1, analysis_id=999, vote=1) is False
+    sql, params = conn.sql[0]
+    assert "WHERE EXISTS (SELECT 1 FROM analyses WHERE id = %s)" in sql
+    assert params == (1, 999, 1, 999)
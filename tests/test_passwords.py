@@ -0,0 +1,60 @@
+# tests/test_passwords.py
+"""
+Unit Tests for off-loop password hashing and login throttling (backend/passwords.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_passwords.py
+"""
+
+import asyncio
+import time
+
+import pytest
+from backend.passwords import LoginThrottle, PasswordHasher, PasswordPoolBusy
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_keep_event_loop_responsive():
+    hasher = PasswordHasher(pool_size=1, max_queue=4)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.005)
+
+    ticking = asyncio.ensure_future(ticker())
+    try:
+        hashed = await hasher.hash("correct horse")
+        assert await hasher.verify("correct horse", hashed)
+        assert not await hasher.verify("wrong", hashed)
+        assert not await hasher.verify("x", "not-a-bcrypt-hash")
+    finally:
+        ticking.cancel()
+        hasher.shutdown()
+
+    # Пока bcrypt считал в пуле, event loop продолжал работать
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert len(ticks) > 5 and max(gaps) < 0.1
+    assert hasher.stats()["verified"] == 3
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_immediately():
+    hasher = PasswordHasher(pool_size=1, max_queue=1)
+    try:
+        tasks = [asyncio.ensure_future(hasher.hash("pw")) for _ in range(3)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        hasher.shutdown()
+    assert sum(isinstance(r, PasswordPoolBusy) for r in results) == 1
+    assert hasher.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_login_throttle_limits_per_ip_window():
+    throttle = LoginThrottle(limit=3, window=60)
+    assert [await throttle.allow("1.2.3.4") for _ in range(4)] == [True, True, True, False]
+    assert await throttle.allow("5.6.7.8")  # другой IP не затронут
+    assert throttle.stats()["throttled"] == 1
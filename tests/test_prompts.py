@@ -0,0 +1,54 @@
+# tests/test_prompts.py
+"""
+Unit Tests for the precompiled prompt registry (backend/prompts.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_prompts.py
+"""
+
+from typing import List
+
+from pydantic import BaseModel
+from backend.prompts import PromptRegistry
+
+
+class Part(BaseModel):
+    name: str
+
+
+class VisionSchema(BaseModel):
+    verdict: str
+    parts: List[Part]  # вложенная модель -> "$defs" в JSON-схеме
+
+
+def test_static_fields_are_baked_in_per_language():
+    registry = PromptRegistry(schemas={"vision": VisionSchema})
+
+    compiled = registry.get("vision_analysis", "kk")
+    assert set(compiled.fields) == {"current_date", "text"}
+    assert any("Kazakh" in lit for lit in compiled.literals)
+    # "$defs" из схемы — часть литерала, а не поле шаблона
+    assert any("$defs" in lit for lit in compiled.literals)
+    assert compiled.static_tokens > 0
+
+
+def test_render_fills_dynamic_fields_and_keeps_user_dollars():
+    registry = PromptRegistry()
+    prompt = registry.render("full_analysis", "en", text="Price is $text now", sources_text="- Title: A",
+                             current_date="2026-01-01 (Thursday)")
+
+    assert 'Утверждение: "Price is $text now"' in prompt
+    assert "на English языке" in prompt
+    assert prompt.startswith("[SYSTEM NOTE: IMPORTANT CONTEXT]\nToday's Date: 2026-01-01 (Thursday).")
+
+
+def test_unknown_language_falls_back_to_russian_and_sizes_are_tracked():
+    registry = PromptRegistry()
+    prompt = registry.render("full_analysis", "de", text="x", sources_text="y")
+
+    assert "на Russian языке" in prompt
+    stats = registry.stats()["full_analysis"]
+    assert stats["renders"] == 1
+    assert stats["last_chars"] == len(prompt)
+    assert stats["avg_tokens"] > stats["static_tokens"]["ru"] * 0.9
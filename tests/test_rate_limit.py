@@ -0,0 +1,101 @@
+# tests/test_rate_limit.py
+"""
+Unit Tests for the Redis-scripted rate limiter (backend/rate_limit.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_rate_limit.py
+"""
+
+import pytest
+from backend.rate_limit import DAY_SECONDS, SLIDING_WINDOW_LUA, RateLimiter, TokenBuckets
+
+
+class ScriptRedis:
+    """Замена redis.asyncio.Redis: register_script возвращает скрипт с заданными ответами."""
+
+    def __init__(self, replies=None, error=None):
+        self.replies = list(replies or [])
+        self.error = error
+        self.calls = []
+        self.source = None
+
+    def register_script(self, source):
+        self.source = source
+
+        async def script(keys, args):
+            self.calls.append((keys, args))
+            if self.error is not None:
+                raise self.error
+            return self.replies.pop(0)
+
+        return script
+
+
+@pytest.mark.asyncio
+async def test_hit_runs_one_script_call_and_maps_reply():
+    redis = ScriptRedis(replies=[[1, 3, 0], [0, 30, 1500]])
+    limiter = RateLimiter(redis, {"user": (30, DAY_SECONDS)})
+
+    assert await limiter.hit("user", 42, cost=2) == (True, 3, 0.0)
+    assert await limiter.hit("user", 42) == (False, 30, 1.5)
+
+    assert redis.source == SLIDING_WINDOW_LUA
+    assert redis.calls == [
+        (["rl:user:42"], [30, DAY_SECONDS * 1000, 2]),
+        (["rl:user:42"], [30, DAY_SECONDS * 1000, 1]),
+    ]
+    stats = limiter.stats()["policies"]["user"]
+    assert (stats["allowed"], stats["rejected"], stats["errors"]) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_peek_does_not_consume_quota():
+    redis = ScriptRedis(replies=[[1, 5, 0]])
+    limiter = RateLimiter(redis, {"guest": (2, 60)})
+
+    assert await limiter.peek("guest", "1.2.3.4") == (True, 5, 0.0)
+    assert redis.calls == [(["rl:guest:1.2.3.4"], [2, 60000, 0])]
+    assert limiter.stats()["policies"]["guest"]["allowed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_local_tier_takes_over_without_redis_or_on_error():
+    limiter = RateLimiter(policies={"telegram": (2, 60)})
+    assert [(await limiter.hit("telegram", 1))[0] for _ in range(3)] == [True, True, False]
+    assert (await limiter.peek("telegram", 1))[1] == 2
+    assert (await limiter.hit("telegram", 2))[0]  # другой пользователь не затронут
+
+    limiter = RateLimiter(ScriptRedis(error=ConnectionError("down")), {"telegram": (1, 60)})
+    assert (await limiter.hit("telegram", 1))[0]
+    allowed, _, retry_after = await limiter.hit("telegram", 1)
+    assert not allowed and 0 < retry_after <= 60
+    stats = limiter.stats()["policies"]["telegram"]
+    assert (stats["errors"], stats["local"]) == (2, 2)
+
+    down = RateLimiter(ScriptRedis(), {"guest": (1, 60)}, is_available=lambda: False)
+    await down.hit("guest", "1.2.3.4")
+    assert down.redis.calls == []  # недоступный Redis не трогаем
+
+
+@pytest.mark.asyncio
+async def test_prefilter_rejects_flood_without_redis_call():
+    redis = ScriptRedis(replies=[[1, 1, 0], [1, 2, 0]])
+    limiter = RateLimiter(redis, {"guest": (100, 60)}, prefilter={"guest": (0.001, 2)})
+
+    results = [await limiter.hit("guest", "6.6.6.6") for _ in range(4)]
+    assert [r[0] for r in results] == [True, True, False, False]
+    assert len(redis.calls) == 2
+    assert limiter.stats()["policies"]["guest"]["prefiltered"] == 2
+
+
+def test_token_buckets_refill_and_bounded_memory():
+    buckets = TokenBuckets(rate=1, capacity=2, max_keys=3)
+    assert buckets.take("a", now=0)[0] and buckets.take("a", now=0)[0]
+    assert buckets.take("a", now=0) == (False, 0, 1.0)
+    assert buckets.take("a", now=1.5)[0]  # пополнилось за 1.5 с
+
+    for key in "bcd":
+        buckets.take(key, now=2)
+    assert len(buckets) == 3 and buckets.evictions == 1
+    assert buckets.level("a", now=2) == 2  # "a" вытеснен как самый давний — снова полный bucket
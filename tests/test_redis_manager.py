@@ -0,0 +1,121 @@
+# tests/test_redis_manager.py
+"""
+Unit Tests for the background Redis health manager (backend/redis_manager.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_redis_manager.py
+"""
+
+import asyncio
+
+import pytest
+from backend.caching import VerdictCache
+from backend.jobs import RedisJobStore
+from backend.passwords import LoginThrottle
+from backend.redis_manager import RedisManager
+from backend.write_behind import WriteBehindBuffer
+
+
+class FlakyRedis:
+    """Замена redis.asyncio.Redis: PING проходит, пока up=True."""
+
+    def __init__(self, up=True):
+        self.up = up
+        self.pings = 0
+        self.closed = False
+
+    async def ping(self):
+        self.pings += 1
+        if not self.up:
+            raise ConnectionError("Connection refused")
+        return True
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_get_hands_out_client_without_ping():
+    client = FlakyRedis()
+    manager = RedisManager(client=client, health_interval=60)
+    assert await manager.start()
+    try:
+        pings = client.pings
+        assert all(manager.get() is client for _ in range(100))
+        assert client.pings == pings  # на пути запроса сетевых вызовов нет
+    finally:
+        await manager.close()
+    assert client.closed and manager.get() is None
+
+
+@pytest.mark.asyncio
+async def test_background_check_tracks_outage_and_recovery():
+    client = FlakyRedis(up=False)
+    manager = RedisManager(client=client, health_interval=0.01)
+    assert not await manager.start()  # Redis лежит при старте — приложение все равно стартует
+    try:
+        assert manager.get() is None
+        client.up = True
+        await asyncio.sleep(0.05)
+        assert manager.get() is client
+        client.up = False
+        await asyncio.sleep(0.05)
+        assert manager.get() is None
+    finally:
+        await manager.close()
+
+    stats = manager.stats()
+    assert stats["recoveries"] == 1 and stats["outages"] == 1
+    assert "Connection refused" in stats["last_error"]
+
+
+@pytest.mark.asyncio
+async def test_not_configured_without_url():
+    manager = RedisManager()
+    assert not await manager.start()
+    assert not manager.configured and manager.get() is None
+    await manager.close()
+
+
+class RecordingRedis(FlakyRedis):
+    """Любая команда, кроме PING, записывается в calls (PING проходит, пока up=True)."""
+
+    def __init__(self, up=True):
+        super().__init__(up)
+        self.calls = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.calls.append(name)
+            raise AssertionError(f"Redis вызван при недоступном Redis: {name}")
+        return command
+
+
+@pytest.mark.asyncio
+async def test_components_skip_redis_while_unavailable():
+    client = RecordingRedis(up=False)
+    manager = RedisManager(client=client, health_interval=60)
+    assert not await manager.start()
+    try:
+        cache = VerdictCache(redis_client=client, is_available=manager.is_available)
+        assert await cache.get("abc") == (None, None)
+        await cache.set("abc", {"verdict": "real"})
+        assert await cache.get("abc") == ({"verdict": "real"}, "memory")
+
+        throttle = LoginThrottle(redis_client=client, limit=1, is_available=manager.is_available)
+        assert await throttle.allow("10.0.0.1")
+        assert not await throttle.allow("10.0.0.1")  # локальный счетчик
+
+        writer = WriteBehindBuffer(object(), redis_client=client, is_available=manager.is_available)
+        await writer.save_vote(user_id=1, analysis_id=2, vote=1)
+        assert writer.stats()["pending"] == 1 and writer.stats()["journal_errors"] == 0
+
+        store = RedisJobStore(client, is_available=manager.is_available)
+        with pytest.raises(ConnectionError):
+            await store.get("job-1")
+    finally:
+        await manager.close()
+
+    assert client.calls == []
+    assert cache.stats()["redis"]["enabled"] is False
@@ -0,0 +1,219 @@
+# tests/test_search_api.py
+"""
+Unit Tests for the WebSearcher async API (backend/search_api.py)
+
+Providers are pointed at local stub HTTP servers, so no API keys
+or network access are needed.
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_search_api.py
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from backend.search_api import WebSearcher
+
+
+def serpapi_payload(title: str) -> dict:
+    return {"organic_results": [
+        {"title": title, "link": "https://www.reuters.com/article", "snippet": "Snippet text", "source": "Reuters"},
+        {"title": "Other", "link": "https://example.com/x", "snippet": "More", "source": "example"},
+    ]}
+
+
+class StubServer:
+    """Локальный HTTP-сервер, отвечающий заданным JSON с задержкой."""
+
+    def __init__(self, payload: dict, delay: float = 0.0, status: int = 200):
+        self.payload = payload
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.payload).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/search"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serp_env(monkeypatch):
+    monkeypatch.setenv("SERP_API_KEY", "test-key")
+    for var in ("BING_API_KEY", "GOOGLE_API_KEY", "GOOGLE_CX"):
+        monkeypatch.delenv(var, raising=False)
+
+
+@pytest.mark.asyncio
+async def test_asearch_parses_serpapi_and_prioritizes_trusted(serp_env):
+    server = StubServer(serpapi_payload("Reuters Fact Check"))
+    searcher = WebSearcher(endpoints={"serpapi": server.url})
+    try:
+        results = await searcher.asearch("claim", "en", max_results=5)
+    finally:
+        await searcher.aclose()
+        server.close()
+
+    assert [r["title"] for r in results] == ["Reuters Fact Check", "Other"]
+    assert results[0]["url"] == "https://www.reuters.com/article"
+
+
+@pytest.mark.asyncio
+async def test_asearch_runs_concurrently_on_one_pooled_client(serp_env):
+    server = StubServer(serpapi_payload("Slow"), delay=0.5)
+    searcher = WebSearcher(endpoints={"serpapi": server.url})
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[searcher.asearch(f"claim {i}", "en") for i in range(8)])
+        elapsed = time.perf_counter() - started
+        client = searcher._async_client
+    finally:
+        await searcher.aclose()
+        server.close()
+
+    assert all(results)
+    assert server.requests == 8
+    assert client is not None
+    # 8 последовательных запросов заняли бы >= 4s
+    assert elapsed < 2.0
+
+
+@pytest.mark.asyncio
+async def test_asearch_returns_empty_list_on_http_error(serp_env):
+    server = StubServer({}, status=500)
+    searcher = WebSearcher(endpoints={"serpapi": server.url})
+    try:
+        assert await searcher.asearch("claim", "en") == []
+    finally:
+        await searcher.aclose()
+        server.close()
+
+
+def bing_payload(title: str) -> dict:
+    return {"webPages": {"value": [
+        {"name": title, "url": "https://apnews.com/article", "snippet": "Bing snippet", "displayUrl": "apnews.com"},
+    ]}}
+
+
+@pytest.fixture
+def two_providers_env(monkeypatch):
+    monkeypatch.setenv("SERP_API_KEY", "test-key")
+    monkeypatch.setenv("BING_API_KEY", "test-key")
+    for var in ("GOOGLE_API_KEY", "GOOGLE_CX"):
+        monkeypatch.delenv(var, raising=False)
+
+
+@pytest.mark.asyncio
+async def test_hedged_search_uses_backup_when_primary_is_slow(two_providers_env):
+    slow_serp = StubServer(serpapi_payload("Slow SerpAPI"), delay=0.8)
+    fast_bing = StubServer(bing_payload("Fast Bing"))
+    searcher = WebSearcher(
+        endpoints={"serpapi": slow_serp.url, "bing": fast_bing.url},
+        hedge=True, hedge_delay_ms=100
+    )
+    try:
+        started = time.perf_counter()
+        results = await searcher.asearch("claim", "en")
+        elapsed = time.perf_counter() - started
+    finally:
+        await searcher.aclose()
+        slow_serp.close()
+        fast_bing.close()
+
+    assert results[0]["title"] == "Fast Bing"
+    assert elapsed < 0.6
+    assert searcher.hedges_fired == 1
+    assert searcher.wins == {"serpapi": 0, "bing": 1}
+
+
+@pytest.mark.asyncio
+async def test_hedged_search_does_not_fire_when_primary_is_fast(two_providers_env):
+    serp = StubServer(serpapi_payload("Fast SerpAPI"))
+    bing = StubServer(bing_payload("Bing"))
+    searcher = WebSearcher(endpoints={"serpapi": serp.url, "bing": bing.url}, hedge=True, hedge_delay_ms=1000)
+    try:
+        results = await searcher.asearch("claim", "en")
+    finally:
+        await searcher.aclose()
+        serp.close()
+        bing.close()
+
+    assert results[0]["title"] == "Fast SerpAPI"
+    assert bing.requests == 0
+    assert searcher.latency["serpapi"].observations == 1
+
+
+@pytest.mark.asyncio
+async def test_hedged_search_moves_on_immediately_after_empty_result(two_providers_env):
+    empty_serp = StubServer({"organic_results": []})
+    bing = StubServer(bing_payload("Bing"))
+    searcher = WebSearcher(endpoints={"serpapi": empty_serp.url, "bing": bing.url}, hedge=True, hedge_delay_ms=3000)
+    try:
+        started = time.perf_counter()
+        results = await searcher.asearch("claim", "en")
+        elapsed = time.perf_counter() - started
+    finally:
+        await searcher.aclose()
+        empty_serp.close()
+        bing.close()
+
+    assert results[0]["title"] == "Bing"
+    assert elapsed < 1.0
+    assert searcher.hedges_fired == 0
+
+
+def test_hedge_delay_adapts_to_latency_histogram(two_providers_env):
+    searcher = WebSearcher(hedge=True, hedge_delay_ms=800)
+    assert searcher.hedge_delay("serpapi") == pytest.approx(0.8)
+
+    for _ in range(100):
+        searcher.latency["serpapi"].observe(180)
+    assert searcher.hedge_delay("serpapi") == pytest.approx(0.2)
+
+
+@pytest.mark.asyncio
+async def test_hedged_search_failure_of_every_provider_is_not_cached(two_providers_env):
+    from backend.search_cache import SearchCache
+
+    serp = StubServer({}, status=500)
+    bing = StubServer({}, status=503)
+    cache = SearchCache(redis_client=None)
+    searcher = WebSearcher(endpoints={"serpapi": serp.url, "bing": bing.url}, hedge=True, hedge_delay_ms=50, cache=cache)
+    try:
+        assert await searcher._hedged_search("claim", "en", 5) == (None, None)
+        assert await searcher.asearch("claim", "en") == []
+
+        # Провайдеры поднялись — следующий запрос не получает закэшированное "ничего не найдено"
+        serp.status = bing.status = 200
+        serp.payload = serpapi_payload("Recovered")
+        results = await searcher.asearch("claim", "en")
+    finally:
+        await searcher.aclose()
+        serp.close()
+        bing.close()
+
+    assert results[0]["title"] == "Recovered"
+    assert cache.counters["misses"] == 2
@@ -0,0 +1,67 @@
+# tests/test_search_cache.py
+"""
+Unit Tests for the search result cache (backend/search_cache.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_search_cache.py
+"""
+
+import asyncio
+import pytest
+from backend.search_cache import SearchCache
+
+KEY = ("serpapi", "some claim", "en", 3)
+
+
+class CountingFetch:
+    """Имитация провайдера поиска, считающая вызовы."""
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.results
+
+
+@pytest.mark.asyncio
+async def test_fresh_entry_is_served_without_fetch():
+    cache = SearchCache(ttl=60)
+    fetch = CountingFetch([{"title": "A"}])
+
+    assert await cache.get_or_fetch(KEY, fetch) == [{"title": "A"}]
+    assert await cache.get_or_fetch(KEY, fetch) == [{"title": "A"}]
+    assert fetch.calls == 1
+    assert cache.stats()["fresh_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_refreshed_in_background():
+    cache = SearchCache(ttl=0, stale_ttl=60)
+    await cache.get_or_fetch(KEY, CountingFetch([{"title": "old"}]))
+
+    refresh = CountingFetch([{"title": "new"}])
+    assert await cache.get_or_fetch(KEY, refresh) == [{"title": "old"}]
+    await asyncio.sleep(0.01)  # даем фоновой задаче завершиться
+
+    assert refresh.calls == 1
+    assert cache.stats()["stale_hits"] == 1
+    assert (await cache._read(cache.make_key(KEY)))["results"] == [{"title": "new"}]
+
+
+@pytest.mark.asyncio
+async def test_negative_results_use_shorter_ttl_and_errors_are_not_cached():
+    cache = SearchCache(ttl=60, negative_ttl=0, stale_ttl=60)
+    empty = CountingFetch([])
+    await cache.get_or_fetch(KEY, empty)
+    await cache.get_or_fetch(KEY, empty)
+    assert cache.stats()["stale_hits"] == 1  # пустой ответ сразу считается устаревшим
+
+    failing = CountingFetch(None)
+    other_key = ("serpapi", "other claim", "en", 3)
+    assert await cache.get_or_fetch(other_key, failing) is None
+    assert await cache.get_or_fetch(other_key, failing) is None
+    assert failing.calls == 2
@@ -0,0 +1,56 @@
+# tests/test_shared_weights.py
+"""
+Unit Tests for memory-mapped model weights shared between workers (backend/shared_weights.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_shared_weights.py
+"""
+
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from backend import shared_weights  # noqa: E402
+from backend.shared_weights import is_stale, load_model, weights_path_for  # noqa: E402
+
+
+@pytest.fixture
+def tiny_model_dir(tmp_path):
+    config = transformers.XLMRobertaConfig(
+        vocab_size=64, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=32, max_position_embeddings=40, num_labels=2,
+    )
+    model_dir = tmp_path / "truthlens_xx_model"
+    transformers.AutoModelForSequenceClassification.from_config(config).save_pretrained(model_dir)
+    return str(model_dir)
+
+
+@pytest.mark.skipif(not shared_weights.MMAP_SUPPORTED, reason="torch.load(mmap=...) требует torch >= 2.1")
+def test_mmap_model_matches_copy_and_reuses_cache(tiny_model_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_weights, "weights_path_for",
+                        lambda model_id: os.path.join(str(tmp_path / "mmap"), "tiny.pt"))
+    inputs = {"input_ids": torch.tensor([[0, 5, 9, 2]]), "attention_mask": torch.ones(1, 4, dtype=torch.long)}
+
+    copy = load_model(tiny_model_dir, mode="copy").eval()
+    mapped = load_model(tiny_model_dir, mode="mmap").eval()
+    with torch.no_grad():
+        assert torch.allclose(copy(**inputs).logits, mapped(**inputs).logits)
+
+    cache = os.path.join(str(tmp_path / "mmap"), "tiny.pt")
+    mtime = os.path.getmtime(cache)
+    load_model(tiny_model_dir, mode="mmap")
+    assert os.path.getmtime(cache) == mtime  # второй воркер не пересоздает файл
+
+
+def test_cache_is_stale_when_local_model_is_newer(tiny_model_dir, tmp_path):
+    cache = weights_path_for(tiny_model_dir, cache_dir=str(tmp_path))
+    assert cache.endswith("truthlens_xx_model.pt") and is_stale(tiny_model_dir, cache)
+    open(cache, "wb").close()
+    os.utime(cache, (1, 1))
+    assert is_stale(tiny_model_dir, cache)
+    os.utime(cache, None)
+    assert not is_stale(tiny_model_dir, cache)
@@ -0,0 +1,65 @@
+# tests/test_singleflight.py
+"""
+Unit Tests for request coalescing (backend/singleflight.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_singleflight.py
+"""
+
+import asyncio
+import pytest
+from backend.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def slow_analysis():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"verdict": "real"}
+
+    results = await asyncio.gather(*[flight.do("analyze:abc", slow_analysis) for _ in range(10)])
+
+    assert calls == 1
+    assert all(result == {"verdict": "real"} for result, _ in results)
+    assert sum(1 for _, shared in results if shared) == 9
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_all_waiters_and_are_not_cached():
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("gemini down")
+
+    results = await asyncio.gather(*[flight.do("k", failing) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def ok():
+        return 42
+
+    assert await flight.do("k", ok) == (42, False)
+
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_does_not_cancel_shared_work():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == ("done", True)
@@ -0,0 +1,39 @@
+# tests/test_utils.py
+"""
+Unit Tests for helper functions (backend/utils.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_utils.py
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+from backend.utils import decode_history_cursor, encode_history_cursor, normalize_url, trusted_client_ip
+
+
+def test_history_cursor_round_trip_keeps_microseconds_and_timezone():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    cursor = encode_history_cursor(created_at, 42)
+    assert "=" not in cursor and "/" not in cursor  # безопасно в query string
+    assert decode_history_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "aGVsbG8"])
+def test_broken_history_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_history_cursor(cursor)
+
+
+def test_normalize_url_drops_tracking_and_fragment():
+    assert normalize_url("HTTPS://Example.com/a/?utm_source=x&b=2&a=1#top") == "https://example.com/a?a=1&b=2"
+
+
+def test_trusted_client_ip_ignores_client_supplied_forwarded_entries():
+    # Без доверенных прокси заголовок игнорируется — перебор значений не обходит лимит
+    assert trusted_client_ip("1.1.1.1", "10.0.0.5") == "10.0.0.5"
+    # Один прокси (Heroku/nginx) дописывает реальный адрес в конец
+    assert trusted_client_ip("6.6.6.6, 203.0.113.7", "10.0.0.5", trusted_hops=1) == "203.0.113.7"
+    assert trusted_client_ip("6.6.6.6, 203.0.113.7, 10.1.1.1", "10.0.0.5", trusted_hops=2) == "203.0.113.7"
+    assert trusted_client_ip(None, None, trusted_hops=1) == "unknown"
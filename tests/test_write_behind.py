@@ -0,0 +1,223 @@
+# tests/test_write_behind.py
+"""
+Unit Tests for the write-behind persistence buffer (backend/write_behind.py)
+
+To run these tests:
+1. Make sure you are in the project root directory.
+2. Run the command: pytest -v tests/test_write_behind.py
+"""
+
+import asyncio
+import fnmatch
+
+import pytest
+from backend.write_behind import WriteBehindBuffer
+
+
+class InMemoryRedis:
+    """Минимальная замена redis.asyncio.Redis (строки и HASH, нужные журналу)."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def exists(self, key):
+        return int(key in self.store)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        bucket = self.store.setdefault(key, {})
+        if field is not None:
+            bucket[field] = value
+        bucket.update(mapping or {})
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.store.get(key, {}).pop(field, None)
+        if key in self.store and not self.store[key]:
+            del self.store[key]
+
+    async def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+    async def rename(self, src, dst):
+        if src not in self.store:
+            raise KeyError(src)
+        self.store[dst] = self.store.pop(src)
+
+    async def scan_iter(self, match):
+        for key in list(self.store):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+    def pipeline(self):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def hset(self, *args, **kwargs):
+                self.calls.append(redis.hset(*args, **kwargs))
+
+            def delete(self, *keys):
+                self.calls.append(redis.delete(*keys))
+
+            async def execute(self):
+                return [await call for call in self.calls]
+
+        return Pipeline()
+
+
+class RecordingSink:
+    """AsyncDatabase без PostgreSQL: запоминает пакеты."""
+
+    def __init__(self, fail_votes_for=(), known_analyses=None):
+        self.next_id = 100
+        self.reserve_calls = 0
+        self.analyses, self.votes, self.statuses, self.batches = [], [], [], []
+        self.fail_votes_for = set(fail_votes_for)
+        # None — любой analysis_id считается записанным (как без проверки EXISTS)
+        self.known_analyses = known_analyses
+
+    async def reserve_analysis_ids(self, count):
+        self.reserve_calls += 1
+        ids = list(range(self.next_id, self.next_id + count))
+        self.next_id += count
+        return ids
+
+    async def save_analyses_with_ids(self, rows):
+        self.batches.append(("analysis", len(rows)))
+        self.analyses.extend(rows)
+        if self.known_analyses is not None:
+            self.known_analyses.update(row[0] for row in rows)
+
+    async def save_votes_batch(self, rows):
+        if any(analysis_id in self.fail_votes_for for _, analysis_id, _ in rows):
+            raise RuntimeError("foreign key violation")
+        self.batches.append(("vote", len(rows)))
+        written = [r for r in rows if self.known_analyses is None or r[1] in self.known_analyses]
+        self.votes.extend(written)
+        return [(user_id, analysis_id) for user_id, analysis_id, vote in rows if (user_id, analysis_id, vote) not in written]
+
+    async def update_telegram_statuses_batch(self, rows):
+        self.batches.append(("telegram_status", len(rows)))
+        self.statuses.extend(rows)
+
+
+@pytest.mark.asyncio
+async def test_writes_are_batched_and_ids_returned_immediately():
+    sink = RecordingSink()
+    redis = InMemoryRedis()
+    writer = WriteBehindBuffer(sink, redis_client=redis, flush_interval_ms=20, id_block=10)
+    await writer.start()
+    try:
+        ids = await asyncio.gather(*[
+            writer.save_analysis(user_id=1, text=f"t{i}", verdict="true", confidence=0.9, full_response={"i": i})
+            for i in range(5)
+        ])
+        await writer.save_vote(user_id=1, analysis_id=ids[0], vote=1)
+        await writer.save_vote(user_id=1, analysis_id=ids[0], vote=-1)  # последний голос побеждает
+        await writer.update_telegram_message_status(7, "analyzed", ids[1])
+        assert sink.analyses == []  # еще не записано
+        await asyncio.sleep(0.1)
+    finally:
+        await writer.stop()
+
+    assert sorted(ids) == list(range(100, 105)) and sink.reserve_calls == 1
+    assert [row[0] for row in sink.analyses] == ids
+    assert sink.votes == [(1, ids[0], -1)]
+    assert sink.statuses == [(7, "analyzed", ids[1])]
+    assert sink.batches == [("analysis", 5), ("vote", 1), ("telegram_status", 1)]
+    assert writer.journal_key not in redis.store  # журнал очищен после записи
+
+
+@pytest.mark.asyncio
+async def test_failing_row_is_isolated_and_dropped_after_max_attempts():
+    sink = RecordingSink(fail_votes_for={999})
+    writer = WriteBehindBuffer(sink, flush_interval_ms=10, max_attempts=2)
+    await writer.start()
+    try:
+        await writer.save_vote(user_id=1, analysis_id=5, vote=1)
+        await writer.save_vote(user_id=1, analysis_id=999, vote=1)
+        await asyncio.sleep(0.1)
+    finally:
+        await writer.stop()
+
+    assert sink.votes == [(1, 5, 1)]
+    stats = writer.stats()
+    assert stats["dropped"] == 1 and stats["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_journal_of_crashed_process_is_recovered():
+    redis = InMemoryRedis()
+    crashed = WriteBehindBuffer(RecordingSink(), redis_client=redis)
+    crashed._id_lock = asyncio.Lock()
+    await crashed.save_analysis(user_id=1, text="t", verdict="false", confidence=0.2, full_response={})
+    await crashed.save_vote(user_id=1, analysis_id=100, vote=1)
+    # процесс упал: в БД ничего не записано, heartbeat не ставился
+
+    sink = RecordingSink()
+    survivor = WriteBehindBuffer(sink, redis_client=redis, flush_interval_ms=10)
+    await survivor.start()
+    try:
+        await asyncio.sleep(0.1)
+    finally:
+        await survivor.stop()
+
+    assert survivor.stats()["recovered"] == 2
+    assert [row[0] for row in sink.analyses] == [100]
+    assert sink.votes == [(1, 100, 1)]
+    assert not any(key.startswith("writebehind:journal:") for key in redis.store)
+
+
+@pytest.mark.asyncio
+async def test_vote_waits_for_analysis_flushed_by_another_worker():
+    # Два воркера пишут в одну БД: анализ у первого, голос пришел во второй
+    known = set()
+    redis = InMemoryRedis()
+    owner = WriteBehindBuffer(RecordingSink(known_analyses=known), redis_client=redis)
+    owner._id_lock = asyncio.Lock()
+    owner._flush_lock = asyncio.Lock()
+    analysis_id = await owner.save_analysis(user_id=1, text="t", verdict="true", confidence=0.9, full_response={})
+
+    voter_sink = RecordingSink(known_analyses=known)
+    voter = WriteBehindBuffer(voter_sink, redis_client=redis, flush_interval_ms=10)
+    voter._flush_lock = asyncio.Lock()
+    await voter.save_vote(user_id=2, analysis_id=analysis_id, vote=1)
+    await voter.flush()  # строки анализа еще нет — голос не теряется
+
+    assert voter_sink.votes == []
+    assert voter.stats()["pending"] == 1
+    assert len(redis.store[voter.journal_key]) == 1
+
+    await owner.flush()
+    await voter.flush()
+
+    assert voter_sink.votes == [(2, analysis_id, 1)]
+    assert voter.stats()["pending"] == 0
+    assert voter.journal_key not in redis.store
+
+
+@pytest.mark.asyncio
+async def test_vote_without_analysis_is_dropped_after_wait():
+    redis = InMemoryRedis()
+    sink = RecordingSink(known_analyses=set())
+    writer = WriteBehindBuffer(sink, redis_client=redis, flush_interval_ms=10, vote_wait_seconds=0.05)
+    await writer.start()
+    try:
+        await writer.save_vote(user_id=1, analysis_id=777, vote=-1)
+        await asyncio.sleep(0.2)
+    finally:
+        await writer.stop()
+
+    assert sink.votes == []
+    stats = writer.stats()
+    assert stats["orphan_votes"] == 1 and stats["pending"] == 0
+    assert writer.journal_key not in redis.store